@@ -5,10 +5,18 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, date
 import os
-import calendar
-import shutil
+import threading
 from persistent_storage import PersistentStorageManager
-from database_manager import DatabaseManager
+from database_manager import CUSTOMER_STATUSES, create_database_manager, natural_key_matches
+from metrics_store import MonthlyMetricsStore
+from customer_journal import CUSTOMER_COLUMNS, CustomerJournal, JournalConflictError
+from columnar_storage import create_customer_store
+from snapshot_store import SnapshotStore
+from storage_manifest import StorageManifest, content_hash, file_signature
+from replication_queue import ReplicationQueue
+from atomic_io import atomic_write
+from metrics_cache import MetricsCache, make_cache_key
+from customer_metrics import MetricsCalculator
 
 # Configuração da página
 st.set_page_config(
@@ -22,51 +30,134 @@ st.set_page_config(
 class DataManager:
     def __init__(self):
         self.customers_file = "customers_simple.csv"
+        # Backups CSV completos de versões anteriores (lidos apenas na recuperação)
         self.backup_files = [
             "customers_permanent_backup.csv",
             "customers_recovery_backup.csv", 
             "customers_master_backup.csv"
         ]
-        self.persistent_storage = PersistentStorageManager()
-        self.database_manager = DatabaseManager()
+        # Manifesto (linhas, hash, horário, versão) de cada destino: status e recuperação sem ler os dados
+        self.manifest = StorageManifest()
+        self.persistent_storage = PersistentStorageManager(manifest=self.manifest)
+        self.database_manager = create_database_manager()
+        self.metrics_store = MonthlyMetricsStore()
+        self.snapshots = SnapshotStore()
+        # Motivo da última escrita recusada (exibido pela interface)
+        self.last_error = None
+        # Snapshot colunar (Arrow) quando disponível; o CSV fica como formato de importação/exportação
+        self.snapshot_store = create_customer_store(self.customers_file)
         self._ensure_permanent_storage()
         self._ensure_file_exists()
+        self.journal = CustomerJournal(snapshot_store=self.snapshot_store)
+        # Escritas confirmadas no primário (journal ou banco local); os demais destinos em segundo plano
+        self._write_lock = threading.RLock()
+        self.replication = ReplicationQueue(self._replication_state, self._replication_targets())
+        if self.database_manager.supports_point_writes:
+            self._open_local_database()
+        elif self.journal.pending_count() > 0 or self._database_behind_snapshot():
+            # Escritas que o PostgreSQL ainda não recebeu (processo anterior encerrado antes da replicação)
+            self.replication.submit(max(1, self.journal.pending_count()))
+    
+    def _open_local_database(self):
+        """Banco local (SQLite) é a fonte da verdade; os dados antigos são importados só na primeira abertura"""
+        if self.manifest.get('local_database_import') is None:
+            df = self.database_manager.load_customers()
+            if df.empty:
+                # Primeira abertura: snapshot + journal locais ou, sem eles, o sistema externo
+                df = self.journal.load() if self.snapshot_store.exists() else df
+                if df.empty:
+                    df = self.persistent_storage.load_data()
+                if not df.empty:
+                    self.database_manager.bulk_load_customers(df)
+                    print(f"🔄 {len(df)} clientes importados para o banco local")
+            # Marca a importação: a partir daqui uma tabela vazia significa "sem clientes"
+            self.manifest.record('local_database_import', df)
+        
+        if self.journal.pending_count() > 0:
+            # Operações gravadas no journal antes do banco local: entram no banco e o journal é compactado
+            df = self.journal.load()
+            self.database_manager.save_customers(df)
+            self.compact_journal(df)
     
     def _ensure_permanent_storage(self):
-        """Sistema de recuperação automática de dados permanentes"""
+        """Recupera o snapshot local (primário do journal) apenas se ele estiver ausente ou ilegível"""
+        target = self._local_snapshot_target()
         try:
-            # Verificar se existe backup permanente
-            for backup_file in self.backup_files:
-                if os.path.exists(backup_file):
-                    # Recuperar dados do backup mais recente
-                    backup_df = pd.read_csv(backup_file)
-                    if not backup_df.empty:
-                        # Restaurar arquivo principal se não existir ou estiver vazio
-                        if not os.path.exists(self.customers_file):
-                            backup_df.to_csv(self.customers_file, index=False)
-                            print(f"🔄 Dados recuperados de {backup_file}")
-                        else:
-                            # Verificar se arquivo principal tem menos dados que backup
-                            main_df = pd.read_csv(self.customers_file)
-                            if len(main_df) < len(backup_df):
-                                backup_df.to_csv(self.customers_file, index=False)
-                                print(f"🔄 Dados atualizados de {backup_file}")
-                        break
+            if self.snapshot_store.exists():
+                # Assinatura igual à do manifesto: arquivo intacto desde a última gravação, nada a ler
+                if self.manifest.get(target) is not None:
+                    return
+                try:
+                    # Gravado fora do manifesto (versão anterior, cópia manual): basta ser legível;
+                    # o manifesto só é atualizado pela próxima compactação
+                    missing = set(CUSTOMER_COLUMNS) - set(self.snapshot_store.load().columns)
+                    if not missing:
+                        return
+                    raise ValueError(f"colunas ausentes: {', '.join(sorted(missing))}")
+                except Exception as e:
+                    print(f"⚠️ {self.snapshot_store.path} ilegível ({e}) - recuperando do backup")
+            
+            # Snapshot mais recente pelo índice; sem snapshots, os backups CSV de versões anteriores
+            if self.snapshots.latest() is not None:
+                backup_df, backup_source = self.snapshots.restore(), "snapshot mais recente"
+            else:
+                backup_file = next((path for path in self.backup_files if os.path.exists(path)), None)
+                if backup_file is None:
+                    return
+                backup_df, backup_source = pd.read_csv(backup_file), backup_file
+            if backup_df is None or backup_df.empty:
+                return
+            
+            recorded = self.manifest.targets.get(target)
+            if recorded is not None and recorded['hash'] != content_hash(backup_df):
+                print(f"⚠️ {backup_source} difere do último estado registrado de {self.snapshot_store.path} "
+                      f"({recorded['rows']} clientes em {recorded['updated_at']})")
+            self.snapshot_store.save(backup_df)
+            self.manifest.record(target, backup_df, self.snapshot_store.path)
+            print(f"🔄 {self.snapshot_store.path} recuperado de {backup_source} ({len(backup_df)} clientes)")
         except Exception as e:
             print(f"⚠️ Erro na recuperação automática: {e}")
     
-    def _create_permanent_backups(self, df):
-        """Cria backups permanentes em múltiplos arquivos"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        for backup_file in self.backup_files:
-            try:
-                df.to_csv(backup_file, index=False)
-                # Criar backup com timestamp também
-                timestamped_backup = f"backup_{timestamp}_{backup_file}"
-                df.to_csv(timestamped_backup, index=False)
-            except Exception as e:
-                print(f"⚠️ Erro ao criar backup {backup_file}: {e}")
+    def _replication_targets(self):
+        """Destinos secundários atualizados pela fila de replicação"""
+        targets = {}
+        if not self.database_manager.supports_point_writes and self.database_manager.is_connected():
+            # PostgreSQL: o primário é o journal local; com escritas pontuais o próprio banco é o primário.
+            # Sem conexão na inicialização (modo CSV local) o banco fica fora da fila, que senão nunca esvaziaria
+            targets['Banco de dados'] = self._replicate_to_database
+        targets['Sistema externo'] = lambda df: self.persistent_storage.save_data(df, permanent_only=True)
+        targets['Snapshots'] = lambda df: self.snapshots.save(df) is not None
+        return targets
+    
+    def _replicate_to_database(self, df):
+        if not self.database_manager.is_connected() or not self.database_manager.save_customers(df):
+            return False
+        self.manifest.record('database', df)
+        return True
+    
+    def _local_snapshot_target(self):
+        # Sem pyarrow o snapshot local é o próprio CSV principal
+        return 'customers_file' if self.snapshot_store.path == self.customers_file else 'local_snapshot'
+    
+    def _database_behind_snapshot(self):
+        """Snapshot local compactado depois da última replicação bem-sucedida para o banco (pelo manifesto)"""
+        local, database = self.manifest.get(self._local_snapshot_target()), self.manifest.get('database')
+        if local is None or database is None:
+            return False
+        return local['hash'] != database['hash'] and local['updated_at'] > database['updated_at']
+    
+    def _replication_state(self):
+        """Estado atual do primário, lido pela thread de replicação"""
+        with self._write_lock:
+            if self.database_manager.supports_point_writes:
+                df = self.database_manager.load_customers()
+            else:
+                df = self.journal.load()
+        return self._process_loaded_data(df)
+    
+    def save_customers_file(self, df):
+        """Grava o CSV principal de forma atômica (temporário + fsync + rename + fsync do diretório)"""
+        atomic_write(self.customers_file, lambda temp_file: df.to_csv(temp_file, index=False))
     
     def _ensure_file_exists(self):
         """Garante que o arquivo CSV existe com estrutura correta"""
@@ -75,31 +166,39 @@ class DataManager:
                 customers_df = pd.DataFrame(columns=[
                     'name', 'signup_date', 'plan_value', 'status', 'cancel_date'
                 ])
-                customers_df.to_csv(self.customers_file, index=False)
+                self.save_customers_file(customers_df)
             else:
-                # Verificar se arquivo tem estrutura correta
-                df = pd.read_csv(self.customers_file)
+                # Verificar se arquivo tem estrutura correta (só o cabeçalho)
+                df = pd.read_csv(self.customers_file, nrows=0)
                 expected_columns = ['name', 'signup_date', 'plan_value', 'status', 'cancel_date']
                 if not all(col in df.columns for col in expected_columns):
                     # Recriar arquivo com estrutura correta
                     customers_df = pd.DataFrame(columns=expected_columns)
-                    customers_df.to_csv(self.customers_file, index=False)
+                    self.save_customers_file(customers_df)
         except Exception as e:
             # Em caso de erro, criar arquivo novo
             customers_df = pd.DataFrame(columns=[
                 'name', 'signup_date', 'plan_value', 'status', 'cancel_date'
             ])
-            customers_df.to_csv(self.customers_file, index=False)
+            self.save_customers_file(customers_df)
     
     def load_customers(self):
-        """Carrega dados de clientes com prioridade: Banco → Sistema externo → CSV local"""
+        """Carrega dados de clientes com prioridade: Journal pendente → Banco → Sistema externo → CSV local"""
         try:
+            # Banco local com escritas pontuais: é a fonte da verdade, mesmo vazio
+            if self.database_manager.supports_point_writes:
+                return self._process_loaded_data(self.database_manager.load_customers())
+            
+            # 0. Com operações pendentes no journal (ou ainda não replicadas), snapshot + journal é a versão mais recente
+            if self.journal.pending_count() > 0 or not self._database_is_current():
+                return self._process_loaded_data(self.journal.load())
+            
             # 1. Tentar carregar do banco de dados primeiro (mais confiável)
             if self.database_manager.is_connected():
                 df = self.database_manager.load_customers()
                 if not df.empty:
                     df = self._process_loaded_data(df)
-                    print("✅ Dados carregados do banco PostgreSQL")
+                    print("✅ Dados carregados do banco de dados")
                     return df
             
             # 2. Tentar carregar do sistema de persistência externa
@@ -110,14 +209,14 @@ class DataManager:
                 # Sincronizar com banco de dados se disponível
                 if self.database_manager.is_connected():
                     self.database_manager.save_customers(df)
-                    print("🔄 Dados sincronizados com banco PostgreSQL")
+                    print("🔄 Dados sincronizados com banco de dados")
                 
                 print("✅ Dados carregados de: " + self.persistent_storage.last_successful_method)
                 return df
             
-            # 3. Se não conseguir carregar do sistema externo, tentar CSV local
-            if os.path.exists(self.customers_file):
-                df = pd.read_csv(self.customers_file)
+            # 3. Se não conseguir carregar do sistema externo, tentar snapshot local
+            if self.snapshot_store.exists():
+                df = self.journal.load()
                 if not df.empty:
                     df = self._process_loaded_data(df)
                     
@@ -125,9 +224,9 @@ class DataManager:
                     self.persistent_storage.save_data(df)
                     if self.database_manager.is_connected():
                         self.database_manager.save_customers(df)
-                        print("🔄 Dados migrados para banco PostgreSQL")
+                        print("🔄 Dados migrados para banco de dados")
                     
-                    print(f"🔄 Dados atualizados de {self.customers_file}")
+                    print(f"🔄 Dados atualizados de {self.snapshot_store.path}")
                     return df
             
             # Se nenhum dado existir, criar estrutura vazia
@@ -149,7 +248,7 @@ class DataManager:
         return df
     
     def add_customer(self, name, signup_date, plan_value, status, cancel_date=None):
-        """Adiciona cliente com validações e salvamento ultra-robusto"""
+        """Adiciona cliente com validações; grava apenas uma entrada no journal"""
         try:
             # Validações de entrada
             if not name or not name.strip():
@@ -161,10 +260,7 @@ class DataManager:
             if status not in ['Ativo', 'Cancelado']:
                 return False
             
-            # Carregar dados existentes
-            df = self.load_customers()
-            original_length = len(df)
-            
+            self.last_error = None
             # Preparar novo cliente
             new_customer_data = {
                 'name': str(name).strip(),
@@ -174,445 +270,316 @@ class DataManager:
                 'cancel_date': pd.to_datetime(cancel_date).strftime('%Y-%m-%d') if cancel_date else None
             }
             
-            # Criar DataFrame para novo cliente
-            new_customer = pd.DataFrame([new_customer_data])
-            
-            # Concatenar dados
-            df = pd.concat([df, new_customer], ignore_index=True)
-            expected_length = original_length + 1
-            
-            # Criar backups permanentes ANTES de salvar
-            self._create_permanent_backups(df)
-            
-            # Salvar no banco de dados (prioridade)
-            database_save_success = False
-            if self.database_manager.is_connected():
-                database_save_success = self.database_manager.save_customers(df)
-            
-            # Salvar no sistema de persistência externa (backup)
-            external_save_success = self.persistent_storage.save_data(df)
-            
-            # Criar múltiplos backups temporários também
-            backup_file = f"{self.customers_file}.backup"
-            backup_file2 = f"{self.customers_file}.backup2"
-            backup_file3 = f"{self.customers_file}.backup3"
-            
-            if os.path.exists(self.customers_file):
-                shutil.copy2(self.customers_file, backup_file)
-                shutil.copy2(self.customers_file, backup_file2)
-                shutil.copy2(self.customers_file, backup_file3)
-            
-            # Salvar dados com verificação tripla
-            success_count = 0
-            
-            # Tentativa 1: Salvar arquivo principal
-            try:
-                df.to_csv(self.customers_file, index=False)
-                # Verificar imediatamente
-                test_df = pd.read_csv(self.customers_file)
-                if len(test_df) == expected_length and test_df.iloc[-1]['name'] == name:
-                    success_count += 1
-            except:
-                pass
-            
-            # Tentativa 2: Salvar arquivo de segurança 1
-            temp_file1 = f"{self.customers_file}.temp1"
-            try:
-                df.to_csv(temp_file1, index=False)
-                test_df = pd.read_csv(temp_file1)
-                if len(test_df) == expected_length and test_df.iloc[-1]['name'] == name:
-                    success_count += 1
-                    # Se o principal falhou, usar este como principal
-                    if success_count == 1:
-                        shutil.copy2(temp_file1, self.customers_file)
-            except:
-                pass
-            
-            # Tentativa 3: Salvar arquivo de segurança 2
-            temp_file2 = f"{self.customers_file}.temp2"
-            try:
-                df.to_csv(temp_file2, index=False)
-                test_df = pd.read_csv(temp_file2)
-                if len(test_df) == expected_length and test_df.iloc[-1]['name'] == name:
-                    success_count += 1
-                    # Se os anteriores falharam, usar este como principal
-                    if success_count == 1:
-                        shutil.copy2(temp_file2, self.customers_file)
-            except:
-                pass
-            
-            # Verificação final múltipla
-            final_verification = False
-            try:
-                final_df = pd.read_csv(self.customers_file)
-                if len(final_df) == expected_length:
-                    last_customer = final_df.iloc[-1]
-                    if (last_customer['name'] == name and 
-                        last_customer['plan_value'] == plan_value and
-                        last_customer['status'] == status):
-                        final_verification = True
-            except:
-                pass
-            
-            # Limpar arquivos temporários
-            for temp_file in [temp_file1, temp_file2]:
-                try:
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                except:
-                    pass
-            
-            # Se falhou completamente, tentar restaurar do melhor backup
-            if not final_verification or success_count == 0:
-                for backup in [backup_file, backup_file2, backup_file3]:
-                    try:
-                        if os.path.exists(backup):
-                            shutil.copy2(backup, self.customers_file)
-                            break
-                    except:
-                        continue
-                return False
-            
-            print(f"✅ Cliente adicionado - Banco: {'OK' if database_save_success else 'N/A'}, Sistema externo: {'OK' if external_save_success else 'FALHOU'}")
-            return True
-            
+            with self._write_lock:
+                if self._is_duplicate(new_customer_data):
+                    return False
+                if self.database_manager.supports_point_writes:
+                    metrics_current = self._metrics_store_is_current()
+                    self.database_manager.insert_customer(new_customer_data)
+                else:
+                    self._ensure_journal_base()
+                    metrics_current = self._metrics_store_is_current()
+                    self.journal.insert(new_customer_data)
+                # Atualizar agregados mensais apenas com a linha nova
+                self._update_metrics_store(metrics_current, self.metrics_store.add, new_customer_data)
+        
         except Exception as e:
             print(f"Erro ao adicionar cliente: {e}")
-            # Última tentativa de restauração
-            for backup in [f"{self.customers_file}.backup", 
-                          f"{self.customers_file}.backup2", 
-                          f"{self.customers_file}.backup3"]:
-                try:
-                    if os.path.exists(backup):
-                        shutil.copy2(backup, self.customers_file)
-                        break
-                except:
-                    continue
             return False
+        
+        # Escrita confirmada no primário: falhas daqui em diante não desfazem o sucesso
+        self._after_write()
+        print(f"✅ Cliente adicionado - {self._write_path_status()}")
+        return True
     
-    def remove_customer(self, index):
-        """Remove cliente com validações e persistência externa"""
+    def remove_customer(self, index, expected_customer=None):
+        """Remove cliente registrando a remoção no journal
+        
+        expected_customer (a linha exibida ao usuário) localiza o alvo dentro do lock pela chave natural,
+        mesmo que outra sessão tenha mudado as posições depois da leitura da tela.
+        """
         try:
-            df = self.load_customers()
-            
-            if df.empty or index < 0 or index >= len(df):
-                print(f"Erro: Índice inválido {index} para DataFrame com {len(df)} registros")
-                return False
-            
-            # Backup antes de remover
-            self._create_permanent_backups(df)
-            backup_file = f"{self.customers_file}.backup"
-            if os.path.exists(self.customers_file):
-                shutil.copy2(self.customers_file, backup_file)
-            
-            # Remover cliente pelo índice
-            df_updated = df.drop(df.index[index]).reset_index(drop=True)
-            
-            # Salvar no banco de dados (prioridade)
-            database_save_success = False
-            if self.database_manager.is_connected():
-                database_save_success = self.database_manager.save_customers(df_updated)
-            
-            # Salvar no sistema de persistência externa (backup)
-            external_save_success = self.persistent_storage.save_data(df_updated)
-            
-            # Salvar localmente (backup local)
-            df_updated.to_csv(self.customers_file, index=False)
-            
-            # Verificar se a remoção foi bem-sucedida
-            df_verify = self.load_customers()
-            if len(df_verify) == len(df) - 1:
-                print(f"✅ Cliente removido - Banco: {'OK' if database_save_success else 'N/A'}, Sistema externo: {'OK' if external_save_success else 'FALHOU'}")
-                return True
-            else:
-                print(f"❌ Falha na verificação: esperado {len(df) - 1}, obtido {len(df_verify)}")
-                return False
-            
+            self.last_error = None
+            with self._write_lock:
+                if self.database_manager.supports_point_writes:
+                    target = self._find_point_target(index, expected_customer)
+                    if target is None:
+                        return False
+                    customer_id, removed_customer = target
+                    metrics_current = self._metrics_store_is_current()
+                    if not self.database_manager.delete_customer(customer_id):
+                        return False
+                else:
+                    df = self.load_customers()
+                    index = self._resolve_position(df, index, expected_customer)
+                    if index is None:
+                        return False
+                    removed_customer = df.iloc[index].to_dict()
+                    self._ensure_journal_base(df)
+                    metrics_current = self._metrics_store_is_current()
+                    self.journal.delete(index)
+                self._update_metrics_store(metrics_current, self.metrics_store.remove, removed_customer)
+        
         except Exception as e:
             print(f"Erro ao remover cliente: {e}")
-            # Restaurar backup em caso de erro
-            backup_file = f"{self.customers_file}.backup"
-            if os.path.exists(backup_file):
-                shutil.copy2(backup_file, self.customers_file)
             return False
+        
+        self._after_write()
+        print(f"✅ Cliente removido - {self._write_path_status()}")
+        return True
     
-    def update_customer(self, index, name, signup_date, plan_value, status, cancel_date=None):
-        """Atualiza dados completos do cliente com validações e salvamento ultra-robusto"""
+    def update_customer(self, index, name, signup_date, plan_value, status, cancel_date=None, expected_customer=None):
+        """Atualiza dados completos do cliente registrando a alteração no journal"""
         try:
-            df = self.load_customers()
-            
-            if df.empty or index < 0 or index >= len(df):
-                print(f"Erro: Índice inválido {index} para DataFrame com {len(df)} registros")
+            self.last_error = None
+            if status not in CUSTOMER_STATUSES:
+                self.last_error = f"Status inválido: {status}"
                 return False
             
-            # Backup antes de atualizar
-            self._create_permanent_backups(df)
-            backup_file = f"{self.customers_file}.backup"
-            if os.path.exists(self.customers_file):
-                shutil.copy2(self.customers_file, backup_file)
-            
-            # Atualizar dados do cliente
-            df.loc[index, 'name'] = name
-            df.loc[index, 'signup_date'] = signup_date
-            df.loc[index, 'plan_value'] = plan_value
-            df.loc[index, 'status'] = status
-            df.loc[index, 'cancel_date'] = cancel_date if cancel_date else None
-            
-            # Salvar no banco de dados (prioridade)
-            database_save_success = False
-            if self.database_manager.is_connected():
-                database_save_success = self.database_manager.save_customers(df)
-            
-            # Salvar no sistema de persistência externa (backup)
-            external_save_success = self.persistent_storage.save_data(df)
-            
-            # Salvar localmente (backup local)
-            df.to_csv(self.customers_file, index=False)
-            
-            # Verificar se a atualização foi bem-sucedida
-            df_verify = self.load_customers()
-            if len(df_verify) == len(df) and df_verify.loc[index, 'name'] == name:
-                print(f"✅ Cliente atualizado - Banco: {'OK' if database_save_success else 'N/A'}, Sistema externo: {'OK' if external_save_success else 'FALHOU'}")
-                return True
-            else:
-                print(f"❌ Falha na verificação da atualização")
-                return False
+            updated_customer = {
+                'name': name,
+                'signup_date': signup_date,
+                'plan_value': plan_value,
+                'status': status,
+                'cancel_date': cancel_date if cancel_date else None
+            }
             
+            with self._write_lock:
+                if self.database_manager.supports_point_writes:
+                    target = self._find_point_target(index, expected_customer)
+                    if target is None:
+                        return False
+                    customer_id, previous_customer = target
+                    if self._is_duplicate(updated_customer, customer_id=customer_id):
+                        return False
+                    metrics_current = self._metrics_store_is_current()
+                    if not self.database_manager.update_customer(customer_id, updated_customer):
+                        return False
+                else:
+                    df = self.load_customers()
+                    index = self._resolve_position(df, index, expected_customer)
+                    if index is None:
+                        return False
+                    previous_customer = df.iloc[index].to_dict()
+                    if self._is_duplicate(updated_customer, df, index):
+                        return False
+                    self._ensure_journal_base(df)
+                    metrics_current = self._metrics_store_is_current()
+                    self.journal.update(index, updated_customer)
+                self._update_metrics_store(metrics_current, self.metrics_store.update, previous_customer, updated_customer)
+        
         except Exception as e:
             print(f"Erro ao atualizar cliente: {e}")
-            # Restaurar backup em caso de erro
-            backup_file = f"{self.customers_file}.backup"
-            if os.path.exists(backup_file):
-                shutil.copy2(backup_file, self.customers_file)
             return False
-
-# Calculadora de métricas corrigida e robusta
-class MetricsCalculator:
-    def __init__(self, customers_df):
-        self.customers_df = customers_df.copy()
-        self._prepare_data()
-    
-    def _prepare_data(self):
-        """Prepara e valida os dados para cálculos"""
-        if self.customers_df.empty:
-            return
-            
-        # Garantir que as datas estão no formato datetime
-        self.customers_df['signup_date'] = pd.to_datetime(self.customers_df['signup_date'], errors='coerce')
-        self.customers_df['cancel_date'] = pd.to_datetime(self.customers_df['cancel_date'], errors='coerce')
-        
-        # Garantir que plan_value é numérico
-        self.customers_df['plan_value'] = pd.to_numeric(self.customers_df['plan_value'], errors='coerce')
-        self.customers_df['plan_value'] = self.customers_df['plan_value'].fillna(0)
-        
-        # Remover linhas com dados inválidos
-        self.customers_df = self.customers_df.dropna(subset=['signup_date'])
-    
-    def calculate_monthly_metrics(self):
-        if self.customers_df.empty:
-            return pd.DataFrame()
-        
-        start_date, end_date = self._get_analysis_period()
-        months = self._generate_month_list(start_date, end_date)
-        
-        metrics_list = []
-        for month_date in months:
-            month_str = month_date.strftime('%Y-%m')
-            new_customers = self._calculate_new_customers(month_date)
-            mrr = self._calculate_mrr(month_date)
-            avg_ticket = self._calculate_avg_ticket(month_date)
-            churn_customers, churn_mrr = self._calculate_churn(month_date)
-            
-            metrics_list.append({
-                'mes_ano': month_str,
-                'novos_clientes': int(new_customers),
-                'mrr': float(mrr),
-                'ticket_medio': float(avg_ticket),
-                'churn_clientes': int(churn_customers),
-                'churn_mrr': float(churn_mrr)
-            })
-        
-        return pd.DataFrame(metrics_list)
-    
-    def _get_analysis_period(self):
-        """Determina o período de análise com base nos dados"""
-        if self.customers_df.empty:
-            now = datetime.now()
-            return now.replace(day=1), now
-        
-        # Encontrar a primeira data de cadastro
-        min_signup = self.customers_df['signup_date'].min()
-        
-        # Encontrar a data mais recente (cadastro ou cancelamento)
-        max_date = self.customers_df['signup_date'].max()
-        cancel_dates = self.customers_df['cancel_date'].dropna()
-        if not cancel_dates.empty:
-            max_cancel = cancel_dates.max()
-            max_date = max(max_date, max_cancel)
-        
-        # Garantir que analisamos até o mês atual
-        now = datetime.now()
-        end_date = max(max_date, now)
-        
-        # Converter para primeiro dia do mês
-        start_date = min_signup.replace(day=1)
-        end_date = end_date.replace(day=1)
-        
-        return start_date, end_date
-    
-    def _generate_month_list(self, start_date, end_date):
-        """Gera lista de primeiros dias de cada mês no período"""
-        months = []
-        current = start_date
-        
-        while current <= end_date:
-            months.append(current)
-            # Avançar para o próximo mês
-            if current.month == 12:
-                current = current.replace(year=current.year + 1, month=1)
-            else:
-                current = current.replace(month=current.month + 1)
         
-        return months
+        self._after_write()
+        print(f"✅ Cliente atualizado - {self._write_path_status()}")
+        return True
     
-    def _calculate_new_customers(self, month_date):
-        """Calcula novos clientes que se cadastraram no mês"""
-        month_start = month_date.replace(day=1)
-        month_end = self._get_month_end(month_date)
-        
-        new_customers = self.customers_df[
-            (self.customers_df['signup_date'] >= month_start) &
-            (self.customers_df['signup_date'] <= month_end)
-        ]
-        
-        return len(new_customers)
+    def _resolve_position(self, df, index, expected_customer=None):
+        """Posição atual do alvo em df (chamado com _write_lock); None se o cliente não existir mais"""
+        if expected_customer is not None:
+            matches = natural_key_matches(df, expected_customer)
+            if len(matches) == 0:
+                self.last_error = "Cliente não encontrado - a lista foi alterada em outra sessão"
+                print(f"⚠️ Escrita recusada: {self.last_error}")
+                return None
+            # A chave natural identifica o cliente; a posição informada só desempata dados antigos repetidos
+            return index if index in matches else int(matches[0])
+        if df.empty or index < 0 or index >= len(df):
+            print(f"Erro: Índice inválido {index} para DataFrame com {len(df)} registros")
+            return None
+        return index
     
-    def _calculate_mrr(self, month_date):
-        """Calcula MRR (clientes ativos no final do mês)"""
-        month_end = self._get_month_end(month_date)
-        
-        # Clientes que já tinham se cadastrado até o final do mês
-        # E que não tinham cancelado até o final do mês
-        active_customers = self.customers_df[
-            (self.customers_df['signup_date'] <= month_end) &
-            (
-                (self.customers_df['cancel_date'].isna()) |
-                (self.customers_df['cancel_date'] > month_end)
-            )
-        ]
-        
-        return active_customers['plan_value'].sum()
+    def _find_point_target(self, index, expected_customer=None):
+        """(id, linha gravada) do alvo no banco local, pela chave natural (índice), sem contar posições"""
+        if expected_customer is None:
+            df = self.load_customers()
+            if df.empty or index < 0 or index >= len(df):
+                print(f"Erro: Índice inválido {index} para DataFrame com {len(df)} registros")
+                return None
+            expected_customer = df.iloc[index].to_dict()
+        target = self.database_manager.find_customer(expected_customer)
+        if target is None:
+            self.last_error = "Cliente não encontrado - a lista foi alterada em outra sessão"
+            print(f"⚠️ Escrita recusada: {self.last_error}")
+        return target
     
-    def _calculate_avg_ticket(self, month_date):
-        """Calcula ticket médio dos clientes ativos no final do mês"""
-        month_end = self._get_month_end(month_date)
-        
-        active_customers = self.customers_df[
-            (self.customers_df['signup_date'] <= month_end) &
-            (
-                (self.customers_df['cancel_date'].isna()) |
-                (self.customers_df['cancel_date'] > month_end)
-            )
-        ]
-        
-        if active_customers.empty:
-            return 0.0
-        
-        return active_customers['plan_value'].mean()
+    def _is_duplicate(self, customer, df=None, index=None, customer_id=None):
+        """Recusa a escrita se outro cliente já tem a mesma chave natural (nome, cadastro, valor)
+
+        O banco não aceita duplicatas; recusar aqui evita confirmar uma escrita que a replicação descartaria.
+        """
+        if df is None and self.database_manager.supports_point_writes:
+            duplicate = self.database_manager.customer_exists(customer, exclude_id=customer_id)
+        else:
+            matches = natural_key_matches(self.load_customers() if df is None else df, customer)
+            duplicate = any(position != index for position in matches)
+        if duplicate:
+            self.last_error = "Já existe um cliente com o mesmo nome, data de cadastro e valor"
+            print(f"⚠️ Escrita recusada: {self.last_error}")
+        return duplicate
     
-    def _calculate_churn(self, month_date):
-        """Calcula churn de clientes e MRR no mês - apenas clientes com 2+ meses"""
-        month_start = month_date.replace(day=1)
-        month_end = self._get_month_end(month_date)
-        
-        # Clientes que cancelaram durante o mês
-        canceled_this_month = self.customers_df[
-            (self.customers_df['cancel_date'] >= month_start) &
-            (self.customers_df['cancel_date'] <= month_end) &
-            (self.customers_df['cancel_date'].notna())
-        ].copy()
-        
-        if canceled_this_month.empty:
-            return 0, 0.0
-        
-        # Filtrar apenas clientes que ficaram pelo menos 2 meses
-        # Calcular diferença em meses entre signup_date e cancel_date
-        def months_between(start_date, end_date):
-            return (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
-        
-        # Aplicar filtro de 2+ meses
-        churned_customers = canceled_this_month[
-            canceled_this_month.apply(
-                lambda row: months_between(row['signup_date'], row['cancel_date']) >= 2, 
-                axis=1
-            )
-        ]
-        
-        churn_count = len(churned_customers)
-        churn_value = churned_customers['plan_value'].sum()
-        
-        return churn_count, churn_value
+    def _write_path_status(self):
+        if self.database_manager.supports_point_writes:
+            return "Banco local: OK"
+        return f"Journal: {self.journal.pending_count()} operações pendentes"
     
-    def calculate_ltv_metrics(self):
-        """Calcula métricas de LTV (Lifetime Value) dos clientes"""
-        if self.customers_df.empty:
-            return {
-                'ltv_medio': 0.0,
-                'ltv_clientes_ativos': 0.0,
-                'ltv_clientes_cancelados': 0.0,
-                'tempo_vida_medio_meses': 0.0,
-                'total_clientes_analisados': 0
-            }
+    def _database_is_current(self):
+        """O banco já tem todas as escritas confirmadas (nada no journal nem na fila de replicação)"""
+        if self.database_manager.supports_point_writes:
+            return True
+        return self.journal.pending_count() == 0 and not self.replication.is_pending()
+    
+    def _ensure_journal_base(self, df=None):
+        """Antes do primeiro registro no journal, alinha o snapshot local com a fonte atual (banco/externo)"""
+        if self.journal.pending_count() == 0:
+            metrics_current = self._metrics_store_is_current()
+            self.journal.ensure_base(self.load_customers() if df is None else df)
+            if metrics_current:
+                # O snapshot passa a ter o mesmo conteúdo já descrito pelos agregados
+                self.metrics_store.set_source_version(self._primary_version())
+    
+    def _primary_version(self):
+        """Versão do primário pela assinatura (tamanho + mtime) dos seus arquivos, sem ler o conteúdo"""
+        if self.database_manager.supports_point_writes:
+            db_file = self.database_manager.db_file
+            # Modo WAL: os commits vão para o arquivo -wal até o checkpoint
+            files = [db_file, f"{db_file}-wal"]
+        else:
+            files = [self.snapshot_store.path, self.journal.journal_file]
+        return [file_signature(path) for path in files]
+    
+    def _metrics_store_is_current(self):
+        return self.metrics_store.is_current(self._primary_version())
+    
+    def _update_metrics_store(self, metrics_current, update_func, *customers):
+        """Aplica a alteração aos agregados mensais (chamado com _write_lock, logo após a escrita no primário)
+
+        Se os agregados descreviam o primário antes da escrita, passam a descrever a versão nova;
+        senão ficam sem versão e são reconstruídos na próxima leitura.
+        """
+        try:
+            update_func(*customers, source_version=self._primary_version() if metrics_current else None)
+        except Exception as e:
+            # A escrita já está no primário; a divergência é detectada e reconstruída na próxima leitura
+            print(f"⚠️ Agregados mensais não atualizados ({e}) - serão reconstruídos na próxima leitura")
+    
+    def _after_write(self):
+        """Compactação e replicação depois de uma escrita já confirmada no primário"""
+        try:
+            self._compact_journal_if_needed()
+        except Exception as e:
+            # As operações continuam no journal e entram na próxima compactação
+            print(f"⚠️ Compactação do journal adiada: {e}")
+        try:
+            self.replication.submit()
+        except Exception as e:
+            print(f"⚠️ Replicação não agendada: {e}")
+    
+    def _compact_journal_if_needed(self):
+        if self.journal.needs_compaction():
+            # A escrita que disparou a compactação já agenda a replicação
+            self.compact_journal(replicate=False)
+    
+    def compact_journal(self, df=None, replicate=True):
+        """Incorpora o journal ao snapshot e agenda a replicação do estado completo (banco, sistema externo, snapshots)"""
+        with self._write_lock:
+            metrics_current = self._metrics_store_is_current()
+            # Estado atual: journal pendente ou, sem ele, o banco (no SQLite local as escritas vão direto ao banco)
+            df = self.journal.compact(self.load_customers() if df is None else df)
+            self.manifest.record(self._local_snapshot_target(), df, self.snapshot_store.path)
+            if metrics_current and not self.database_manager.supports_point_writes:
+                # Mesmo conteúdo em outros arquivos: os agregados continuam válidos
+                self.metrics_store.set_source_version(self._primary_version())
+        
+        if replicate:
+            self.replication.submit()
+        print(f"✅ Journal compactado - replicação: {self.replication.status()['pending_ops']} operações na fila")
+        return df
+    
+    def restore_snapshot(self, timestamp):
+        """Volta os clientes ao snapshot de timestamp e replica o estado restaurado"""
+        # Snapshots ainda na fila de replicação entram no índice antes da restauração
+        self.replication.flush()
+        self.last_error = None
+        try:
+            df = self.snapshots.restore(timestamp)
+        except (ValueError, ImportError, OSError) as e:
+            # Objeto corrompido (hash não confere), ausente ou em formato sem descompressor instalado
+            self.last_error = str(e)
+            print(f"❌ Snapshot de {timestamp} não restaurado: {e}")
+            return False
+        if df is None:
+            self.last_error = "Snapshot não encontrado"
+            return False
         
-        # Calcular LTV para cada cliente
-        ltv_data = []
-        current_date = pd.Timestamp.now()
+        with self._write_lock:
+            if self.database_manager.supports_point_writes:
+                # Banco local é o primário: o estado restaurado vai para ele
+                self.database_manager.save_customers(df)
+            self.compact_journal(df, replicate=False)
+            self.metrics_store.rebuild(df, source_version=self._primary_version())
+        # Fora do lock: a fila pode esperar a thread de replicação, que lê o primário com o lock
+        self.replication.submit()
+        print(f"♻️ Snapshot de {timestamp} restaurado ({len(df)} clientes)")
+        return True
+    
+    def load_monthly_metrics(self):
+        """Tabela mensal a partir dos agregados incrementais em O(meses)
+
+        A validade é conferida pela versão do primário (sem ler os clientes); só uma versão diferente
+        (escrita fora do app, agregados sem versão) faz a reconstrução completa.
+        """
+        # PostgreSQL em dia (sem operações no journal nem na fila): tabela mensal mantida pelo próprio banco
+        if self._database_is_current() and hasattr(self.database_manager, 'load_monthly_metrics'):
+            monthly_metrics = self.database_manager.load_monthly_metrics()
+            if monthly_metrics is not None and not monthly_metrics.empty:
+                return monthly_metrics
+        
+        with self._write_lock:
+            self._ensure_metrics_store()
+            return self.metrics_store.to_frame()
+    
+    def _ensure_metrics_store(self):
+        """Reconstrói os agregados se não descreverem a versão atual do primário (chamado com _write_lock)"""
+        version = self._primary_version()
+        if not self.metrics_store.is_current(version):
+            print("🔄 Agregados mensais desatualizados - reconstruindo")
+            self.metrics_store.rebuild(self.load_customers(), source_version=version)
+    
+    def load_customer_summary(self):
+        """Totais dos cards (clientes, ativos e MRR do mês atual) a partir dos agregados, sem ler os clientes"""
+        with self._write_lock:
+            self._ensure_metrics_store()
+            return self.metrics_store.summary()
+    
+    def cached_customer_metrics(self, cache, kind, compute):
+        """Resultado de compute() em cache pela versão do primário
         
-        for _, cliente in self.customers_df.iterrows():
-            signup_date = cliente['signup_date']
-            cancel_date = cliente['cancel_date']
-            plan_value = cliente['plan_value']
-            
-            # Determinar data final (cancelamento ou data atual)
-            end_date = cancel_date if pd.notna(cancel_date) else current_date
-            
-            # Calcular meses de vida do cliente
-            months_active = max(1, (end_date.year - signup_date.year) * 12 + (end_date.month - signup_date.month))
-            
-            # LTV = valor mensal × meses ativos
-            ltv = plan_value * months_active
-            
-            ltv_data.append({
-                'cliente': cliente['name'],
-                'ltv': ltv,
-                'months_active': months_active,
-                'plan_value': plan_value,
-                'is_active': pd.isna(cancel_date),
-                'signup_date': signup_date,
-                'cancel_date': cancel_date
-            })
-        
-        ltv_df = pd.DataFrame(ltv_data)
-        
-        # Calcular métricas agregadas
-        ltv_medio = ltv_df['ltv'].mean()
-        ltv_clientes_ativos = ltv_df[ltv_df['is_active']]['ltv'].mean() if ltv_df['is_active'].any() else 0
-        ltv_clientes_cancelados = ltv_df[~ltv_df['is_active']]['ltv'].mean() if (~ltv_df['is_active']).any() else 0
-        tempo_vida_medio = ltv_df['months_active'].mean()
-        
-        return {
-            'ltv_medio': ltv_medio,
-            'ltv_clientes_ativos': ltv_clientes_ativos,
-            'ltv_clientes_cancelados': ltv_clientes_cancelados,
-            'tempo_vida_medio_meses': tempo_vida_medio,
-            'total_clientes_analisados': len(ltv_df),
-            'ltv_detalhado': ltv_df
-        }
-    
-    def _get_month_end(self, month_date):
-        """Retorna o último momento do mês"""
-        last_day = calendar.monthrange(month_date.year, month_date.month)[1]
-        return month_date.replace(day=last_day, hour=23, minute=59, second=59, microsecond=999999)
+        A chave não depende do conteúdo: compute (que lê os clientes) só roda quando o primário mudou.
+        """
+        key = make_cache_key(kind, version=self._primary_version())
+        return cache.get_or_compute(key, compute)
+    
+    def calculate_monthly_metrics_in_database(self):
+        """Tabela mensal calculada no PostgreSQL sem trazer os clientes; None se o banco não estiver em dia"""
+        # Com operações no journal ou na fila de replicação o banco ainda não tem as últimas alterações
+        if not self._database_is_current() or not hasattr(self.database_manager, 'calculate_monthly_metrics'):
+            return None
+        return self.database_manager.calculate_monthly_metrics()
+    
+    def verify_metrics_store(self):
+        """Verificação completa (O(N)) dos agregados contra o conteúdo atual dos clientes"""
+        with self._write_lock:
+            return self.metrics_store.is_consistent_with(self.load_customers())
+    
+    def rebuild_metrics_store(self):
+        """Reconstrução completa dos agregados mensais a partir dos dados atuais"""
+        with self._write_lock:
+            self.metrics_store.rebuild(self.load_customers(), source_version=self._primary_version())
+        if hasattr(self.database_manager, 'rebuild_monthly_metrics'):
+            self.database_manager.rebuild_monthly_metrics()
 
 # Funções de visualização simplificadas e mais visuais
 def create_visualizations(monthly_metrics):
@@ -888,7 +855,17 @@ def create_visualizations(monthly_metrics):
 def init_data_manager():
     return DataManager()
 
-data_manager = init_data_manager()
+try:
+    data_manager = init_data_manager()
+except JournalConflictError as e:
+    st.error(f"❌ {e}")
+    st.stop()
+
+@st.cache_resource
+def init_metrics_cache():
+    return MetricsCache(disk_dir=".metrics_cache")
+
+metrics_cache = init_metrics_cache()
 
 # Interface principal
 st.title("📊 Dashboard de Métricas de Clientes")
@@ -901,17 +878,59 @@ page = st.sidebar.selectbox(
     ["Dashboard", "Inserir Dados", "Editar Cliente", "Gerenciar Dados", "Admin Database", "Exportar Relatórios"]
 )
 
+with st.sidebar.expander("⚡ Cache de Métricas"):
+    cache_stats = metrics_cache.stats()
+    st.write(f"Acertos: {cache_stats['hits']} (disco: {cache_stats['disk_hits']})")
+    st.write(f"Falhas: {cache_stats['misses']}")
+    st.write(f"Taxa de acerto: {cache_stats['hit_rate']:.1f}%")
+    st.write(f"Entradas em memória: {cache_stats['entries']} ({cache_stats['memory_bytes'] / 1024:.0f} KB)")
+    if st.button("🧹 Limpar Cache"):
+        metrics_cache.clear()
+
+# Fila acima do limite: as escritas seguem confirmadas no primário, só os destinos secundários estão atrás
+replication_status = data_manager.replication.status()
+if replication_status['over_limit']:
+    st.sidebar.warning(
+        f"⏳ Replicação atrasada: {replication_status['pending_ops'] + replication_status['in_flight_ops']} "
+        f"operações na fila, {replication_status['lag_seconds']:.0f}s de atraso"
+    )
+
 if page == "Dashboard":
     st.header("📈 Visão Geral das Métricas")
     
-    customers_df = data_manager.load_customers()
+    # Cards e gráficos vêm dos agregados mensais; os clientes só são lidos quando um resultado
+    # por cliente (cubo, LTV, coortes) não está em cache para a versão atual do primário
+    monthly_metrics = data_manager.load_monthly_metrics()
+    dashboard_calculator = {}
     
-    if customers_df.empty:
+    def get_dashboard_calculator():
+        if 'calculator' not in dashboard_calculator:
+            dashboard_calculator['calculator'] = MetricsCalculator(data_manager.load_customers())
+        return dashboard_calculator['calculator']
+    
+    if monthly_metrics.empty:
         st.warning("⚠️ Nenhum dado encontrado. Por favor, insira alguns dados na seção 'Inserir Dados'.")
     else:
-        calculator = MetricsCalculator(customers_df)
-        
-        monthly_metrics = calculator.calculate_monthly_metrics()
+        # Filtros por segmento respondidos pelo cubo pré-calculado
+        with st.expander("🔎 Filtros por Segmento"):
+            cube = data_manager.cached_customer_metrics(
+                metrics_cache, 'metrics_cube', lambda: get_dashboard_calculator().calculate_metrics_cube()
+            )
+            filter_col1, filter_col2, filter_col3 = st.columns(3)
+            with filter_col1:
+                selected_bands = st.multiselect("Faixa de plano", cube.dimension_values('faixa_plano'))
+            with filter_col2:
+                selected_status = st.multiselect("Status", cube.dimension_values('status'))
+            with filter_col3:
+                selected_years = st.multiselect("Ano de cadastro", cube.dimension_values('ano_cadastro'))
+        
+        if selected_bands or selected_status or selected_years:
+            monthly_metrics = cube.query(
+                faixa_plano=selected_bands,
+                status=selected_status,
+                ano_cadastro=selected_years
+            )
+            st.info("🔎 Gráficos e tabela mensal filtrados pelos segmentos selecionados")
         
         if not monthly_metrics.empty:
             # Cards de métricas principais - mais visuais
@@ -920,17 +939,17 @@ if page == "Dashboard":
             latest_month = monthly_metrics['mes_ano'].max()
             latest_data = monthly_metrics[monthly_metrics['mes_ano'] == latest_month].iloc[0]
             
-            # Calcular totais gerais corretamente (valores diretos em USD)
-            total_customers = len(customers_df)
-            active_customers_df = customers_df[customers_df['status'] == 'Ativo']
-            active_customers = len(active_customers_df)
+            # Totais gerais (valores diretos em USD) a partir dos agregados mensais
+            summary = data_manager.load_customer_summary()
+            total_customers = summary['total']
             
-            # Calcular MRR atual baseado em clientes ativos
-            current_mrr = active_customers_df['plan_value'].sum() if not active_customers_df.empty else 0
+            # Clientes ativos no mês atual e MRR correspondente
+            active_customers = summary['active']
+            current_mrr = summary['mrr']
             
             # Usar dados calculados ou MRR direto dos clientes ativos
             total_mrr_usd = current_mrr
-            avg_ticket_usd = active_customers_df['plan_value'].mean() if not active_customers_df.empty else 0
+            avg_ticket_usd = current_mrr / active_customers if active_customers > 0 else 0
             churn_count = latest_data['churn_clientes']
             churn_mrr_usd = latest_data['churn_mrr']
             
@@ -1162,7 +1181,9 @@ if page == "Dashboard":
             st.subheader("💎 Análise de LTV (Lifetime Value)")
             
             # Calcular métricas de LTV
-            ltv_metrics = calculator.calculate_ltv_metrics()
+            ltv_metrics = data_manager.cached_customer_metrics(
+                metrics_cache, 'ltv_metrics', lambda: get_dashboard_calculator().calculate_ltv_metrics()
+            )
             
             # Exibir KPIs de LTV em colunas
             col1, col2, col3, col4 = st.columns(4)
@@ -1268,6 +1289,46 @@ if page == "Dashboard":
                 
                 st.plotly_chart(fig_ltv_scatter, use_container_width=True)
             
+            # Seção de retenção por coorte
+            st.subheader("🧊 Retenção por Coorte")
+            
+            cohort_metrics = data_manager.cached_customer_metrics(
+                metrics_cache, 'cohort_metrics', lambda: get_dashboard_calculator().calculate_cohort_metrics()
+            )
+            
+            if not cohort_metrics['logo'].empty:
+                retention_type = st.radio(
+                    "Tipo de retenção:",
+                    ["Clientes (logo)", "Receita (MRR)"],
+                    horizontal=True
+                )
+                retention_matrix = cohort_metrics['logo'] if retention_type == "Clientes (logo)" else cohort_metrics['mrr']
+                
+                fig_cohort = go.Figure(go.Heatmap(
+                    z=retention_matrix.to_numpy() * 100,
+                    x=retention_matrix.columns,
+                    y=retention_matrix.index,
+                    colorscale='Blues',
+                    zmin=0,
+                    zmax=100,
+                    colorbar=dict(title='%'),
+                    hovertemplate='Coorte %{y}<br>Mês %{x}<br>Retenção: %{z:.1f}%<extra></extra>'
+                ))
+                
+                fig_cohort.update_layout(
+                    title='🧊 Retenção por Coorte (% da coorte ativa)',
+                    xaxis_title='Meses desde o cadastro',
+                    yaxis_title='Coorte (mês de cadastro)',
+                    height=max(400, 18 * len(retention_matrix)),
+                    plot_bgcolor='white',
+                    paper_bgcolor='white',
+                    margin=dict(t=50, b=40, l=80, r=40),
+                    font=dict(size=12),
+                    yaxis=dict(autorange='reversed', type='category')
+                )
+                
+                st.plotly_chart(fig_cohort, use_container_width=True)
+            
             # Tabela detalhada com todos os dados solicitados em USD
             st.subheader("📋 Dados Mensais Detalhados")
             
@@ -1308,7 +1369,7 @@ elif page == "Inserir Dados":
     db_connected = data_manager.database_manager.is_connected()
     
     # Verificar backups locais
-    backup_count = sum(1 for backup_file in data_manager.backup_files if os.path.exists(backup_file))
+    backup_count = len(data_manager.snapshots.list_snapshots())
     
     # Verificar sistemas externos
     storage_status = data_manager.persistent_storage.get_storage_status()
@@ -1491,99 +1552,47 @@ elif page == "Inserir Dados":
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 
-                # Dados antes do salvamento
-                customers_before = data_manager.load_customers()
-                count_before = len(customers_before)
-                
-                status_text.text("🔄 Preparando salvamento...")
-                progress_bar.progress(10)
-                
-                # Tentar salvar com monitoramento
                 status_text.text("💾 Salvando cliente...")
                 progress_bar.progress(30)
                 
+                # A gravação no primário é atômica (fsync antes de confirmar): sem releitura para conferir
                 success = data_manager.add_customer(
                     customer_name, parsed_signup_date, parsed_plan_value, status, parsed_cancel_date
                 )
                 
-                progress_bar.progress(60)
-                status_text.text("🔍 Verificando integridade dos dados...")
-                
-                # Verificação detalhada pós-salvamento
-                customers_after = data_manager.load_customers()
-                count_after = len(customers_after)
-                
-                progress_bar.progress(80)
-                
                 # Log detalhado do processo
                 log_container = st.container()
                 
-                if success and count_after > count_before:
-                    # Sucesso confirmado
+                if success:
                     progress_bar.progress(100)
                     status_text.text("✅ Cliente salvo com sucesso!")
                     
-                    # Verificar se é realmente o cliente correto
-                    latest_customer = customers_after.iloc[-1]
-                    if (latest_customer['name'] == customer_name and 
-                        abs(latest_customer['plan_value'] - parsed_plan_value) < 0.01):
-                        
-                        with log_container:
-                            st.success("🎉 Cliente adicionado com sucesso!")
-                            
-                            # Mostrar dados salvos
-                            st.info(f"""
-                            **Dados Confirmados:**
-                            - Nome: {latest_customer['name']}
-                            - Valor: ${latest_customer['plan_value']:,.2f} USD
-                            - Status: {latest_customer['status']}
-                            - Total de clientes: {count_after}
-                            """)
+                    with log_container:
+                        st.success("🎉 Cliente adicionado com sucesso!")
                         
-                        st.balloons()
-                        st.rerun()
-                    else:
-                        with log_container:
-                            st.error("⚠️ Dados salvos não conferem. Verificando...")
-                            st.write(f"Esperado: {customer_name}, ${parsed_plan_value}")
-                            st.write(f"Salvo: {latest_customer['name']}, ${latest_customer['plan_value']}")
+                        # Mostrar dados salvos
+                        st.info(f"""
+                        **Dados Confirmados:**
+                        - Nome: {customer_name.strip()}
+                        - Valor: ${parsed_plan_value:,.2f} USD
+                        - Status: {status}
+                        """)
+                    
+                    st.balloons()
+                    st.rerun()
                 else:
                     # Falha no salvamento
                     progress_bar.progress(100)
                     status_text.text("❌ Falha no salvamento")
                     
                     with log_container:
-                        st.error("❌ Erro ao salvar cliente")
+                        st.error(f"❌ {data_manager.last_error or 'Erro ao salvar cliente'}")
                         
                         # Log detalhado para debugging
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.write("**Diagnóstico:**")
-                            st.write(f"- Retorno da função: {success}")
-                            st.write(f"- Clientes antes: {count_before}")
-                            st.write(f"- Clientes depois: {count_after}")
-                            st.write(f"- Arquivo existe: {os.path.exists(data_manager.customers_file)}")
-                        
-                        with col2:
-                            st.write("**Arquivos de Backup:**")
-                            backups = [
-                                f"{data_manager.customers_file}.backup",
-                                f"{data_manager.customers_file}.backup2", 
-                                f"{data_manager.customers_file}.backup3"
-                            ]
-                            for backup in backups:
-                                exists = os.path.exists(backup)
-                                st.write(f"- {backup.split('.')[-1]}: {'✅' if exists else '❌'}")
-                        
-                        # Opção para ver dados raw
-                        if st.checkbox("🔍 Ver dados raw do arquivo"):
-                            try:
-                                with open(data_manager.customers_file, 'r') as f:
-                                    content = f.read()
-                                st.text_area("Conteúdo do arquivo:", content, height=200)
-                            except Exception as e:
-                                st.error(f"Erro ao ler arquivo: {str(e)}")
+                        st.write("**Diagnóstico:**")
+                        st.write(f"- Retorno da função: {success}")
+                        st.write(f"- Gravação: {data_manager._write_path_status()}")
+                        st.write(f"- Replicação: {data_manager.replication.status()['pending_ops']} operações na fila")
                 
                 # Limpar progress bar após um tempo
                 import time
@@ -1792,7 +1801,8 @@ elif page == "Editar Cliente":
                         parsed_signup_date,
                         parsed_plan_value,
                         edit_status,
-                        parsed_cancel_date
+                        parsed_cancel_date,
+                        expected_customer=selected_customer.to_dict()
                     )
                     
                     progress_bar.progress(80)
@@ -1813,7 +1823,7 @@ elif page == "Editar Cliente":
                     else:
                         progress_bar.progress(100)
                         status_text.text("❌ Falha na atualização")
-                        st.error("❌ Erro ao atualizar cliente. Tente novamente.")
+                        st.error(f"❌ {data_manager.last_error or 'Erro ao atualizar cliente. Tente novamente.'}")
                         
                         # Limpar progress bar
                         import time
@@ -1856,11 +1866,56 @@ elif page == "Gerenciar Dados":
                 )
                 
                 if st.button("Remover Cliente"):
-                    if data_manager.remove_customer(customer_to_remove):
+                    if data_manager.remove_customer(customer_to_remove, customers_df.iloc[customer_to_remove].to_dict()):
                         st.success("✅ Cliente removido com sucesso!")
                         st.rerun()
                     else:
-                        st.error("❌ Erro ao remover cliente.")
+                        st.error(f"❌ {data_manager.last_error or 'Erro ao remover cliente.'}")
+        
+        with col2:
+            st.subheader("🧮 Agregados Mensais")
+            st.write("Reconstrói as métricas mensais a partir de todos os clientes (corrige divergências).")
+            
+            if st.button("🔍 Verificar Métricas"):
+                with st.spinner("Comparando agregados com todos os clientes..."):
+                    consistent = data_manager.verify_metrics_store()
+                if consistent:
+                    st.success("✅ Agregados mensais conferem com os clientes")
+                else:
+                    st.warning("⚠️ Agregados divergentes - use Reconstruir Métricas")
+            
+            if st.button("🔄 Reconstruir Métricas"):
+                with st.spinner("Reconstruindo agregados mensais..."):
+                    data_manager.rebuild_metrics_store()
+                st.success("✅ Métricas mensais reconstruídas!")
+            
+            st.subheader("🗜️ Journal de Alterações")
+            st.write(f"Operações pendentes: {data_manager.journal.pending_count()} (compactação automática a cada {data_manager.journal.compact_every})")
+            
+            if st.button("🗜️ Compactar Journal"):
+                with st.spinner("Incorporando journal ao snapshot..."):
+                    data_manager.compact_journal()
+                st.success("✅ Journal compactado e replicado!")
+            
+            st.subheader("🕒 Snapshots")
+            snapshots = data_manager.snapshots.list_snapshots()
+            if snapshots:
+                st.write(f"{len(snapshots)} snapshots retidos ({sum(entry['bytes'] for entry in snapshots) / 1024:.0f} KB comprimidos)")
+                selected_snapshot = st.selectbox(
+                    "Snapshot",
+                    snapshots,
+                    format_func=lambda entry: f"{entry['timestamp'][:19].replace('T', ' ')} - {entry['rows']} clientes"
+                )
+                if st.button("♻️ Restaurar Snapshot"):
+                    with st.spinner("Restaurando snapshot..."):
+                        restored = data_manager.restore_snapshot(selected_snapshot['timestamp'])
+                    if restored:
+                        st.success("✅ Snapshot restaurado!")
+                        st.rerun()
+                    else:
+                        st.error(f"❌ {data_manager.last_error}")
+            else:
+                st.write("Nenhum snapshot gravado ainda.")
     else:
         st.info("📊 Nenhum cliente cadastrado.")
 
@@ -1895,6 +1950,9 @@ elif page == "Admin Database":
         # Alerta sobre duplicatas
         if stats['duplicates'] > 0:
             st.error(f"⚠️ **PROBLEMA DETECTADO**: {stats['duplicates']} grupos de dados duplicados encontrados no banco!")
+        if getattr(data_manager.database_manager, 'natural_key_conflicts', None):
+            st.warning("⏸️ A migração da chave natural única aguarda a limpeza das duplicatas - "
+                       "revise os registros e use 'Limpar Duplicatas' para concluí-la.")
         
         st.markdown("---")
         
@@ -1936,6 +1994,42 @@ elif page == "Admin Database":
         
         st.markdown("---")
         
+        # Replicação write-behind para os destinos secundários
+        st.subheader("📡 Replicação")
+        replication = data_manager.replication.status()
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.metric("Operações na Fila", replication['pending_ops'] + replication['in_flight_ops'])
+        
+        with col2:
+            st.metric("Atraso", f"{replication['lag_seconds']:.1f}s", help=f"Limite: {replication['max_lag_seconds']}s")
+        
+        with col3:
+            st.metric("Operações Replicadas", replication['replicated_ops'])
+        
+        targets_table = pd.DataFrame([
+            {
+                'Destino': name,
+                'Estado': '✅ OK' if target['ok'] else ('❌ Falhando' if target['ok'] is False else '⏳ Aguardando'),
+                'Última Replicação': target['last_success'] or '-',
+                'Falhas': target['failures'],
+                'Último Erro': target['last_error'] or '-'
+            }
+            for name, target in replication['targets'].items()
+        ])
+        st.dataframe(targets_table, use_container_width=True, hide_index=True)
+        
+        if st.button("⏩ Aguardar Replicação"):
+            with st.spinner("Replicando operações pendentes..."):
+                if data_manager.replication.flush(timeout=replication['max_lag_seconds']):
+                    st.success("✅ Todos os destinos em dia")
+                else:
+                    st.warning("⚠️ Ainda há operações na fila - veja os erros acima")
+        
+        st.markdown("---")
+        
         # Sincronização
         st.subheader("🔄 Sincronização de Dados")
         
@@ -1948,11 +2042,14 @@ elif page == "Admin Database":
             
             if st.button("📤 Sincronizar Local → Banco"):
                 with st.spinner("Sincronizando dados..."):
-                    success = data_manager.database_manager.save_customers(customers_df)
+                    sync_stats = data_manager.database_manager.sync_customers(customers_df)
                     
-                    if success:
-                        st.success("✅ Dados sincronizados com sucesso!")
-                        st.rerun()
+                    if sync_stats is not None:
+                        st.success(
+                            f"✅ Dados sincronizados: {sync_stats['inserted']} inseridos, "
+                            f"{sync_stats['updated']} atualizados, {sync_stats['deleted']} removidos "
+                            f"({sync_stats['unchanged']} inalterados)"
+                        )
                     else:
                         st.error("❌ Erro na sincronização")
         
@@ -1969,8 +2066,9 @@ elif page == "Admin Database":
                     success = data_manager.database_manager.reset_database()
                     
                     if success:
-                        # Limpar CSV local
-                        empty_df.to_csv(data_manager.customers_file, index=False)
+                        # Limpar CSV local e snapshot + journal
+                        data_manager.save_customers_file(empty_df)
+                        data_manager.journal.compact(empty_df)
                         # Limpar sistema de persistência externa
                         data_manager.persistent_storage.save_data(empty_df)
                         st.success("✅ Todos os dados removidos com sucesso!")
@@ -2001,8 +2099,10 @@ elif page == "Exportar Relatórios":
     customers_df = data_manager.load_customers()
     
     if not customers_df.empty:
-        calculator = MetricsCalculator(customers_df)
-        monthly_metrics = calculator.calculate_monthly_metrics()
+        monthly_metrics = data_manager.calculate_monthly_metrics_in_database()
+        if monthly_metrics is None:
+            calculator = MetricsCalculator(customers_df, cache=metrics_cache)
+            monthly_metrics = calculator.calculate_monthly_metrics()
         
         col1, col2 = st.columns(2)
         
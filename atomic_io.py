@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Gravação atômica de arquivos
+O conteúdo vai para um arquivo temporário no mesmo diretório, recebe fsync, substitui o destino com
+os.replace e o diretório recebe fsync; depois de uma queda fica o arquivo antigo ou o novo, nunca um parcial.
+Formatos próprios (JSON de índices/manifestos) levam um rodapé com tamanho e SHA-256 do conteúdo,
+verificado na leitura sem precisar reler nem reinterpretar o arquivo para conferir a gravação.
+"""
+
+import hashlib
+import os
+import struct
+
+FOOTER_MAGIC = b"CKSUMv1\n"
+# Rodapé: magic, tamanho do conteúdo, SHA-256 do conteúdo
+FOOTER = struct.Struct("<8sQ32s")
+
+
+def fsync_directory(directory):
+    """Persiste a entrada do diretório (criação/renomeação de arquivos)"""
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        # Sistemas sem abertura de diretórios (Windows): o os.replace já é o melhor disponível
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, write_func):
+    """Gera o arquivo com write_func(caminho_temporário) e o publica de forma atômica em path"""
+    temp_file = f"{path}.tmp"
+    try:
+        write_func(temp_file)
+        with open(temp_file, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    fsync_directory(os.path.dirname(path))
+
+
+def atomic_write_bytes(path, data, checksum_footer=False):
+    """Grava data de forma atômica (uma escrita sequencial), opcionalmente com rodapé de checksum"""
+    if checksum_footer:
+        data = data + FOOTER.pack(FOOTER_MAGIC, len(data), hashlib.sha256(data).digest())
+
+    def write(temp_file):
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+
+    atomic_write(path, write)
+
+
+def read_verified(path, allow_missing_footer=False):
+    """Conteúdo de um arquivo gravado com rodapé; ValueError se o rodapé ou o checksum não conferirem
+
+    allow_missing_footer aceita arquivos gravados antes do rodapé existir (devolvidos sem verificação).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) >= FOOTER.size:
+        magic, size, checksum = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+        if magic == FOOTER_MAGIC:
+            payload = data[:-FOOTER.size]
+            if len(payload) != size or hashlib.sha256(payload).digest() != checksum:
+                raise ValueError(f"checksum de {path} não confere")
+            return payload
+    if allow_missing_footer:
+        return data
+    raise ValueError(f"{path} sem rodapé de checksum")
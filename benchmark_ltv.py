@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark do cálculo de LTV: loop com iterrows vs caminho colunar
+Uso: python benchmark_ltv.py [tamanhos...]   (padrão: 10000 100000 1000000)
+"""
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from metrics_engine import calculate_ltv_frame
+
+
+def create_benchmark_customers(n, seed=42):
+    """Gera clientes sintéticos com ~40% de cancelamentos"""
+    rng = np.random.default_rng(seed)
+    signup = pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 3650, n), unit='D')
+    canceled = rng.random(n) < 0.4
+    cancel = pd.Series(signup + pd.to_timedelta(rng.integers(1, 1200, n), unit='D')).where(canceled)
+
+    return pd.DataFrame({
+        'name': [f'Cliente {i}' for i in range(n)],
+        'signup_date': signup,
+        'plan_value': rng.choice([99.0, 199.0, 499.0, 1500.0, 4000.0], n),
+        'status': np.where(canceled, 'Cancelado', 'Ativo'),
+        'cancel_date': cancel
+    })
+
+
+def ltv_frame_iterrows(customers_df, current_date):
+    """Implementação original (linha a linha) usada como referência"""
+    ltv_data = []
+    for _, cliente in customers_df.iterrows():
+        signup_date = cliente['signup_date']
+        cancel_date = cliente['cancel_date']
+        plan_value = cliente['plan_value']
+        end_date = cancel_date if pd.notna(cancel_date) else current_date
+        months_active = max(1, (end_date.year - signup_date.year) * 12 + (end_date.month - signup_date.month))
+        ltv_data.append({
+            'cliente': cliente['name'],
+            'ltv': plan_value * months_active,
+            'months_active': months_active,
+            'plan_value': plan_value,
+            'is_active': pd.isna(cancel_date),
+            'signup_date': signup_date,
+            'cancel_date': cancel_date
+        })
+    return pd.DataFrame(ltv_data)
+
+
+def run_benchmark(sizes):
+    """Executa o benchmark para cada tamanho e imprime o speedup"""
+    current_date = pd.Timestamp.now()
+
+    print(f"{'clientes':>10} | {'iterrows (s)':>12} | {'colunar (s)':>11} | {'speedup':>8}")
+    print("-" * 52)
+
+    for n in sizes:
+        customers_df = create_benchmark_customers(n)
+
+        start = time.perf_counter()
+        reference = ltv_frame_iterrows(customers_df, current_date)
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columnar = calculate_ltv_frame(
+            customers_df['name'],
+            customers_df['signup_date'],
+            customers_df['cancel_date'],
+            customers_df['plan_value'],
+            current_date
+        )
+        columnar_time = time.perf_counter() - start
+
+        # Garantir que os dois caminhos produzem o mesmo resultado
+        pd.testing.assert_frame_equal(reference, columnar, check_dtype=False)
+
+        print(f"{n:>10} | {loop_time:>12.3f} | {columnar_time:>11.4f} | {loop_time / columnar_time:>7.0f}x")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    run_benchmark(sizes)
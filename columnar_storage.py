@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Snapshot colunar de clientes em Arrow IPC
+Colunas tipadas (datas date32, plan_value float64, status com dicionário) lidas via memory map,
+sem reparse de texto a cada carregamento. CSV fica apenas como formato de importação/exportação.
+"""
+
+import os
+import pandas as pd
+from customer_journal import CUSTOMER_COLUMNS, CsvCustomerStore, CustomerJournal, FileCustomerStore
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    ipc = None
+    ARROW_AVAILABLE = False
+
+DEFAULT_COLUMNAR_FILE = "customers.arrow"
+
+
+def customers_schema():
+    return pa.schema([
+        ('name', pa.string()),
+        ('signup_date', pa.date32()),
+        ('plan_value', pa.float64()),
+        ('status', pa.dictionary(pa.int32(), pa.string())),
+        ('cancel_date', pa.date32())
+    ])
+
+
+def customers_to_arrow(df):
+    """Converte o DataFrame de clientes em uma tabela Arrow com o esquema tipado"""
+    if df.empty:
+        return customers_schema().empty_table()
+
+    def dates(column):
+        values = pd.to_datetime(df[column], errors='coerce')
+        return pa.array(values.dt.date.astype(object).where(values.notna(), None), type=pa.date32())
+
+    return pa.table({
+        'name': pa.array(df['name'].astype(object).where(df['name'].notna(), None), type=pa.string()),
+        'signup_date': dates('signup_date'),
+        'plan_value': pa.array(pd.to_numeric(df['plan_value'], errors='coerce').fillna(0), type=pa.float64()),
+        'status': pa.array(df['status'].astype(object).where(df['status'].notna(), None), type=pa.string()).dictionary_encode(),
+        'cancel_date': dates('cancel_date')
+    }, schema=customers_schema())
+
+
+class ColumnarCustomerStore(FileCustomerStore):
+    """Snapshot em arquivo Arrow IPC; leitura por memory map"""
+
+    def __init__(self, path=DEFAULT_COLUMNAR_FILE):
+        if not ARROW_AVAILABLE:
+            raise ImportError("pyarrow não está instalado - armazenamento colunar indisponível")
+        super().__init__(path)
+
+    def load_table(self):
+        """Tabela Arrow apoiada no memory map do arquivo (sem cópia das colunas numéricas e de datas)"""
+        if not self.exists():
+            return customers_schema().empty_table()
+        with pa.memory_map(self.path, 'r') as source:
+            return ipc.open_file(source).read_all()
+
+    def load(self):
+        """DataFrame com datas em datetime64 e plan_value float64"""
+        table = self.load_table()
+        df = table.to_pandas(date_as_object=False)
+        # Status volta a texto: o restante do app compara, preenche e altera o campo livremente
+        df['status'] = df['status'].astype(object)
+        for column in ['signup_date', 'cancel_date']:
+            df[column] = df[column].astype('datetime64[ns]')
+        return df[CUSTOMER_COLUMNS]
+
+    def _write(self, df, path):
+        table = customers_to_arrow(df)
+        with pa.OSFile(path, 'wb') as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def prepare_for_journal(self, df):
+        # Datas como objeto para receber os textos 'YYYY-MM-DD' das operações do journal
+        return df.astype({'signup_date': object, 'cancel_date': object})
+
+    def finalize(self, df):
+        df['signup_date'] = pd.to_datetime(df['signup_date'], errors='coerce')
+        df['cancel_date'] = pd.to_datetime(df['cancel_date'], errors='coerce')
+        return df
+
+
+def create_customer_store(csv_file="customers_simple.csv", columnar_file=DEFAULT_COLUMNAR_FILE,
+                          journal_file="customers_journal.jsonl"):
+    """Snapshot colunar quando o pyarrow estiver disponível (importando o CSV na primeira vez); senão CSV"""
+    if not ARROW_AVAILABLE:
+        return CsvCustomerStore(csv_file)
+
+    store = ColumnarCustomerStore(columnar_file)
+    if not store.exists() and os.path.exists(csv_file):
+        # CSV só com cabeçalho (criado vazio pelo app): um snapshot vazio esconderia a perda do arquivo colunar
+        if not CustomerJournal(csv_file, journal_file).load().empty:
+            import_csv(csv_file, columnar_file, journal_file)
+    return store
+
+
+def import_csv(csv_file="customers_simple.csv", columnar_file=DEFAULT_COLUMNAR_FILE,
+               journal_file="customers_journal.jsonl"):
+    """Converte o CSV de clientes (com as operações pendentes do journal) em snapshot colunar"""
+    journal = CustomerJournal(csv_file, journal_file)
+    df = journal.load()
+    ColumnarCustomerStore(columnar_file).save(df)
+    if journal.pending_count() and os.path.exists(journal_file):
+        # As operações pendentes já estão no snapshot novo
+        os.remove(journal_file)
+    print(f"✅ {len(df)} clientes importados de {csv_file} para {columnar_file}")
+    return df
+
+
+def export_csv(columnar_file=DEFAULT_COLUMNAR_FILE, csv_file="customers_simple.csv",
+               journal_file="customers_journal.jsonl"):
+    """Exporta o snapshot colunar (com as operações pendentes do journal) para CSV"""
+    df = CustomerJournal(journal_file=journal_file, snapshot_store=ColumnarCustomerStore(columnar_file)).load()
+    df.to_csv(csv_file, index=False, date_format='%Y-%m-%d')
+    print(f"✅ {len(df)} clientes exportados de {columnar_file} para {csv_file}")
+    return df
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Journal append-only de alterações de clientes
+Cada inserção/atualização/remoção vira uma linha JSON com checksum anexada ao journal (O(1) bytes por escrita);
+a leitura aplica o journal sobre o snapshot (CSV ou colunar) e a compactação periódica incorpora o journal ao snapshot.
+"""
+
+import hashlib
+import io
+import json
+import os
+import zlib
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from atomic_io import atomic_write, fsync_directory
+
+CUSTOMER_COLUMNS = ['name', 'signup_date', 'plan_value', 'status', 'cancel_date']
+
+
+def _entry_checksum(entry):
+    """CRC32 da entrada serializada de forma canônica (sem o campo crc)"""
+    payload = json.dumps(entry, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return format(zlib.crc32(payload.encode('utf-8')), '08x')
+
+
+def _file_checksum(path):
+    """SHA-256 do arquivo (string vazia hasheada se não existir)"""
+    digest = hashlib.sha256()
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class JournalConflictError(RuntimeError):
+    """Journal com operações gravadas sobre outra versão do snapshot (snapshot reescrito fora do journal)"""
+
+
+def _json_value(value):
+    """Converte valores do pandas/NumPy em valores serializáveis (datas como 'YYYY-MM-DD')"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (pd.Timestamp, date)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def comparable_customers(df):
+    """Forma canônica (textos, datas 'YYYY-MM-DD', valores float) para comparar clientes de fontes diferentes"""
+    if df.empty:
+        return pd.DataFrame(columns=CUSTOMER_COLUMNS)
+    result = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    for column in ['name', 'status']:
+        result[column] = df[column].astype(object).where(df[column].notna(), '').astype(str).to_numpy()
+    for column in ['signup_date', 'cancel_date']:
+        dates = pd.to_datetime(df[column], errors='coerce')
+        result[column] = dates.dt.strftime('%Y-%m-%d').fillna('').to_numpy()
+    result['plan_value'] = pd.to_numeric(df['plan_value'], errors='coerce').fillna(0).astype(float).round(6).to_numpy()
+    return result[CUSTOMER_COLUMNS]
+
+
+class FileCustomerStore:
+    """Snapshot de clientes em um único arquivo, substituído de forma atômica"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def checksum(self):
+        """SHA-256 do arquivo (identifica a versão do snapshot que o journal complementa)"""
+        return _file_checksum(self.path)
+
+    def save(self, df, before_replace=None):
+        """Substitui o snapshot; before_replace(checksum) roda com o arquivo novo pronto, antes de publicá-lo"""
+        def write(temp_file):
+            self._write(df, temp_file)
+            if before_replace is not None:
+                before_replace(_file_checksum(temp_file))
+
+        atomic_write(self.path, write)
+
+    def prepare_for_journal(self, df):
+        """Ajusta os tipos do snapshot antes de aplicar as operações do journal"""
+        return df
+
+    def finalize(self, df):
+        """Ajusta os tipos depois de aplicar as operações do journal"""
+        return df
+
+
+class CsvCustomerStore(FileCustomerStore):
+    """Snapshot em CSV (datas mantidas como texto, como no arquivo original)"""
+
+    def load(self):
+        if not self.exists():
+            return pd.DataFrame(columns=CUSTOMER_COLUMNS)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if not data.strip():
+            return pd.DataFrame(columns=CUSTOMER_COLUMNS)
+        # Datas como texto para que atualizações do journal não mudem o tipo da coluna
+        return pd.read_csv(io.BytesIO(data), dtype={'signup_date': object, 'cancel_date': object})
+
+    def _write(self, df, path):
+        df.to_csv(path, index=False)
+
+
+class CustomerJournal:
+    def __init__(self, snapshot_file="customers_simple.csv", journal_file="customers_journal.jsonl", compact_every=200,
+                 snapshot_store=None):
+        self.snapshot = snapshot_store if snapshot_store is not None else CsvCustomerStore(snapshot_file)
+        self.snapshot_file = self.snapshot.path
+        self.journal_file = journal_file
+        self.compact_every = compact_every
+        self.entries = []
+        self.base_checksum = None
+        self._open()
+
+    def _open(self):
+        """Lê o journal, descartando a cauda corrompida (escrita interrompida) e journals já compactados"""
+        self.entries = []
+        self.base_checksum = None
+        compacted_checksum = None
+        if not os.path.exists(self.journal_file):
+            return
+
+        valid_bytes = 0
+        with open(self.journal_file, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    crc = entry.pop('crc')
+                    if not line.endswith(b'\n') or crc != _entry_checksum(entry):
+                        raise ValueError("checksum inválido")
+                except Exception:
+                    print(f"⚠️ Journal com entrada inválida após {len(self.entries)} operações - descartando a cauda")
+                    break
+                if entry['op'] == 'base':
+                    self.base_checksum = entry['snapshot_sha256']
+                elif entry['op'] == 'compacted':
+                    compacted_checksum = entry['snapshot_sha256']
+                else:
+                    # Operação depois da marca: aquela compactação não chegou a publicar o snapshot
+                    compacted_checksum = None
+                    self.entries.append(entry)
+                valid_bytes += len(line)
+
+        if valid_bytes < os.path.getsize(self.journal_file):
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(valid_bytes)
+
+        if not self.entries:
+            return
+        snapshot_checksum = self.snapshot.checksum()
+        if snapshot_checksum == compacted_checksum:
+            # Compactação interrompida depois de publicar o snapshot: as operações já estão nele
+            os.remove(self.journal_file)
+            print(f"🗜️ Journal já incorporado ao snapshot ({len(self.entries)} operações) - removido")
+            self.entries = []
+            self.base_checksum = None
+            return
+        if snapshot_checksum == self.base_checksum:
+            return
+        # Snapshot reescrito fora do journal: as operações não podem ser aplicadas nem descartadas em silêncio
+        raise JournalConflictError(
+            f"O journal {self.journal_file} tem {len(self.entries)} operações gravadas sobre outra versão de "
+            f"{self.snapshot.path}, que foi reescrito fora do journal. Nada foi descartado: restaure o snapshot "
+            f"correspondente ou mova o journal para outro lugar (perdendo essas operações) e reinicie."
+        )
+
+    def pending_count(self):
+        """Quantidade de operações ainda não incorporadas ao snapshot"""
+        return len(self.entries)
+
+    def needs_compaction(self):
+        return len(self.entries) >= self.compact_every
+
+    def _append(self, entry):
+        """Anexa uma entrada com checksum e força a gravação em disco"""
+        lines = []
+        if self.base_checksum is None:
+            # Primeira operação após a compactação: registra qual snapshot o journal complementa
+            base = {'op': 'base', 'snapshot_sha256': self.snapshot.checksum()}
+            lines.append(dict(base, crc=_entry_checksum(base)))
+        entry = dict(entry, seq=len(self.entries) + 1, ts=datetime.now().isoformat())
+        lines.append(dict(entry, crc=_entry_checksum(entry)))
+
+        data = ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines)
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if self.base_checksum is None:
+            # Journal recém-criado: a entrada do diretório também precisa chegar ao disco
+            fsync_directory(os.path.dirname(self.journal_file))
+
+        if self.base_checksum is None:
+            self.base_checksum = lines[0]['snapshot_sha256']
+        self.entries.append(entry)
+
+    def _mark_compacted(self, snapshot_checksum):
+        """Registra no journal o checksum do snapshot compactado antes de publicá-lo
+
+        Se o processo cair entre a troca do snapshot e a remoção do journal, a próxima abertura reconhece
+        que as operações já estão no snapshot novo.
+        """
+        if not os.path.exists(self.journal_file):
+            return
+        marker = {'op': 'compacted', 'snapshot_sha256': snapshot_checksum}
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(marker, crc=_entry_checksum(marker))) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def insert(self, row):
+        """Registra um cliente novo (adicionado ao final)"""
+        self._append({'op': 'insert', 'row': {column: _json_value(row.get(column)) for column in CUSTOMER_COLUMNS}})
+
+    def update(self, index, row):
+        """Registra a alteração do cliente na posição index"""
+        self._append({'op': 'update', 'index': int(index),
+                      'row': {column: _json_value(row.get(column)) for column in CUSTOMER_COLUMNS}})
+
+    def delete(self, index):
+        """Registra a remoção do cliente na posição index"""
+        self._append({'op': 'delete', 'index': int(index)})
+
+    def load_snapshot(self):
+        return self.snapshot.load()
+
+    def load(self):
+        """Snapshot + journal: aplica as operações pendentes na ordem em que foram gravadas"""
+        df = self.load_snapshot()
+        if not self.entries:
+            return df
+
+        df = self.snapshot.prepare_for_journal(df)
+        inserts = []
+        for entry in self.entries:
+            if entry['op'] == 'insert':
+                inserts.append(entry['row'])
+                continue
+            # Atualizações/remoções usam posições; inserções acumuladas entram antes
+            if inserts:
+                df = pd.concat([df, pd.DataFrame(inserts, columns=CUSTOMER_COLUMNS)], ignore_index=True)
+                inserts = []
+            if entry['op'] == 'update':
+                for column, value in entry['row'].items():
+                    df.loc[entry['index'], column] = value
+            elif entry['op'] == 'delete':
+                df = df.drop(df.index[entry['index']]).reset_index(drop=True)
+        if inserts:
+            df = pd.concat([df, pd.DataFrame(inserts, columns=CUSTOMER_COLUMNS)], ignore_index=True)
+        return self.snapshot.finalize(df)
+
+    def compact(self, df=None):
+        """Grava o estado atual como novo snapshot e esvazia o journal
+
+        O checksum do snapshot novo é anexado ao journal antes da troca atômica; se o processo cair antes
+        de o journal ser removido, a próxima abertura reconhece pelo checksum que ele já foi incorporado.
+        """
+        df = self.load() if df is None else df
+        self.snapshot.save(df, before_replace=self._mark_compacted)
+
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        compacted = len(self.entries)
+        self.entries = []
+        self.base_checksum = None
+        print(f"🗜️ Journal compactado: {compacted} operações incorporadas ao snapshot ({len(df)} clientes)")
+        return df
+
+    def ensure_base(self, df):
+        """Garante que o snapshot corresponde a df antes de iniciar um journal novo
+
+        Os dados podem ter vindo do banco ou do armazenamento externo; sem operações pendentes,
+        o snapshot local é regravado apenas se estiver diferente.
+        """
+        if self.entries:
+            return
+        df = df[[column for column in CUSTOMER_COLUMNS if column in df.columns]]
+        if not self.snapshot.exists() or not comparable_customers(df).equals(comparable_customers(self.snapshot.load())):
+            self.compact(df)
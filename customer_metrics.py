@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Calculadora de métricas de clientes do dashboard (MRR, churn, LTV, coortes e cubo por segmento)
+engine='vectorized' agrega eventos mensais com NumPy; engine='loop' mantém o cálculo mês a mês como referência
+"""
+
+import calendar
+from datetime import datetime
+import pandas as pd
+from lifetime_index import LifetimeIndex
+from metrics_cache import make_cache_key
+from metrics_cube import MetricsCube
+from metrics_engine import (
+    calculate_monthly_metrics_from_events, calculate_ltv_frame, summarize_ltv, calculate_cohort_matrix,
+    tenure_months, calculate_churn_by_month, month_number
+)
+
+
+# Calculadora de métricas corrigida e robusta
+class MetricsCalculator:
+    def __init__(self, customers_df, engine='vectorized', cache=None):
+        # engine='vectorized' usa eventos mensais com NumPy; engine='loop' mantém o cálculo mês a mês como referência
+        if engine not in ('vectorized', 'loop'):
+            raise ValueError(f"Engine inválido: {engine}")
+        self.engine = engine
+        self.cache = cache
+        self.customers_df = customers_df.copy()
+        self._prepare_data()
+        self.lifetime_index = LifetimeIndex.from_dataframe(self.customers_df)
+    
+    def _prepare_data(self):
+        """Prepara e valida os dados para cálculos"""
+        if self.customers_df.empty:
+            return
+            
+        # Garantir que as datas estão no formato datetime
+        self.customers_df['signup_date'] = pd.to_datetime(self.customers_df['signup_date'], errors='coerce')
+        self.customers_df['cancel_date'] = pd.to_datetime(self.customers_df['cancel_date'], errors='coerce')
+        
+        # Garantir que plan_value é numérico
+        self.customers_df['plan_value'] = pd.to_numeric(self.customers_df['plan_value'], errors='coerce')
+        self.customers_df['plan_value'] = self.customers_df['plan_value'].fillna(0)
+        
+        # Remover linhas com dados inválidos
+        self.customers_df = self.customers_df.dropna(subset=['signup_date'])
+        
+        # Meses de casa no cancelamento (inteiro, nulo para ativos) e churn agregado por mês de cancelamento
+        self.customers_df['tenure_months'] = tenure_months(
+            self.customers_df['signup_date'], self.customers_df['cancel_date']
+        )
+        self._churn_table = calculate_churn_by_month(
+            self.customers_df['cancel_date'],
+            self.customers_df['tenure_months'],
+            self.customers_df['plan_value']
+        )
+    
+    def calculate_monthly_metrics(self):
+        if self.customers_df.empty:
+            return pd.DataFrame()
+        
+        if self.cache is None:
+            return self._compute_monthly_metrics()
+        
+        # Cópia para que alterações feitas pelos gráficos não contaminem o cache
+        key = make_cache_key('monthly_metrics', self.customers_df[['signup_date', 'cancel_date', 'plan_value']],
+                             engine=self.engine)
+        return self.cache.get_or_compute(key, self._compute_monthly_metrics).copy()
+    
+    def _compute_monthly_metrics(self):
+        """Calcula a tabela mensal com o engine configurado"""
+        if self.engine == 'loop':
+            return self._calculate_monthly_metrics_loop()
+        
+        start_date, end_date = self._get_analysis_period()
+        return calculate_monthly_metrics_from_events(
+            self.customers_df['signup_date'],
+            self.customers_df['cancel_date'],
+            self.customers_df['plan_value'],
+            start_date,
+            end_date,
+            churn_table=self._churn_table
+        )
+    
+    def _calculate_monthly_metrics_loop(self):
+        """Cálculo de referência mês a mês (O(meses × clientes))"""
+        start_date, end_date = self._get_analysis_period()
+        months = self._generate_month_list(start_date, end_date)
+        
+        metrics_list = []
+        for month_date in months:
+            month_str = month_date.strftime('%Y-%m')
+            new_customers = self._calculate_new_customers(month_date)
+            mrr = self._calculate_mrr(month_date)
+            avg_ticket = self._calculate_avg_ticket(month_date)
+            churn_customers, churn_mrr = self._calculate_churn(month_date)
+            
+            metrics_list.append({
+                'mes_ano': month_str,
+                'novos_clientes': int(new_customers),
+                'mrr': float(mrr),
+                'ticket_medio': float(avg_ticket),
+                'churn_clientes': int(churn_customers),
+                'churn_mrr': float(churn_mrr)
+            })
+        
+        return pd.DataFrame(metrics_list)
+    
+    def _get_analysis_period(self):
+        """Determina o período de análise com base nos dados"""
+        if self.customers_df.empty:
+            now = datetime.now()
+            return now.replace(day=1), now
+        
+        # Encontrar a primeira data de cadastro
+        min_signup = self.customers_df['signup_date'].min()
+        
+        # Encontrar a data mais recente (cadastro ou cancelamento)
+        max_date = self.customers_df['signup_date'].max()
+        cancel_dates = self.customers_df['cancel_date'].dropna()
+        if not cancel_dates.empty:
+            max_cancel = cancel_dates.max()
+            max_date = max(max_date, max_cancel)
+        
+        # Garantir que analisamos até o mês atual
+        now = datetime.now()
+        end_date = max(max_date, now)
+        
+        # Converter para o primeiro dia do mês à meia-noite (o horário do cadastro não pode cortar o último mês)
+        start_date = pd.Timestamp(min_signup).to_period('M').to_timestamp()
+        end_date = pd.Timestamp(end_date).to_period('M').to_timestamp()
+        
+        return start_date, end_date
+    
+    def _generate_month_list(self, start_date, end_date):
+        """Gera lista de primeiros dias de cada mês no período"""
+        months = []
+        current = start_date
+        
+        while current <= end_date:
+            months.append(current)
+            # Avançar para o próximo mês
+            if current.month == 12:
+                current = current.replace(year=current.year + 1, month=1)
+            else:
+                current = current.replace(month=current.month + 1)
+        
+        return months
+    
+    def _calculate_new_customers(self, month_date):
+        """Calcula novos clientes que se cadastraram no mês"""
+        month_start = month_date.replace(day=1)
+        month_end = self._get_month_end(month_date)
+        
+        new_customers = self.customers_df[
+            (self.customers_df['signup_date'] >= month_start) &
+            (self.customers_df['signup_date'] <= month_end)
+        ]
+        
+        return len(new_customers)
+    
+    def _calculate_mrr(self, month_date):
+        """Calcula MRR (clientes ativos no final do mês)"""
+        month_end = self._get_month_end(month_date)
+        
+        # Clientes que já tinham se cadastrado até o final do mês
+        # E que não tinham cancelado até o final do mês
+        return self.lifetime_index.active_at(month_end)['plan_value']
+    
+    def _calculate_avg_ticket(self, month_date):
+        """Calcula ticket médio dos clientes ativos no final do mês"""
+        month_end = self._get_month_end(month_date)
+        
+        active = self.lifetime_index.active_at(month_end)
+        
+        if active['count'] == 0:
+            return 0.0
+        
+        return active['plan_value'] / active['count']
+    
+    def _calculate_churn(self, month_date):
+        """Calcula churn de clientes e MRR no mês - apenas clientes com 2+ meses"""
+        # Consulta à tabela de churn pré-agregada por mês de cancelamento
+        month_key = month_number(month_date)
+        if month_key not in self._churn_table.index:
+            return 0, 0.0
+        
+        churn = self._churn_table.loc[month_key]
+        return int(churn['churn_clientes']), float(churn['churn_mrr'])
+    
+    def calculate_ltv_metrics(self):
+        """Calcula métricas de LTV (Lifetime Value) dos clientes"""
+        if self.customers_df.empty:
+            return {
+                'ltv_medio': 0.0,
+                'ltv_clientes_ativos': 0.0,
+                'ltv_clientes_cancelados': 0.0,
+                'tempo_vida_medio_meses': 0.0,
+                'total_clientes_analisados': 0
+            }
+        
+        if self.engine == 'loop':
+            return self._calculate_ltv_metrics_loop()
+        
+        ltv_df = calculate_ltv_frame(
+            self.customers_df['name'],
+            self.customers_df['signup_date'],
+            self.customers_df['cancel_date'],
+            self.customers_df['plan_value']
+        )
+        return summarize_ltv(ltv_df)
+    
+    def _calculate_ltv_metrics_loop(self):
+        """Cálculo de referência do LTV cliente a cliente"""
+        # Calcular LTV para cada cliente
+        ltv_data = []
+        current_date = pd.Timestamp.now()
+        
+        for _, cliente in self.customers_df.iterrows():
+            signup_date = cliente['signup_date']
+            cancel_date = cliente['cancel_date']
+            plan_value = cliente['plan_value']
+            
+            # Determinar data final (cancelamento ou data atual)
+            end_date = cancel_date if pd.notna(cancel_date) else current_date
+            
+            # Calcular meses de vida do cliente
+            months_active = max(1, (end_date.year - signup_date.year) * 12 + (end_date.month - signup_date.month))
+            
+            # LTV = valor mensal × meses ativos
+            ltv = plan_value * months_active
+            
+            ltv_data.append({
+                'cliente': cliente['name'],
+                'ltv': ltv,
+                'months_active': months_active,
+                'plan_value': plan_value,
+                'is_active': pd.isna(cancel_date),
+                'signup_date': signup_date,
+                'cancel_date': cancel_date
+            })
+        
+        ltv_df = pd.DataFrame(ltv_data)
+        
+        # Calcular métricas agregadas
+        ltv_medio = ltv_df['ltv'].mean()
+        ltv_clientes_ativos = ltv_df[ltv_df['is_active']]['ltv'].mean() if ltv_df['is_active'].any() else 0
+        ltv_clientes_cancelados = ltv_df[~ltv_df['is_active']]['ltv'].mean() if (~ltv_df['is_active']).any() else 0
+        tempo_vida_medio = ltv_df['months_active'].mean()
+        
+        return {
+            'ltv_medio': ltv_medio,
+            'ltv_clientes_ativos': ltv_clientes_ativos,
+            'ltv_clientes_cancelados': ltv_clientes_cancelados,
+            'tempo_vida_medio_meses': tempo_vida_medio,
+            'total_clientes_analisados': len(ltv_df),
+            'ltv_detalhado': ltv_df
+        }
+    
+    def calculate_metrics_cube(self):
+        """Cubo de métricas mensais por faixa de plano, status e ano de cadastro"""
+        if self.cache is None:
+            return MetricsCube(self.customers_df)
+        
+        key = make_cache_key('metrics_cube', self.customers_df[['signup_date', 'cancel_date', 'plan_value', 'status']])
+        return self.cache.get_or_compute(key, lambda: MetricsCube(self.customers_df))
+    
+    def calculate_cohort_metrics(self):
+        """Calcula retenção por coorte (logo e MRR): mês de cadastro × meses desde o cadastro"""
+        return calculate_cohort_matrix(
+            self.customers_df['signup_date'],
+            self.customers_df['cancel_date'],
+            self.customers_df['plan_value']
+        )
+    
+    def _get_month_end(self, month_date):
+        """Retorna o último momento do mês"""
+        last_day = calendar.monthrange(month_date.year, month_date.month)[1]
+        return month_date.replace(day=last_day, hour=23, minute=59, second=59, microsecond=999999)
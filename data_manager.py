@@ -2,11 +2,16 @@ import pandas as pd
 import os
 from datetime import datetime
 import streamlit as st
+from metrics_engine import stream_monthly_metrics
+from metrics_cache import MetricsCache
+from metrics_calculator import MetricsCalculator
 
 class DataManager:
-    def __init__(self):
+    def __init__(self, metrics_cache=None):
         self.customers_file = "customers.csv"
         self.sales_file = "sales.csv"
+        # Tabelas mensais reaproveitadas enquanto clientes e vendas não mudarem
+        self.metrics_cache = metrics_cache if metrics_cache is not None else MetricsCache()
         self._ensure_files_exist()
     
     def _ensure_files_exist(self):
@@ -49,6 +54,38 @@ class DataManager:
             st.error(f"Erro ao carregar vendas: {e}")
             return pd.DataFrame()
     
+    def iter_customer_chunks(self, chunksize=100_000):
+        """Lê o CSV de clientes em blocos de até chunksize linhas"""
+        return pd.read_csv(self.customers_file, chunksize=chunksize)
+    
+    def iter_sales_chunks(self, chunksize=100_000):
+        """Lê o CSV de vendas em blocos de até chunksize linhas"""
+        return pd.read_csv(self.sales_file, chunksize=chunksize)
+    
+    def calculate_monthly_metrics_streaming(self, chunksize=100_000):
+        """Métricas mensais (mesmo resultado do MetricsCalculator com vendas) sem carregar os CSVs inteiros
+        
+        A memória de pico fica limitada ao tamanho do bloco mais os agregados por mês.
+        """
+        try:
+            return stream_monthly_metrics(
+                self.iter_customer_chunks(chunksize),
+                self.iter_sales_chunks(chunksize),
+                mode='sales',
+                min_churn_tenure=None
+            )
+        except Exception as e:
+            st.error(f"Erro ao calcular métricas em blocos: {e}")
+            return pd.DataFrame()
+    
+    def get_metrics_calculator(self, engine='vectorized'):
+        """MetricsCalculator com vendas sobre os dados atuais, usando o cache de métricas"""
+        return MetricsCalculator(self.load_customers(), self.load_sales(), engine=engine, cache=self.metrics_cache)
+    
+    def get_summary_stats(self, engine='vectorized'):
+        """Estatísticas resumidas (a tabela mensal vem do cache quando os dados não mudaram)"""
+        return self.get_metrics_calculator(engine).get_summary_stats()
+    
     def add_customer(self, customer_id, name, signup_date, plan_value, status, cancel_date=None):
         """Adiciona um novo cliente"""
         try:
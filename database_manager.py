@@ -5,21 +5,382 @@ Sistema de persistência permanente na nuvem
 """
 
 import os
+import time
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text, MetaData, Table, Column, String, Float, Date, Integer
+from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 import streamlit as st
 from datetime import datetime
 import traceback
 from dotenv import load_dotenv
+from metrics_store import MIN_CHURN_TENURE, monthly_frame_from_deltas
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
+CUSTOMER_FIELDS = ['name', 'signup_date', 'plan_value', 'status', 'cancel_date']
+# Cargas completas a partir deste tamanho usam COPY em vez de INSERT em lotes
+BULK_LOAD_MIN_ROWS = 5000
+# Chave natural de um cliente: duplicatas com a mesma chave não são aceitas pelo banco
+NATURAL_KEY = ['name', 'signup_date', 'plan_value']
+CUSTOMER_STATUSES = ['Ativo', 'Cancelado']
+# Chave arbitrária do advisory lock que serializa a aplicação de migrações entre processos
+MIGRATIONS_LOCK_ID = 727401
+
+
+
+def _monthly_metrics_delta_sql(changes):
+    """Upsert dos deltas mensais das linhas de changes (sign, signup_date, cancel_date, plan_value)
+
+    Mesmas regras do MonthlyMetricsStore: +1 no mês do cadastro, -1 no mês de saída (nunca antes do cadastro)
+    e churn no mês do cancelamento para clientes com MIN_CHURN_TENURE+ meses. Meses zerados são removidos.
+    """
+    return f"""
+        WITH changes AS ({changes}),
+        deltas AS (
+            SELECT
+                CAST(date_trunc('month', signup_date) AS date) AS month,
+                sign AS new_customers,
+                sign AS active_delta,
+                sign * plan_value AS mrr_delta,
+                0 AS churn_customers,
+                CAST(0 AS double precision) AS churn_mrr
+            FROM changes
+            UNION ALL
+            SELECT CAST(date_trunc('month', GREATEST(cancel_date, signup_date)) AS date), 0, -sign, -sign * plan_value, 0, 0
+            FROM changes
+            WHERE cancel_date IS NOT NULL
+            UNION ALL
+            SELECT CAST(date_trunc('month', cancel_date) AS date), 0, 0, 0, sign, sign * plan_value
+            FROM changes
+            WHERE cancel_date IS NOT NULL
+              AND (EXTRACT(YEAR FROM cancel_date) - EXTRACT(YEAR FROM signup_date)) * 12
+                  + EXTRACT(MONTH FROM cancel_date) - EXTRACT(MONTH FROM signup_date) >= {MIN_CHURN_TENURE}
+        )
+        INSERT INTO customer_monthly_metrics AS m
+            (month, new_customers, active_delta, mrr_delta, churn_customers, churn_mrr)
+        SELECT month, SUM(new_customers), SUM(active_delta), SUM(mrr_delta), SUM(churn_customers), SUM(churn_mrr)
+        FROM deltas
+        GROUP BY month
+        ON CONFLICT (month) DO UPDATE SET
+            new_customers = m.new_customers + EXCLUDED.new_customers,
+            active_delta = m.active_delta + EXCLUDED.active_delta,
+            mrr_delta = m.mrr_delta + EXCLUDED.mrr_delta,
+            churn_customers = m.churn_customers + EXCLUDED.churn_customers,
+            churn_mrr = m.churn_mrr + EXCLUDED.churn_mrr;
+        DELETE FROM customer_monthly_metrics
+        WHERE new_customers = 0 AND active_delta = 0 AND churn_customers = 0;
+    """
+
+
+CUSTOMER_CHANGE_COLUMNS = "signup_date, cancel_date, plan_value"
+REBUILD_MONTHLY_METRICS_SQL = (
+    "DELETE FROM customer_monthly_metrics;"
+    + _monthly_metrics_delta_sql(f"SELECT 1 AS sign, {CUSTOMER_CHANGE_COLUMNS} FROM customers")
+)
+
+
+def _counters_delta_sql(changes):
+    """Atualiza os contadores de customers com as linhas de changes (sign, status)"""
+    return f"""
+        WITH changes AS ({changes})
+        UPDATE customer_counters AS c
+        SET total = c.total + d.total, active = c.active + d.active
+        FROM (
+            SELECT
+                COALESCE(SUM(sign), 0) AS total,
+                COALESCE(SUM(sign) FILTER (WHERE status = 'Ativo'), 0) AS active
+            FROM changes
+        ) AS d
+        WHERE c.id = 1 AND (d.total <> 0 OR d.active <> 0);
+    """
+
+
+def _statement_trigger_sql(target, event, transition, body):
+    """Função + trigger por comando em customers que mantém a tabela target (usa tabelas de transição)"""
+    function_name = f"{target}_on_{event.lower()}"
+    trigger_name = f"customers_{target.removeprefix('customer_')}_{event.lower()}"
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {function_name}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            {body}
+            RETURN NULL;
+        END
+        $$
+        """,
+        f"""
+        CREATE TRIGGER {trigger_name}
+        AFTER {event} ON customers
+        REFERENCING {transition}
+        FOR EACH STATEMENT EXECUTE FUNCTION {function_name}()
+        """
+    ]
+
+
+# Migrações versionadas do esquema: aplicadas em ordem, uma única vez, e registradas em schema_migrations
+SCHEMA_MIGRATIONS = [
+    (1, "Tabela customers", [
+        """
+        CREATE TABLE IF NOT EXISTS customers (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            signup_date DATE NOT NULL,
+            plan_value DOUBLE PRECISION NOT NULL,
+            status VARCHAR(50) NOT NULL,
+            cancel_date DATE
+        )
+        """
+    ]),
+    (2, "Status como enum", [
+        f"CREATE TYPE customer_status AS ENUM ({', '.join(repr(status) for status in CUSTOMER_STATUSES)})",
+        # Valores fora do enum viram o status implícito nas datas (cancelado se houver data de cancelamento)
+        """
+        ALTER TABLE customers
+        ALTER COLUMN status TYPE customer_status
+        USING CAST(CASE
+            WHEN lower(trim(status)) = 'ativo' THEN 'Ativo'
+            WHEN lower(trim(status)) = 'cancelado' THEN 'Cancelado'
+            WHEN cancel_date IS NOT NULL THEN 'Cancelado'
+            ELSE 'Ativo'
+        END AS customer_status)
+        """
+    ]),
+    (3, "Índices de datas e de clientes ativos", [
+        "CREATE INDEX IF NOT EXISTS idx_customers_signup_date ON customers (signup_date)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_cancel_date ON customers (cancel_date)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_active ON customers (signup_date) WHERE status = 'Ativo'"
+    ]),
+    # Só é aplicada sem duplicatas na tabela (ver _natural_key_conflicts); a limpeza é explícita
+    (4, "Chave natural única", [
+        # Verificada no commit: o sync pode trocar o conteúdo de duas linhas na mesma transação
+        """
+        ALTER TABLE customers
+        ADD CONSTRAINT customers_natural_key UNIQUE (name, signup_date, plan_value)
+        DEFERRABLE INITIALLY DEFERRED
+        """
+    ]),
+    (5, "Métricas mensais mantidas por triggers", [
+        """
+        CREATE TABLE customer_monthly_metrics (
+            month DATE PRIMARY KEY,
+            new_customers BIGINT NOT NULL DEFAULT 0,
+            active_delta BIGINT NOT NULL DEFAULT 0,
+            mrr_delta DOUBLE PRECISION NOT NULL DEFAULT 0,
+            churn_customers BIGINT NOT NULL DEFAULT 0,
+            churn_mrr DOUBLE PRECISION NOT NULL DEFAULT 0
+        )
+        """,
+        *_statement_trigger_sql('customer_monthly_metrics', 'INSERT', 'NEW TABLE AS new_rows', _monthly_metrics_delta_sql(
+            f"SELECT 1 AS sign, {CUSTOMER_CHANGE_COLUMNS} FROM new_rows"
+        )),
+        *_statement_trigger_sql('customer_monthly_metrics', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows', _monthly_metrics_delta_sql(
+            f"SELECT -1 AS sign, {CUSTOMER_CHANGE_COLUMNS} FROM old_rows "
+            f"UNION ALL SELECT 1, {CUSTOMER_CHANGE_COLUMNS} FROM new_rows"
+        )),
+        *_statement_trigger_sql('customer_monthly_metrics', 'DELETE', 'OLD TABLE AS old_rows', _monthly_metrics_delta_sql(
+            f"SELECT -1 AS sign, {CUSTOMER_CHANGE_COLUMNS} FROM old_rows"
+        )),
+        # TRUNCATE (carga em lote) não dispara triggers por linha: zera a tabela mensal junto
+        """
+        CREATE OR REPLACE FUNCTION customer_monthly_metrics_on_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            DELETE FROM customer_monthly_metrics;
+            RETURN NULL;
+        END
+        $$
+        """,
+        """
+        CREATE TRIGGER customers_monthly_metrics_truncate
+        AFTER TRUNCATE ON customers
+        FOR EACH STATEMENT EXECUTE FUNCTION customer_monthly_metrics_on_truncate()
+        """,
+        REBUILD_MONTHLY_METRICS_SQL
+    ]),
+    (6, "Contadores de clientes mantidos por triggers", [
+        """
+        CREATE TABLE customer_counters (
+            id SMALLINT PRIMARY KEY CHECK (id = 1),
+            total BIGINT NOT NULL,
+            active BIGINT NOT NULL
+        )
+        """,
+        """
+        INSERT INTO customer_counters (id, total, active)
+        SELECT 1, COUNT(*), COUNT(*) FILTER (WHERE status = 'Ativo')
+        FROM customers
+        """,
+        *_statement_trigger_sql('customer_counters', 'INSERT', 'NEW TABLE AS new_rows', _counters_delta_sql(
+            "SELECT 1 AS sign, status FROM new_rows"
+        )),
+        *_statement_trigger_sql('customer_counters', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows', _counters_delta_sql(
+            "SELECT -1 AS sign, status FROM old_rows UNION ALL SELECT 1, status FROM new_rows"
+        )),
+        *_statement_trigger_sql('customer_counters', 'DELETE', 'OLD TABLE AS old_rows', _counters_delta_sql(
+            "SELECT -1 AS sign, status FROM old_rows"
+        )),
+        """
+        CREATE OR REPLACE FUNCTION customer_counters_on_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE customer_counters SET total = 0, active = 0 WHERE id = 1;
+            RETURN NULL;
+        END
+        $$
+        """,
+        """
+        CREATE TRIGGER customers_counters_truncate
+        AFTER TRUNCATE ON customers
+        FOR EACH STATEMENT EXECUTE FUNCTION customer_counters_on_truncate()
+        """
+    ])
+]
+NATURAL_KEY_VERSION = 4
+MONTHLY_METRICS_VERSION = 5
+COUNTERS_VERSION = 6
+# Quantos grupos duplicados o relatório da migração da chave natural lista
+NATURAL_KEY_REPORT_LIMIT = 20
+# Estatísticas da página Admin ficam em cache por alguns segundos entre reruns do Streamlit
+STATS_TTL_SECONDS = 10
+
+
+def normalize_customer_rows(df):
+    """Normaliza clientes para comparação e gravação: textos, datas (date ou None) e valores float
+
+    status segue o mesmo mapeamento da migração 2 (enum customer_status): valores vazios ou desconhecidos
+    viram 'Cancelado' quando há data de cancelamento e 'Ativo' caso contrário.
+    """
+    signup = pd.to_datetime(df['signup_date'], errors='coerce')
+    cancel = pd.to_datetime(df['cancel_date'], errors='coerce')
+    status = df['status'].astype(object).where(df['status'].notna(), '').astype(str).str.strip().str.lower()
+    return pd.DataFrame({
+        'name': df['name'].astype(object).where(df['name'].notna(), '').astype(str).to_numpy(),
+        'signup_date': signup.dt.date.astype(object).where(signup.notna(), None).to_numpy(),
+        'plan_value': pd.to_numeric(df['plan_value'], errors='coerce').fillna(0).astype(float).round(6).to_numpy(),
+        'status': np.select(
+            [status == 'ativo', status == 'cancelado', cancel.notna()],
+            ['Ativo', 'Cancelado', 'Cancelado'],
+            default='Ativo'
+        ).astype(object),
+        'cancel_date': cancel.dt.date.astype(object).where(cancel.notna(), None).to_numpy()
+    })
+
+
+def natural_key_matches(df, customer):
+    """Posições de df com a mesma chave natural de customer (nome, cadastro, valor)"""
+    if df.empty:
+        return np.zeros(0, dtype=np.int64)
+    rows = normalize_customer_rows(df)
+    key = normalize_customer_rows(pd.DataFrame([customer])).iloc[0]
+    matches = np.ones(len(rows), dtype=bool)
+    for column in NATURAL_KEY:
+        matches &= (rows[column] == key[column]).to_numpy()
+    return np.flatnonzero(matches)
+
+
+def drop_natural_duplicates(rows):
+    """Mantém só a primeira ocorrência de cada chave natural (linhas já normalizadas)
+
+    As escritas do app já recusam duplicatas (natural_key_matches); isto só protege a constraint
+    contra dados antigos importados com repetições.
+    """
+    duplicated = rows.duplicated(subset=NATURAL_KEY, keep='first')
+    if not duplicated.any():
+        return rows
+    print(f"⚠️ {int(duplicated.sum())} clientes duplicados de dados antigos ignorados na gravação")
+    return rows.loc[~duplicated.to_numpy()].reset_index(drop=True)
+
+
+def _row_hashes(normalized):
+    """Hash de conteúdo por linha (datas como texto para não depender do tipo de origem)"""
+    keyed = normalized.astype({'signup_date': str, 'cancel_date': str})
+    return pd.util.hash_pandas_object(keyed, index=False).to_numpy()
+
+
+def plan_customer_sync(db_ids, db_rows, target_rows):
+    """Calcula o diff entre as linhas do banco (ordenadas por id) e as linhas desejadas
+
+    Linhas iguais são casadas por hash de conteúdo (repetições casadas por ordem de ocorrência).
+    As sobras entre duas linhas casadas viram UPDATE no mesmo id (preserva a posição);
+    sobras extras do banco viram DELETE e sobras novas só podem virar INSERT no final,
+    pois novos ids sempre entram depois dos existentes. Retorna None quando a ordem desejada
+    não pode ser obtida com um diff (nesse caso a sincronização completa é usada).
+    """
+    db_ids = np.asarray(db_ids, dtype=np.int64)
+    db_keys = pd.DataFrame({'hash': _row_hashes(db_rows) if len(db_rows) else np.zeros(0, dtype=np.uint64)})
+    target_keys = pd.DataFrame({'hash': _row_hashes(target_rows) if len(target_rows) else np.zeros(0, dtype=np.uint64)})
+    db_keys['occurrence'] = db_keys.groupby('hash').cumcount()
+    target_keys['occurrence'] = target_keys.groupby('hash').cumcount()
+    db_keys['db_pos'] = np.arange(len(db_keys))
+    target_keys['target_pos'] = np.arange(len(target_keys))
+
+    matched = target_keys.merge(db_keys, on=['hash', 'occurrence']).sort_values('target_pos')
+    if not np.all(np.diff(matched['db_pos'].to_numpy()) > 0):
+        return None
+
+    # Lacuna de cada sobra = quantidade de linhas casadas antes dela
+    matched_target = matched['target_pos'].to_numpy()
+    matched_db = matched['db_pos'].to_numpy()
+    target_left = np.setdiff1d(np.arange(len(target_keys)), matched_target)
+    db_left = np.setdiff1d(np.arange(len(db_keys)), matched_db)
+    target_gap = np.searchsorted(matched_target, target_left)
+    db_gap = np.searchsorted(matched_db, db_left)
+
+    updates, inserts, deletes = [], [], []
+    last_gap = len(matched)
+    for gap in np.union1d(target_gap, db_gap):
+        targets = target_left[target_gap == gap]
+        olds = db_left[db_gap == gap]
+        paired = min(len(targets), len(olds))
+        updates.extend(zip(db_ids[olds[:paired]], targets[:paired]))
+        deletes.extend(db_ids[olds[paired:]])
+        if len(targets) > paired:
+            if gap != last_gap:
+                return None
+            inserts.extend(targets[paired:])
+
+    return {
+        'updates': [(int(row_id), int(pos)) for row_id, pos in updates],
+        'inserts': [int(pos) for pos in inserts],
+        'deletes': [int(row_id) for row_id in deletes],
+        'unchanged': len(matched)
+    }
+
+
+class _CsvChunkStream:
+    """Arquivo somente leitura que gera o CSV do DataFrame sob demanda, em blocos de linhas"""
+    
+    def __init__(self, df, chunk_rows):
+        self._chunks = (
+            df.iloc[start:start + chunk_rows].to_csv(header=False, index=False, na_rep='\\N')
+            for start in range(0, len(df), chunk_rows)
+        )
+        self._buffer = ''
+    
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
 class DatabaseManager:
+    # Escritas pontuais passam pelo journal local e chegam ao banco na compactação
+    supports_point_writes = False
+    
     def __init__(self):
         self.engine = None
-        self.metadata = MetaData()
+        self.schema_version = 0
+        self.last_sync_stats = None
+        # Grupos duplicados que impedem a migração da chave natural (vazio se não houver)
+        self.natural_key_conflicts = []
+        self._status_cache = {}
         self._setup_connection()
         self._setup_tables()
     
@@ -53,40 +414,101 @@ class DatabaseManager:
             self.engine = None
     
     def _setup_tables(self):
-        """Cria tabelas se não existirem"""
+        """Aplica as migrações pendentes do esquema (nada a fazer se já estiver na última versão)"""
         if not self.engine:
             return
         
+        latest_version = SCHEMA_MIGRATIONS[-1][0]
         try:
-            # Definir estrutura da tabela customers
-            self.customers_table = Table(
-                'customers',
-                self.metadata,
-                Column('id', Integer, primary_key=True, autoincrement=True),
-                Column('name', String(255), nullable=False),
-                Column('signup_date', Date, nullable=False),
-                Column('plan_value', Float, nullable=False),
-                Column('status', String(50), nullable=False),
-                Column('cancel_date', Date, nullable=True),
-                extend_existing=True
-            )
+            with self.engine.connect() as conn:
+                self.schema_version = self._current_schema_version(conn)
+            if self.schema_version >= latest_version:
+                return
             
-            # Criar tabelas
-            self.metadata.create_all(self.engine)
-            print("✅ Tabelas do banco criadas/verificadas")
+            with self.engine.begin() as conn:
+                # Outro processo pode estar migrando: espera o lock e relê a versão
+                conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {'lock_id': MIGRATIONS_LOCK_ID})
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TIMESTAMP NOT NULL DEFAULT now()
+                    )
+                """))
+                applied = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+                
+                for version, description, statements in SCHEMA_MIGRATIONS:
+                    if version in applied:
+                        continue
+                    if version == NATURAL_KEY_VERSION:
+                        self.natural_key_conflicts = self._natural_key_conflicts(conn)
+                        if self.natural_key_conflicts:
+                            # Nada é apagado aqui: as migrações seguintes esperam a limpeza explícita
+                            self._report_natural_key_conflicts()
+                            break
+                    for statement in statements:
+                        conn.execute(text(statement))
+                    conn.execute(
+                        text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                        {'version': version, 'description': description}
+                    )
+                    print(f"✅ Migração {version} aplicada: {description}")
+                    applied.add(version)
+            
+            self.schema_version = max(applied, default=0)
             
         except Exception as e:
-            print(f"❌ Erro ao criar tabelas: {e}")
+            print(f"❌ Erro ao aplicar migrações do banco: {e}")
+    
+    def _natural_key_conflicts(self, conn):
+        """Grupos de linhas com a mesma chave natural (name, signup_date, plan_value) e seus ids"""
+        result = conn.execute(text("""
+            SELECT name, signup_date, plan_value, array_agg(id ORDER BY id) AS ids
+            FROM customers
+            GROUP BY name, signup_date, plan_value
+            HAVING COUNT(*) > 1
+            ORDER BY MIN(id)
+        """))
+        return [dict(row._mapping) for row in result]
+    
+    def _report_natural_key_conflicts(self):
+        """Lista as duplicatas que impedem a restrição única da chave natural"""
+        conflicts = self.natural_key_conflicts
+        print(f"⚠️ Migração {NATURAL_KEY_VERSION} pendente: {len(conflicts)} grupos de clientes duplicados no banco")
+        for conflict in conflicts[:NATURAL_KEY_REPORT_LIMIT]:
+            print(f"   - {conflict['name']} | {conflict['signup_date']} | {conflict['plan_value']}: ids {conflict['ids']}")
+        if len(conflicts) > NATURAL_KEY_REPORT_LIMIT:
+            print(f"   ... e mais {len(conflicts) - NATURAL_KEY_REPORT_LIMIT} grupos")
+        print("   Revise os registros e use 'Limpar Duplicatas' (clean_duplicate_data) para concluir a migração")
+    
+    def _current_schema_version(self, conn):
+        """Última migração aplicada (0 se a tabela de controle ainda não existir)"""
+        if conn.execute(text("SELECT to_regclass('schema_migrations')")).scalar() is None:
+            return 0
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
     
     def is_connected(self):
         """Verifica se está conectado ao banco"""
         return self.engine is not None
     
-    def save_customers(self, df):
-        """Salva dados de clientes no banco com proteção contra duplicatas"""
+    def save_customers(self, df, mode='sync'):
+        """Salva dados de clientes no banco com proteção contra duplicatas
+        
+        mode='sync' aplica apenas o diff (inserções, atualizações e remoções em lote);
+        mode='bulk' substitui tudo via COPY; mode='replace' apaga a tabela e reinsere linha a linha.
+        """
         if not self.is_connected():
             return False
         
+        if mode == 'sync':
+            return self.sync_customers(df) is not None
+        if mode == 'bulk':
+            return self.bulk_load_customers(df)
+        
+        rows = pd.DataFrame(columns=CUSTOMER_FIELDS)
+        if not df.empty:
+            rows = drop_natural_duplicates(normalize_customer_rows(df))
+        
         try:
             with self.engine.connect() as conn:
                 # Iniciar transação para operação atômica
@@ -96,24 +518,14 @@ class DatabaseManager:
                     # Limpar dados existentes primeiro
                     conn.execute(text("DELETE FROM customers"))
                     
-                    # Inserir novos dados
-                    for _, row in df.iterrows():
-                        # Converter datas para o formato correto
-                        signup_date = pd.to_datetime(row['signup_date']).date() if pd.notna(row['signup_date']) else None
-                        cancel_date = pd.to_datetime(row['cancel_date']).date() if pd.notna(row['cancel_date']) else None
-                        
+                    # Inserir novos dados (já normalizados: datas como date e status válido para o enum)
+                    for row in rows.to_dict('records'):
                         conn.execute(
                             text("""
                                 INSERT INTO customers (name, signup_date, plan_value, status, cancel_date)
                                 VALUES (:name, :signup_date, :plan_value, :status, :cancel_date)
                             """),
-                            {
-                                'name': str(row['name']),
-                                'signup_date': signup_date,
-                                'plan_value': float(row['plan_value']),
-                                'status': str(row['status']),
-                                'cancel_date': cancel_date
-                            }
+                            row
                         )
                     
                     # Confirmar transação
@@ -123,11 +535,12 @@ class DatabaseManager:
                     result = conn.execute(text("SELECT COUNT(*) FROM customers"))
                     count = result.fetchone()[0]
                     
-                    if count == len(df):
-                        print(f"✅ {len(df)} clientes salvos no banco de dados (verificado: {count})")
+                    if count == len(rows):
+                        print(f"✅ {len(rows)} clientes salvos no banco de dados (verificado: {count})")
+                        self._status_cache.clear()
                         return True
                     else:
-                        print(f"❌ Erro na verificação: esperado {len(df)}, encontrado {count}")
+                        print(f"❌ Erro na verificação: esperado {len(rows)}, encontrado {count}")
                         return False
                         
                 except Exception as e:
@@ -140,11 +553,172 @@ class DatabaseManager:
             traceback.print_exc()
             return False
     
+    def sync_customers(self, df, batch_size=1000):
+        """Sincroniza a tabela com df aplicando só o diff; retorna as contagens de linhas tocadas"""
+        if not self.is_connected():
+            return None
+        
+        try:
+            target_rows = pd.DataFrame(columns=CUSTOMER_FIELDS)
+            if not df.empty:
+                target_rows = drop_natural_duplicates(normalize_customer_rows(df))
+            
+            with self.engine.begin() as conn:
+                db_df = pd.read_sql(text("""
+                    SELECT id, name, signup_date, plan_value, status, cancel_date
+                    FROM customers
+                    ORDER BY id
+                """), conn)
+                db_rows = normalize_customer_rows(db_df) if not db_df.empty else pd.DataFrame(columns=CUSTOMER_FIELDS)
+                
+                plan = plan_customer_sync(db_df['id'].to_numpy(), db_rows, target_rows)
+                # Reordenação que um diff não representa, ou carga completa grande: usa o COPY em lote
+                full_reload = plan is None or (
+                    plan['unchanged'] == 0 and len(plan['inserts']) >= BULK_LOAD_MIN_ROWS
+                )
+                if full_reload:
+                    plan = {'updates': [], 'inserts': [], 'deletes': [], 'unchanged': 0}
+                
+                for start in range(0, len(plan['deletes']), batch_size):
+                    conn.execute(
+                        text("DELETE FROM customers WHERE id = ANY(:ids)"),
+                        {'ids': plan['deletes'][start:start + batch_size]}
+                    )
+                
+                for start in range(0, len(plan['updates']), batch_size):
+                    batch = plan['updates'][start:start + batch_size]
+                    rows = target_rows.iloc[[pos for _, pos in batch]]
+                    conn.execute(
+                        text("""
+                            UPDATE customers AS c
+                            SET name = v.name, signup_date = v.signup_date, plan_value = v.plan_value,
+                                status = v.status, cancel_date = v.cancel_date
+                            FROM unnest(
+                                CAST(:ids AS integer[]), CAST(:names AS text[]), CAST(:signup_dates AS date[]),
+                                CAST(:plan_values AS double precision[]), CAST(:statuses AS customer_status[]), CAST(:cancel_dates AS date[])
+                            ) AS v(id, name, signup_date, plan_value, status, cancel_date)
+                            WHERE c.id = v.id
+                        """),
+                        {
+                            'ids': [row_id for row_id, _ in batch],
+                            'names': rows['name'].tolist(),
+                            'signup_dates': rows['signup_date'].tolist(),
+                            'plan_values': rows['plan_value'].tolist(),
+                            'statuses': rows['status'].tolist(),
+                            'cancel_dates': rows['cancel_date'].tolist()
+                        }
+                    )
+                
+                insert_rows = target_rows.iloc[plan['inserts']].to_dict('records')
+                for start in range(0, len(insert_rows), batch_size):
+                    conn.execute(
+                        text("""
+                            INSERT INTO customers (name, signup_date, plan_value, status, cancel_date)
+                            VALUES (:name, :signup_date, :plan_value, :status, :cancel_date)
+                        """),
+                        insert_rows[start:start + batch_size]
+                    )
+                
+                if full_reload:
+                    # COPY na mesma transação da leitura do diff: nenhuma escrita concorrente entra entre os dois
+                    cursor = conn.connection.cursor()
+                    self._copy_replace_customers(cursor, target_rows)
+                    cursor.close()
+            
+            if full_reload:
+                print(f"✅ {len(target_rows)} clientes carregados no banco via COPY")
+                plan = {
+                    'updates': [],
+                    'inserts': list(range(len(target_rows))),
+                    'deletes': db_df['id'].astype(int).tolist(),
+                    'unchanged': 0
+                }
+            
+            stats = {
+                'inserted': len(plan['inserts']),
+                'updated': len(plan['updates']),
+                'deleted': len(plan['deletes']),
+                'unchanged': plan['unchanged']
+            }
+            stats['touched'] = stats['inserted'] + stats['updated'] + stats['deleted']
+            self.last_sync_stats = stats
+            self._status_cache.clear()
+            print(f"✅ Banco sincronizado: {stats['inserted']} inseridos, {stats['updated']} atualizados, "
+                  f"{stats['deleted']} removidos, {stats['unchanged']} inalterados")
+            return stats
+            
+        except Exception as e:
+            print(f"❌ Erro ao sincronizar com o banco: {e}")
+            traceback.print_exc()
+            return None
+    
+    def bulk_load_customers(self, df, chunk_rows=50_000):
+        """Substitui todos os clientes via COPY: DataFrame → tabela temporária → troca atômica
+        
+        O CSV é gerado em blocos de chunk_rows linhas enquanto o COPY consome o stream;
+        TRUNCATE + INSERT ... SELECT rodam na mesma transação (leitores veem os dados antigos ou os novos).
+        """
+        if not self.is_connected():
+            return False
+        
+        rows = pd.DataFrame(columns=CUSTOMER_FIELDS)
+        if not df.empty:
+            rows = drop_natural_duplicates(normalize_customer_rows(df))
+        
+        raw_conn = self.engine.raw_connection()
+        try:
+            cursor = raw_conn.cursor()
+            self._copy_replace_customers(cursor, rows, chunk_rows)
+            raw_conn.commit()
+            cursor.close()
+            print(f"✅ {len(rows)} clientes carregados no banco via COPY")
+            self._status_cache.clear()
+            return True
+            
+        except Exception as e:
+            raw_conn.rollback()
+            print(f"❌ Erro na carga em lote: {e}")
+            traceback.print_exc()
+            return False
+        finally:
+            raw_conn.close()
+    
+    def _copy_replace_customers(self, cursor, rows, chunk_rows=50_000):
+        """Troca o conteúdo da tabela pelas linhas normalizadas via COPY, na transação aberta do cursor"""
+        rows = rows.copy()
+        rows.insert(0, 'position', np.arange(len(rows)))
+        cursor.execute("""
+            CREATE TEMP TABLE customers_staging (
+                position bigint,
+                name text,
+                signup_date date,
+                plan_value double precision,
+                status text,
+                cancel_date date
+            ) ON COMMIT DROP
+        """)
+        cursor.copy_expert(
+            "COPY customers_staging (position, name, signup_date, plan_value, status, cancel_date) "
+            "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            _CsvChunkStream(rows, chunk_rows)
+        )
+        cursor.execute("TRUNCATE customers RESTART IDENTITY")
+        cursor.execute("""
+            INSERT INTO customers (name, signup_date, plan_value, status, cancel_date)
+            SELECT name, signup_date, plan_value, CAST(status AS customer_status), cancel_date
+            FROM customers_staging
+            ORDER BY position
+        """)
+    
     def clean_duplicate_data(self):
         """Remove dados duplicados do banco"""
         if not self.is_connected():
             return False
         
+        if self.schema_version >= NATURAL_KEY_VERSION:
+            print("✅ Chave natural única ativa - não há duplicatas a remover")
+            return True
+        
         try:
             with self.engine.connect() as conn:
                 # Remover duplicatas mantendo apenas o primeiro registro de cada cliente
@@ -164,7 +738,12 @@ class DatabaseManager:
                 conn.commit()
                 
                 print(f"✅ Limpeza de duplicatas concluída. Registros restantes: {count}")
-                return True
+                self._status_cache.clear()
+            
+            # Sem duplicatas, as migrações que esperavam a limpeza podem ser aplicadas
+            self.natural_key_conflicts = []
+            self._setup_tables()
+            return True
                 
         except Exception as e:
             print(f"❌ Erro ao limpar duplicatas: {e}")
@@ -181,37 +760,53 @@ class DatabaseManager:
                 conn.commit()
                 
                 print("✅ Banco de dados limpo completamente")
+                self._status_cache.clear()
                 return True
                 
         except Exception as e:
             print(f"❌ Erro ao limpar banco: {e}")
             return False
     
+    def _cached(self, key, compute):
+        """Resultado recente de compute (até STATS_TTL_SECONDS); falhas (None) não entram no cache"""
+        now = time.monotonic()
+        cached = self._status_cache.get(key)
+        if cached and now - cached[0] < STATS_TTL_SECONDS:
+            return cached[1]
+        
+        value = compute()
+        if value is not None:
+            self._status_cache[key] = (now, value)
+        return value
+    
     def get_database_stats(self):
-        """Retorna estatísticas do banco"""
+        """Retorna estatísticas do banco (uma consulta, com cache curto)"""
         if not self.is_connected():
             return None
-        
+        return self._cached('stats', self._query_database_stats)
+    
+    def _query_database_stats(self):
         try:
             with self.engine.connect() as conn:
-                # Total de registros
-                result = conn.execute(text("SELECT COUNT(*) FROM customers"))
-                total = result.fetchone()[0]
-                
-                # Clientes ativos
-                result = conn.execute(text("SELECT COUNT(*) FROM customers WHERE status = 'Ativo'"))
-                active = result.fetchone()[0]
-                
-                # Possíveis duplicatas
-                result = conn.execute(text("""
-                    SELECT COUNT(*) FROM (
-                        SELECT name, signup_date, plan_value, COUNT(*) as cnt
-                        FROM customers 
-                        GROUP BY name, signup_date, plan_value
-                        HAVING COUNT(*) > 1
-                    ) as duplicates
-                """))
-                duplicates = result.fetchone()[0]
+                if self.schema_version >= COUNTERS_VERSION:
+                    # Contadores mantidos por triggers; a chave natural única impede duplicatas
+                    total, active = conn.execute(text(
+                        "SELECT total, active FROM customer_counters WHERE id = 1"
+                    )).fetchone()
+                    duplicates = 0
+                else:
+                    total, active, duplicates = conn.execute(text("""
+                        SELECT
+                            COUNT(*),
+                            COUNT(*) FILTER (WHERE status = 'Ativo'),
+                            (SELECT COUNT(*) FROM (
+                                SELECT 1
+                                FROM customers
+                                GROUP BY name, signup_date, plan_value
+                                HAVING COUNT(*) > 1
+                            ) AS duplicates)
+                        FROM customers
+                    """)).fetchone()
                 
                 return {
                     'total': total,
@@ -249,6 +844,57 @@ class DatabaseManager:
             print(f"❌ Erro ao carregar do banco: {e}")
             return pd.DataFrame()
     
+    def calculate_monthly_metrics(self, as_of=None):
+        """Tabela mensal calculada no servidor (uma linha por mês); None se não for possível"""
+        if not self.is_connected():
+            return None
+        
+        try:
+            from sql_metrics import SqlMetricsProvider
+            monthly_metrics = SqlMetricsProvider(self.engine).calculate_monthly_metrics(as_of)
+            print(f"✅ Métricas mensais calculadas no banco ({len(monthly_metrics)} meses)")
+            return monthly_metrics
+        except Exception as e:
+            print(f"❌ Erro ao calcular métricas no banco: {e}")
+            return None
+    
+    def load_monthly_metrics(self, as_of=None):
+        """Tabela mensal a partir de customer_monthly_metrics (mantida por triggers) em O(meses)"""
+        if not self.is_connected():
+            return None
+        if self.schema_version < MONTHLY_METRICS_VERSION:
+            return self.calculate_monthly_metrics(as_of)
+        
+        try:
+            deltas = pd.read_sql(text("""
+                SELECT month, new_customers, active_delta, mrr_delta, churn_customers, churn_mrr
+                FROM customer_monthly_metrics
+            """), self.engine)
+            months = {
+                int(np.datetime64(row.month, 'M').astype(np.int64)): [
+                    row.new_customers, row.active_delta, row.mrr_delta, row.churn_customers, row.churn_mrr
+                ]
+                for row in deltas.itertuples(index=False)
+            }
+            return monthly_frame_from_deltas(months, as_of)
+        except Exception as e:
+            print(f"❌ Erro ao carregar métricas mensais do banco: {e}")
+            return None
+    
+    def rebuild_monthly_metrics(self):
+        """Recalcula customer_monthly_metrics a partir da tabela customers"""
+        if not self.is_connected() or self.schema_version < MONTHLY_METRICS_VERSION:
+            return False
+        
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text(REBUILD_MONTHLY_METRICS_SQL))
+            print("✅ Métricas mensais do banco reconstruídas")
+            return True
+        except Exception as e:
+            print(f"❌ Erro ao reconstruir métricas mensais do banco: {e}")
+            return False
+    
     def test_connection(self):
         """Testa conexão e retorna status detalhado"""
         if not self.engine:
@@ -259,24 +905,16 @@ class DatabaseManager:
         
         try:
             with self.engine.connect() as conn:
-                result = conn.execute(text("SELECT version()"))
-                version_info = result.fetchone()[0]
-                
-                # Verificar se tabela existe
-                table_check = conn.execute(text("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_name = 'customers'
-                    )
-                """))
-                table_exists = table_check.fetchone()[0]
-                
-                # Contar registros
-                if table_exists:
-                    count_result = conn.execute(text("SELECT COUNT(*) FROM customers"))
-                    record_count = count_result.fetchone()[0]
+                # Uma ida ao banco: versão, existência da tabela e contagem (dos contadores, quando existirem)
+                if self.schema_version >= COUNTERS_VERSION:
+                    record_count_sql = "(SELECT total FROM customer_counters WHERE id = 1)"
+                elif self.schema_version > 0:
+                    record_count_sql = "(SELECT COUNT(*) FROM customers)"
                 else:
-                    record_count = 0
+                    record_count_sql = "0"
+                version_info, table_exists, record_count = conn.execute(text(f"""
+                    SELECT version(), to_regclass('customers') IS NOT NULL, {record_count_sql}
+                """)).fetchone()
                 
                 return {
                     'connected': True,
@@ -294,7 +932,7 @@ class DatabaseManager:
     
     def get_connection_status(self):
         """Retorna status de conexão formatado para exibição"""
-        status = self.test_connection()
+        status = self._cached('connection', self.test_connection)
         
         if status['connected']:
             return f"""
@@ -308,4 +946,13 @@ class DatabaseManager:
             ❌ **Não conectado ao banco**
             - Erro: {status['error']}
             - Usando armazenamento local CSV
-            """
\ No newline at end of file
+            """
+
+
+def create_database_manager():
+    """PostgreSQL quando DATABASE_URL estiver configurada; senão o banco SQLite local"""
+    if os.getenv('DATABASE_URL'):
+        return DatabaseManager()
+    
+    from sqlite_manager import SQLiteManager
+    return SQLiteManager()
@@ -1,12 +0,0 @@
-#!/usr/bin/env python3
-"""
-Dados persistentes do dashboard - Gerado automaticamente
-Timestamp: 2025-07-15T18:30:06.955311
-"""
-
-CUSTOMER_DATA = []
-
-def get_embedded_data():
-    """Retorna dados embeddidos"""
-    import pandas as pd
-    return pd.DataFrame(CUSTOMER_DATA)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Índice de tempo de vida dos clientes
+Responde "quem está ativo no instante T" com busca binária em vez de varrer o DataFrame
+"""
+
+import numpy as np
+import pandas as pd
+
+# Datas ausentes viram "infinito" (cliente sem cancelamento fica ativo para sempre)
+NO_DATE = np.iinfo(np.int64).max
+
+
+def _to_ns(dates):
+    """Converte datas em inteiros (nanossegundos); NaT vira NO_DATE"""
+    values = pd.to_datetime(pd.Series(dates), errors='coerce')
+    ns = values.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    ns[values.isna().to_numpy()] = NO_DATE
+    return ns
+
+
+def _timestamp_ns(ts):
+    return np.int64(pd.Timestamp(ts).value)
+
+
+class LifetimeIndex:
+    """Arrays ordenados de cadastro e saída com somas prefixadas de plan_value
+
+    Um cliente está ativo em T quando signup_date <= T e (cancel_date é nulo ou cancel_date > T).
+    Usando saída = max(cancel_date, signup_date), ativos(T) = #(signup <= T) - #(saída <= T).
+    """
+
+    def __init__(self, signup_dates, cancel_dates, plan_values):
+        signup = _to_ns(signup_dates)
+        cancel = _to_ns(cancel_dates)
+        # Cancelamento anterior ao cadastro nunca fica ativo
+        exit_ = np.maximum(cancel, signup)
+        values = pd.to_numeric(pd.Series(plan_values), errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+        self.size = len(signup)
+        self._signup = signup
+        self._exit = exit_
+        self._signup_order = np.argsort(signup, kind='stable')
+        self._signup_sorted = signup[self._signup_order]
+        self._signup_prefix = np.concatenate(([0.0], np.cumsum(values[self._signup_order])))
+
+        self._exit_order = np.argsort(exit_, kind='stable')
+        self._exit_sorted = exit_[self._exit_order]
+        self._exit_prefix = np.concatenate(([0.0], np.cumsum(values[self._exit_order])))
+
+    @classmethod
+    def from_dataframe(cls, customers_df):
+        return cls(customers_df['signup_date'], customers_df['cancel_date'], customers_df['plan_value'])
+
+    def _bounds(self, signup_limit, exit_limit):
+        """Posições de corte: #(signup <= signup_limit) e #(saída <= exit_limit)"""
+        started = np.searchsorted(self._signup_sorted, signup_limit, side='right')
+        exited = np.searchsorted(self._exit_sorted, exit_limit, side='right')
+        return started, exited
+
+    def _summarize(self, started, exited):
+        count = started - exited
+        plan_value = self._signup_prefix[started] - self._exit_prefix[exited]
+        return count, np.where(count > 0, plan_value, 0.0)
+
+    def active_at(self, ts):
+        """Quantidade e soma de plan_value dos clientes ativos em ts - O(log n)"""
+        count, plan_value = self._summarize(*self._bounds(_timestamp_ns(ts), _timestamp_ns(ts)))
+        return {'count': int(count), 'plan_value': float(plan_value)}
+
+    def active_between(self, start, end):
+        """Clientes ativos em algum momento de [start, end] - O(log n)
+
+        Condição: signup_date <= end e saída > start.
+        """
+        count, plan_value = self._summarize(*self._bounds(_timestamp_ns(end), _timestamp_ns(start)))
+        return {'count': int(count), 'plan_value': float(plan_value)}
+
+    def active_at_many(self, timestamps):
+        """Versão vetorizada de active_at para vários instantes (ex.: fins de mês)"""
+        ts = pd.to_datetime(pd.Series(timestamps)).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        count, plan_value = self._summarize(*self._bounds(ts, ts))
+        return pd.DataFrame({'count': count.astype(np.int64), 'plan_value': plan_value})
+
+    def active_positions_at(self, ts):
+        """Posições (ordinais das linhas) dos clientes ativos em ts
+
+        Filtra o menor dos dois candidatos: quem já se cadastrou ou quem ainda não saiu.
+        Custo O(log n + min(cadastrados, não saídos)).
+        """
+        t = _timestamp_ns(ts)
+        started, exited = self._bounds(t, t)
+        if started <= self.size - exited:
+            candidates = self._signup_order[:started]
+            positions = candidates[self._exit[candidates] > t]
+        else:
+            candidates = self._exit_order[exited:]
+            positions = candidates[self._signup[candidates] <= t]
+        return np.sort(positions)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Cache de resultados de métricas
+Chave = hash do conteúdo dos dados + parâmetros do cálculo (engine) + mês de referência;
+camada LRU em memória e camada opcional em disco (apenas DataFrames, em Parquet - nada é desserializado com pickle)
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # motor do to_parquet/read_parquet
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+DISK_SUFFIX = '.parquet'
+
+
+def dataset_fingerprint(*frames):
+    """Hash do conteúdo (colunas + valores) de um ou mais DataFrames"""
+    digest = hashlib.sha256()
+    for df in frames:
+        if df is None:
+            digest.update(b'none')
+            continue
+        digest.update(repr(list(df.columns)).encode())
+        digest.update(str(len(df)).encode())
+        if not df.empty:
+            digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def make_cache_key(kind, *frames, as_of=None, **params):
+    """Monta a chave do cache: tipo do cálculo, parâmetros (ex.: engine), hash dos dados e mês de referência"""
+    as_of = datetime.now() if as_of is None else as_of
+    options = ''.join(f":{name}={params[name]}" for name in sorted(params))
+    return f"{kind}{options}:{dataset_fingerprint(*frames)}:{as_of.strftime('%Y-%m')}"
+
+
+def _result_size(value, depth=0):
+    """Tamanho aproximado em bytes de um resultado, somando os buffers de DataFrames e arrays (sem serializar)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if depth < 4:
+        # Dicionários, listas e objetos (ex.: MetricsCube) somam o tamanho dos atributos
+        if isinstance(value, dict):
+            return sys.getsizeof(value) + sum(_result_size(item, depth + 1) for item in value.values())
+        if isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(_result_size(item, depth + 1) for item in value)
+        if hasattr(value, '__dict__'):
+            return _result_size(vars(value), depth + 1)
+    return sys.getsizeof(value)
+
+
+class MetricsCache:
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024, max_age_seconds=24 * 3600,
+                 disk_dir=None, disk_max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries = OrderedDict()  # chave -> (valor, tamanho, criado_em)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir and not PARQUET_AVAILABLE:
+            print("⚠️ pyarrow não está instalado - cache de métricas apenas em memória")
+            self.disk_dir = None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        # Nome = SHA-256 da chave completa: arquivos de outra chave nunca são confundidos
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode()).hexdigest() + DISK_SUFFIX)
+
+    def _is_expired(self, created_at):
+        return self.max_age_seconds is not None and time.time() - created_at > self.max_age_seconds
+
+    def get(self, key):
+        """Busca na memória e depois no disco; retorna None se não houver entrada válida"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, created_at = entry
+                if not self._is_expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove_entry(key)
+
+        value = self._load_from_disk(key)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._store_in_memory(key, value, time.time())
+                return value
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Armazena o resultado nas duas camadas"""
+        with self._lock:
+            self._store_in_memory(key, value, time.time())
+        self._save_to_disk(key, value)
+
+    def get_or_compute(self, key, compute):
+        """Retorna o valor em cache ou calcula, armazena e retorna"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _store_in_memory(self, key, value, created_at):
+        if key in self._entries:
+            self._remove_entry(key)
+        size = _result_size(value)
+        self._entries[key] = (value, size, created_at)
+        self._memory_bytes += size
+
+        # Evicção LRU por quantidade e por tamanho total
+        while self._entries and (len(self._entries) > self.max_entries or self._memory_bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove_entry(oldest_key)
+            self.evictions += 1
+
+    def _remove_entry(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._memory_bytes -= size
+
+    def _load_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if not os.path.exists(path):
+                return None
+            if self._is_expired(os.path.getmtime(path)):
+                os.remove(path)
+                return None
+            return pd.read_parquet(path)
+        except Exception as e:
+            print(f"⚠️ Erro ao ler cache em disco: {e}")
+            return None
+
+    def _save_to_disk(self, key, value):
+        # Só DataFrames vão para o disco; outros resultados (ex.: cubo) ficam apenas na memória
+        if not self.disk_dir or not isinstance(value, pd.DataFrame):
+            return
+        try:
+            path = self._disk_path(key)
+            temp_path = path + '.tmp'
+            value.to_parquet(temp_path)
+            os.replace(temp_path, path)
+            self._evict_disk()
+        except Exception as e:
+            print(f"⚠️ Erro ao gravar cache em disco: {e}")
+
+    def _evict_disk(self):
+        """Remove arquivos expirados e, se necessário, os mais antigos até caber no limite"""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if name.endswith('.pkl'):
+                # Formato anterior (pickle): nunca mais é lido
+                os.remove(path)
+                continue
+            if not name.endswith(DISK_SUFFIX):
+                continue
+            stat = os.stat(path)
+            if self._is_expired(stat.st_mtime):
+                os.remove(path)
+                self.evictions += 1
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Esvazia as duas camadas"""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name.endswith((DISK_SUFFIX, '.pkl')):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+    def stats(self):
+        """Contadores de acerto/erro e ocupação do cache"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups * 100) if lookups else 0.0,
+            'entries': len(self._entries),
+            'memory_bytes': self._memory_bytes,
+            'evictions': self.evictions
+        }
@@ -2,17 +2,124 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import calendar
+from lifetime_index import LifetimeIndex
+from metrics_cache import make_cache_key
+from parallel_metrics import calculate_partials_parallel, DEFAULT_CHUNK_SIZE
+from metrics_engine import (
+    calculate_monthly_metrics_from_events, calculate_churn_by_month,
+    to_month_number, month_number, RECURRING_SALE_TYPE
+)
 
 class MetricsCalculator:
-    def __init__(self, customers_df, sales_df):
+    def __init__(self, customers_df, sales_df, engine='vectorized', cache=None,
+                 workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        # engine='vectorized' agrega vendas uma única vez por (mês, cliente, tipo); engine='loop' varre mês a mês
+        # engine='parallel' divide clientes/vendas em fatias de chunk_size linhas e agrega em um pool de workers
+        if engine not in ('vectorized', 'loop', 'parallel'):
+            raise ValueError(f"Engine inválido: {engine}")
         self.customers_df = customers_df
         self.sales_df = sales_df
+        self.engine = engine
+        self.cache = cache
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._sales_table = None
+        self._lifetime_index = None
     
     def calculate_monthly_metrics(self):
         """Calcula todas as métricas mensais"""
         if self.customers_df.empty and self.sales_df.empty:
             return pd.DataFrame()
         
+        if self.cache is None:
+            return self._compute_monthly_metrics()
+        
+        key = make_cache_key('sales_monthly_metrics', self.customers_df, self.sales_df, engine=self.engine)
+        return self.cache.get_or_compute(key, self._compute_monthly_metrics).copy()
+    
+    def _compute_monthly_metrics(self):
+        """Calcula a tabela mensal com o engine configurado"""
+        if self.engine == 'loop':
+            return self._calculate_monthly_metrics_loop()
+        if self.engine == 'parallel':
+            return self._calculate_monthly_metrics_parallel()
+        
+        start_date, end_date = self._get_analysis_period()
+        
+        # Métricas baseadas em clientes (novos, MRR dos planos, churn) via eventos mensais
+        if self.customers_df.empty:
+            customers = pd.DataFrame({'signup_date': pd.Series(dtype='datetime64[ns]'),
+                                      'cancel_date': pd.Series(dtype='datetime64[ns]'),
+                                      'plan_value': pd.Series(dtype='float64')})
+        else:
+            customers = self.customers_df
+        churn_table = calculate_churn_by_month(customers['cancel_date'], None, customers['plan_value'])
+        metrics = calculate_monthly_metrics_from_events(
+            customers['signup_date'],
+            customers['cancel_date'],
+            customers['plan_value'],
+            start_date,
+            end_date,
+            churn_table=churn_table
+        )
+        
+        # Métricas baseadas em vendas: consultas à tabela agregada por mês
+        grid = np.arange(month_number(start_date), month_number(end_date) + 1)
+        sales_by_month = self._get_sales_by_month().reindex(grid, fill_value=0)
+        if not self.customers_df.empty:
+            # Mesmo critério do cálculo mês a mês: sem clientes, o MRR fica zerado
+            metrics['mrr'] = metrics['mrr'] + sales_by_month['recurring_value'].to_numpy()
+        metrics['ticket_medio'] = sales_by_month['avg_ticket'].to_numpy(dtype=np.float64)
+        
+        return metrics
+    
+    def _calculate_monthly_metrics_parallel(self):
+        """Map-reduce em processos: parciais mensais por fatia de linhas, combinados no final"""
+        partials = calculate_partials_parallel(
+            self.customers_df,
+            self.sales_df,
+            workers=self.workers,
+            chunk_size=self.chunk_size
+        )
+        return partials.to_frame(mode='sales')
+    
+    def _get_sales_by_month(self):
+        """Agrega vendas por mês uma única vez: receita recorrente e ticket médio por cliente"""
+        if self._sales_table is not None:
+            return self._sales_table
+        
+        if self.sales_df.empty:
+            self._sales_table = pd.DataFrame(columns=['recurring_value', 'avg_ticket'], dtype=np.float64)
+            return self._sales_table
+        
+        # Tipo da venda como código categórico (comparação de inteiros em vez de strings)
+        sale_type = pd.Categorical(self.sales_df['type'])
+        categories = list(sale_type.categories)
+        recurring_code = categories.index(RECURRING_SALE_TYPE) if RECURRING_SALE_TYPE in categories else -2
+        
+        sales = pd.DataFrame({
+            'month': to_month_number(self.sales_df['date']),
+            'customer_id': self.sales_df['customer_id'].to_numpy(),
+            'type_code': sale_type.codes,
+            'value': pd.to_numeric(self.sales_df['value'], errors='coerce').to_numpy()
+        })
+        sales = sales[sales['month'] >= 0]
+        
+        # Totais por (mês, cliente, tipo) em um único groupby
+        totals = sales.groupby(['month', 'customer_id', 'type_code'], dropna=False)['value'].sum().reset_index()
+        
+        recurring = totals[totals['type_code'] == recurring_code].groupby('month')['value'].sum()
+        per_customer = totals.groupby(['month', 'customer_id'])['value'].sum()
+        avg_ticket = per_customer.groupby(level='month').mean()
+        
+        self._sales_table = pd.DataFrame({
+            'recurring_value': recurring,
+            'avg_ticket': avg_ticket
+        }).fillna(0.0)
+        return self._sales_table
+    
+    def _calculate_monthly_metrics_loop(self):
+        """Cálculo de referência mês a mês"""
         # Determinar período de análise
         start_date, end_date = self._get_analysis_period()
         
@@ -43,16 +150,17 @@ class MetricsCalculator:
     
     def _get_analysis_period(self):
         """Determina o período de análise baseado nos dados disponíveis"""
+        # Mínimo/máximo por coluna (sem materializar todas as datas em uma lista)
         dates = []
         
         if not self.customers_df.empty:
-            dates.extend(self.customers_df['signup_date'].dropna())
-            cancel_dates = self.customers_df['cancel_date'].dropna()
-            if not cancel_dates.empty:
-                dates.extend(cancel_dates)
+            dates.extend([self.customers_df['signup_date'].min(), self.customers_df['signup_date'].max()])
+            dates.extend([self.customers_df['cancel_date'].min(), self.customers_df['cancel_date'].max()])
         
         if not self.sales_df.empty:
-            dates.extend(self.sales_df['date'].dropna())
+            dates.extend([self.sales_df['date'].min(), self.sales_df['date'].max()])
+        
+        dates = [d for d in dates if pd.notna(d)]
         
         if not dates:
             # Se não há dados, usar o mês atual
@@ -62,12 +170,11 @@ class MetricsCalculator:
         min_date = min(dates)
         max_date = max(dates)
         
-        # Começar do primeiro dia do mês mais antigo
-        start_date = min_date.replace(day=1)
+        # Começar do primeiro dia do mês mais antigo, à meia-noite (o horário não pode cortar o último mês)
+        start_date = pd.Timestamp(min_date).to_period('M').to_timestamp()
         
         # Ir até o mês atual
-        now = datetime.now()
-        end_date = now.replace(day=1)
+        end_date = pd.Timestamp.now().to_period('M').to_timestamp()
         
         return start_date, end_date
     
@@ -110,14 +217,8 @@ class MetricsCalculator:
         month_end = self._get_month_end(month_date)
         
         # Clientes ativos no mês (cadastrados antes ou durante o mês e não cancelados antes do mês)
-        active_customers = self.customers_df[
-            (self.customers_df['signup_date'] <= month_end) &
-            ((self.customers_df['cancel_date'].isna()) | 
-             (self.customers_df['cancel_date'] > month_end))
-        ]
-        
         # Somar valores dos planos recorrentes
-        mrr = active_customers['plan_value'].sum()
+        mrr = self._get_lifetime_index().active_at(month_end)['plan_value']
         
         # Adicionar vendas recorrentes do mês
         if not self.sales_df.empty:
@@ -130,6 +231,12 @@ class MetricsCalculator:
         
         return mrr
     
+    def _get_lifetime_index(self):
+        """Índice de tempo de vida dos clientes (construído uma vez)"""
+        if self._lifetime_index is None:
+            self._lifetime_index = LifetimeIndex.from_dataframe(self.customers_df)
+        return self._lifetime_index
+    
     def _calculate_avg_ticket(self, month_date):
         """Calcula ticket médio do mês"""
         if self.sales_df.empty:
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Cubo de métricas mensais por segmento
+Pré-calcula mês × (faixa de plano, status, ano de cadastro) em uma única passada agrupada
+"""
+
+import numpy as np
+import pandas as pd
+from metrics_engine import MONTHLY_COLUMNS, month_number, month_labels, to_month_number
+
+PLAN_BANDS = [0, 500, 1000, 2500, 5000, np.inf]
+PLAN_BAND_LABELS = ['< $500', '$500 - $1k', '$1k - $2.5k', '$2.5k - $5k', '>= $5k']
+CUBE_DIMENSIONS = ['faixa_plano', 'status', 'ano_cadastro']
+MIN_CHURN_TENURE = 2
+
+
+class MetricsCube:
+    """Métricas mensais pré-agregadas por combinação de segmentos
+
+    Cada combinação (faixa_plano, status, ano_cadastro) presente nos dados vira um segmento;
+    para cada segmento guardamos vetores mensais de novos clientes, ativos, MRR e churn.
+    Consultas somam os segmentos selecionados, sem voltar ao DataFrame de clientes.
+    """
+
+    def __init__(self, customers_df, as_of=None):
+        as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+        signup_dates = pd.to_datetime(customers_df['signup_date'], errors='coerce')
+        valid = signup_dates.notna().to_numpy()
+        customers = customers_df[valid]
+
+        signup = to_month_number(signup_dates[valid])
+        cancel = to_month_number(customers['cancel_date'])
+        values = pd.to_numeric(customers['plan_value'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+        if len(signup) == 0:
+            self.segments = pd.DataFrame(columns=CUBE_DIMENSIONS)
+            self.start_month = self.end_month = month_number(as_of)
+            self.months = month_labels(self.start_month, self.end_month)
+            self._cells = {name: np.zeros((0, 1)) for name in ['novos_clientes', 'ativos', 'mrr', 'churn_clientes', 'churn_mrr']}
+            return
+
+        # Dimensões de cada cliente e código do segmento (uma passada de factorize)
+        dimensions = pd.DataFrame({
+            'faixa_plano': pd.cut(values, bins=PLAN_BANDS, labels=PLAN_BAND_LABELS, right=False).astype(str),
+            'status': customers['status'].fillna('N/A').astype(str).to_numpy(),
+            'ano_cadastro': signup_dates[valid].dt.year.to_numpy()
+        })
+        segment_codes, segment_keys = pd.MultiIndex.from_frame(dimensions).factorize()
+        self.segments = segment_keys.to_frame(index=False)
+        self.segments.columns = CUBE_DIMENSIONS
+
+        self.start_month = int(signup.min())
+        self.end_month = int(max(signup.max(), cancel.max(), month_number(as_of)))
+        self.months = month_labels(self.start_month, self.end_month)
+        n_months = self.end_month - self.start_month + 1
+        n_segments = len(self.segments)
+
+        signup_idx = signup - self.start_month
+        has_cancel = cancel >= 0
+        exit_idx = np.where(has_cancel, np.maximum(cancel, signup) - self.start_month, n_months)
+        churned = has_cancel & (cancel - signup >= MIN_CHURN_TENURE)
+
+        def grid(month_idx, weights=None, mask=None):
+            """Agregação (segmento, mês) via bincount em índice achatado"""
+            if mask is not None:
+                month_idx = month_idx[mask]
+                codes = segment_codes[mask]
+                weights = None if weights is None else weights[mask]
+            else:
+                codes = segment_codes
+            flat = codes * (n_months + 1) + month_idx
+            size = n_segments * (n_months + 1)
+            return np.bincount(flat, weights=weights, minlength=size).reshape(n_segments, n_months + 1)
+
+        new_customers = grid(signup_idx)
+        active_count = np.cumsum(new_customers - grid(exit_idx), axis=1)[:, :n_months]
+        mrr = np.cumsum(grid(signup_idx, values) - grid(exit_idx, values), axis=1)[:, :n_months]
+        churn_idx = cancel - self.start_month
+
+        self._cells = {
+            'novos_clientes': new_customers[:, :n_months],
+            'ativos': active_count,
+            'mrr': np.where(active_count > 0, mrr, 0.0),
+            'churn_clientes': grid(churn_idx, mask=churned)[:, :n_months],
+            'churn_mrr': grid(churn_idx, values, mask=churned)[:, :n_months]
+        }
+
+    def dimension_values(self, dimension):
+        """Valores disponíveis de uma dimensão (para filtros)"""
+        values = self.segments[dimension].unique().tolist()
+        if dimension == 'faixa_plano':
+            return [label for label in PLAN_BAND_LABELS if label in values]
+        return sorted(values)
+
+    def _segment_mask(self, filters):
+        mask = np.ones(len(self.segments), dtype=bool)
+        for dimension, selected in filters.items():
+            if selected is None or (isinstance(selected, (list, tuple, set)) and len(selected) == 0):
+                continue
+            if not isinstance(selected, (list, tuple, set)):
+                selected = [selected]
+            mask &= self.segments[dimension].isin(list(selected)).to_numpy()
+        return mask
+
+    def query(self, **filters):
+        """Tabela mensal (colunas de calculate_monthly_metrics) para a fatia selecionada
+
+        Exemplo: cube.query(status='Ativo', ano_cadastro=[2023, 2024])
+        """
+        mask = self._segment_mask(filters)
+        totals = {name: cells[mask].sum(axis=0) for name, cells in self._cells.items()}
+        active = totals['ativos']
+
+        return pd.DataFrame({
+            'mes_ano': self.months,
+            'novos_clientes': totals['novos_clientes'].astype(np.int64),
+            'mrr': totals['mrr'],
+            'ticket_medio': np.divide(totals['mrr'], active, out=np.zeros(len(active)), where=active > 0),
+            'churn_clientes': totals['churn_clientes'].astype(np.int64),
+            'churn_mrr': totals['churn_mrr']
+        }, columns=MONTHLY_COLUMNS)
+
+    def rollup(self, dimension, metric='mrr', **filters):
+        """Agrega uma métrica por valor de uma dimensão: DataFrame mês × valor da dimensão"""
+        mask = self._segment_mask(filters)
+        cells = self._cells[metric][mask]
+        groups = self.segments.loc[mask, dimension].to_numpy()
+
+        result = {}
+        for value in pd.unique(groups):
+            result[value] = cells[groups == value].sum(axis=0)
+        return pd.DataFrame(result, index=pd.Index(self.months, name='mes_ano'))
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Motor vetorizado de métricas de clientes
+Converte cadastros e cancelamentos em eventos mensais e agrega tudo com NumPy
+"""
+
+import numpy as np
+import pandas as pd
+
+MONTHLY_COLUMNS = ['mes_ano', 'novos_clientes', 'mrr', 'ticket_medio', 'churn_clientes', 'churn_mrr']
+RECURRING_SALE_TYPE = 'Recorrente'
+
+
+def to_month_number(dates):
+    """Converte datas em número de meses desde 1970-01 (NaT vira -1)"""
+    values = pd.to_datetime(pd.Series(dates), errors='coerce')
+    months = values.to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+    numbers = months.astype(np.int64)
+    numbers[values.isna().to_numpy()] = -1
+    return numbers
+
+
+def month_number(value):
+    """Converte uma única data em número de meses desde 1970-01"""
+    return int(pd.Timestamp(value).to_datetime64().astype('datetime64[M]').astype(np.int64))
+
+
+def customer_hashes(customer_ids):
+    """Identidade de cada customer_id como uint64, igual em qualquer bloco ou processo
+
+    Dispensa um dicionário global de códigos: parciais calculados em workers diferentes
+    comparam clientes pelo hash (colisões de 64 bits são desprezíveis para contagem por mês).
+    """
+    ids = pd.Series(customer_ids).reset_index(drop=True)
+    if pd.api.types.is_numeric_dtype(ids):
+        # Bloco com cliente nulo vira float: 1 e 1.0 precisam ter o mesmo hash
+        ids = ids.astype(np.float64)
+    return pd.util.hash_pandas_object(ids, index=False).to_numpy()
+
+
+def month_labels(start_month, end_month):
+    """Gera rótulos 'YYYY-MM' para o intervalo de meses (inclusivo)"""
+    months = np.arange(start_month, end_month + 1).astype('datetime64[M]')
+    return months.astype(str)
+
+
+def tenure_months(signup_dates, cancel_dates):
+    """Meses de casa no cancelamento (diferença de meses de calendário); nulo se não cancelou"""
+    signup = to_month_number(signup_dates)
+    cancel = to_month_number(cancel_dates)
+    tenure = pd.array(cancel - signup, dtype='Int64')
+    tenure[(cancel < 0) | (signup < 0)] = pd.NA
+    return tenure
+
+
+def calculate_churn_by_month(cancel_dates, tenure, plan_values, min_tenure=2):
+    """Agrega churn por mês de cancelamento, considerando apenas clientes com min_tenure+ meses
+
+    Com tenure=None todo cancelamento conta como churn.
+    Retorna DataFrame indexado pelo número do mês com churn_clientes e churn_mrr.
+    """
+    cancel = to_month_number(cancel_dates)
+    churned = cancel >= 0
+    if tenure is not None:
+        tenure = pd.array(tenure, dtype='Int64')
+        churned &= (tenure >= min_tenure).fillna(False).to_numpy(dtype=bool)
+    values = pd.to_numeric(pd.Series(plan_values), errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+    churned_df = pd.DataFrame({'month': cancel[churned], 'plan_value': values[churned]})
+    grouped = churned_df.groupby('month')['plan_value'].agg(['size', 'sum'])
+    return pd.DataFrame({
+        'churn_clientes': grouped['size'].astype(np.int64),
+        'churn_mrr': grouped['sum'].astype(np.float64)
+    })
+
+
+def calculate_monthly_metrics_from_events(signup_dates, cancel_dates, plan_values, start_date, end_date, churn_table=None):
+    """Calcula a tabela mensal completa a partir de eventos de cadastro e cancelamento
+
+    Cada cliente vira um evento +plan_value no mês de cadastro e -plan_value no mês
+    de cancelamento; o MRR de cada mês é a soma acumulada desses eventos.
+    """
+    start_month = month_number(start_date)
+    end_month = month_number(end_date)
+    n_months = end_month - start_month + 1
+    if n_months <= 0:
+        return pd.DataFrame(columns=MONTHLY_COLUMNS)
+
+    signup = to_month_number(signup_dates) - start_month
+    cancel_raw = to_month_number(cancel_dates)
+    has_cancel = cancel_raw >= 0
+    cancel = np.where(has_cancel, cancel_raw - start_month, n_months)
+    values = pd.to_numeric(pd.Series(plan_values), errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+    # Cliente é ativo no fim do mês m quando signup <= m < cancel
+    # (cancelamento anterior ao cadastro nunca fica ativo)
+    cancel = np.maximum(cancel, signup)
+    in_grid = (signup >= 0) & (signup < n_months)
+    signup_in = signup[in_grid]
+    cancel_in = np.minimum(cancel[in_grid], n_months)
+    values_in = values[in_grid]
+
+    new_customers = np.bincount(signup_in, minlength=n_months)[:n_months]
+
+    # Deltas de entrada/saída com uma posição extra para cancelamentos fora da grade
+    count_delta = (
+        np.bincount(signup_in, minlength=n_months + 1)
+        - np.bincount(cancel_in, minlength=n_months + 1)
+    )
+    value_delta = (
+        np.bincount(signup_in, weights=values_in, minlength=n_months + 1)
+        - np.bincount(cancel_in, weights=values_in, minlength=n_months + 1)
+    )
+    active_count = np.cumsum(count_delta)[:n_months]
+    mrr = np.cumsum(value_delta)[:n_months]
+    mrr = np.where(active_count > 0, mrr, 0.0)
+    avg_ticket = np.divide(mrr, active_count, out=np.zeros(n_months), where=active_count > 0)
+
+    # Churn: tabela agregada uma única vez por mês de cancelamento
+    if churn_table is None:
+        churn_table = calculate_churn_by_month(cancel_dates, tenure_months(signup_dates, cancel_dates), values)
+    grid = np.arange(start_month, end_month + 1)
+    churn = churn_table.reindex(grid, fill_value=0)
+    churn_customers = churn['churn_clientes'].to_numpy()
+    churn_mrr = churn['churn_mrr'].to_numpy()
+
+    return pd.DataFrame({
+        'mes_ano': month_labels(start_month, end_month),
+        'novos_clientes': new_customers.astype(np.int64),
+        'mrr': mrr.astype(np.float64),
+        'ticket_medio': avg_ticket.astype(np.float64),
+        'churn_clientes': churn_customers.astype(np.int64),
+        'churn_mrr': churn_mrr.astype(np.float64)
+    })
+
+
+def calculate_ltv_frame(names, signup_dates, cancel_dates, plan_values, current_date=None):
+    """Calcula o LTV de cada cliente como operações sobre colunas inteiras
+
+    months_active = max(1, meses entre cadastro e cancelamento ou data atual)
+    ltv = plan_value × months_active
+    """
+    current_date = pd.Timestamp.now() if current_date is None else pd.Timestamp(current_date)
+    signup = pd.to_datetime(pd.Series(signup_dates), errors='coerce').reset_index(drop=True)
+    cancel = pd.to_datetime(pd.Series(cancel_dates), errors='coerce').reset_index(drop=True)
+    values = pd.to_numeric(pd.Series(plan_values), errors='coerce').reset_index(drop=True)
+
+    is_active = cancel.isna().to_numpy()
+    end_month = np.where(is_active, month_number(current_date), to_month_number(cancel))
+    months_active = np.maximum(1, end_month - to_month_number(signup))
+
+    return pd.DataFrame({
+        'cliente': pd.Series(names).reset_index(drop=True),
+        'ltv': values.to_numpy(dtype=np.float64) * months_active,
+        'months_active': months_active.astype(np.int64),
+        'plan_value': values,
+        'is_active': is_active,
+        'signup_date': signup,
+        'cancel_date': cancel
+    })
+
+
+def summarize_ltv(ltv_df):
+    """Agrega o LTV detalhado nas métricas exibidas no dashboard"""
+    is_active = ltv_df['is_active'].to_numpy(dtype=bool)
+    ltv = ltv_df['ltv']
+    return {
+        'ltv_medio': ltv.mean(),
+        'ltv_clientes_ativos': ltv[is_active].mean() if is_active.any() else 0,
+        'ltv_clientes_cancelados': ltv[~is_active].mean() if (~is_active).any() else 0,
+        'tempo_vida_medio_meses': ltv_df['months_active'].mean(),
+        'total_clientes_analisados': len(ltv_df),
+        'ltv_detalhado': ltv_df
+    }
+
+
+def calculate_cohort_matrix(signup_dates, cancel_dates, plan_values, as_of=None):
+    """Matriz de retenção por coorte (mês de cadastro × meses desde o cadastro)
+
+    Um cliente da coorte c está retido na idade k quando continua ativo no fim do mês c + k,
+    ou seja, quando seu tempo de vida em meses (saída - cadastro) é maior que k.
+    Tudo sai de um histograma 2D (coorte × tempo de vida) e de uma soma acumulada reversa,
+    sem laço por coorte. Células no futuro ficam como NaN.
+    """
+    as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+    signup = to_month_number(signup_dates)
+    cancel = to_month_number(cancel_dates)
+    values = pd.to_numeric(pd.Series(plan_values), errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+    valid = signup >= 0
+    signup, cancel, values = signup[valid], cancel[valid], values[valid]
+    if len(signup) == 0:
+        empty = pd.DataFrame()
+        return {'logo': empty, 'mrr': empty, 'cohort_size': pd.Series(dtype=np.int64), 'cohort_mrr': pd.Series(dtype=np.float64)}
+
+    first_cohort = signup.min()
+    last_month = max(month_number(as_of), signup.max())
+    n_cohorts = last_month - first_cohort + 1
+    n_ages = n_cohorts
+
+    cohort = signup - first_cohort
+    # Tempo de vida limitado a n_ages (quem nunca saiu fica no último "balde")
+    lifetime = np.where(cancel >= 0, np.maximum(cancel, signup) - signup, n_ages)
+    lifetime = np.minimum(lifetime, n_ages)
+
+    flat = cohort * (n_ages + 1) + lifetime
+    shape = (n_cohorts, n_ages + 1)
+    lifetime_counts = np.bincount(flat, minlength=n_cohorts * (n_ages + 1)).reshape(shape)
+    lifetime_values = np.bincount(flat, weights=values, minlength=n_cohorts * (n_ages + 1)).reshape(shape)
+
+    # retidos[c, k] = clientes com tempo de vida > k (soma acumulada reversa ao longo das idades)
+    retained = np.cumsum(lifetime_counts[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    retained_mrr = np.cumsum(lifetime_values[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+    cohort_size = lifetime_counts.sum(axis=1)
+    cohort_mrr = lifetime_values.sum(axis=1)
+
+    # Idades ainda não observadas (c + k depois do mês de referência)
+    ages = np.arange(n_ages)
+    max_age = (last_month - first_cohort) - np.arange(n_cohorts)
+    future = ages[None, :] > max_age[:, None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logo = retained / cohort_size[:, None]
+        mrr = retained_mrr / cohort_mrr[:, None]
+    logo[future] = np.nan
+    mrr[future] = np.nan
+
+    # Apenas coortes com clientes
+    has_customers = cohort_size > 0
+    labels = month_labels(first_cohort, last_month)[has_customers]
+    logo_df = pd.DataFrame(logo[has_customers], index=labels, columns=ages)
+    mrr_df = pd.DataFrame(mrr[has_customers], index=labels, columns=ages)
+    logo_df.index.name = mrr_df.index.name = 'coorte'
+    logo_df.columns.name = mrr_df.columns.name = 'meses_desde_cadastro'
+
+    return {
+        'logo': logo_df,
+        'mrr': mrr_df,
+        'cohort_size': pd.Series(cohort_size[has_customers], index=labels),
+        'cohort_mrr': pd.Series(cohort_mrr[has_customers], index=labels)
+    }
+
+
+class MonthlyPartials:
+    """Agregados mensais parciais e combináveis, calculados bloco a bloco
+
+    Guarda apenas uma linha por mês (indexada pelo número do mês) e alguns limites de datas,
+    de modo que a memória depende da quantidade de meses e não da quantidade de linhas.
+    Para o ticket médio de vendas guarda também, por mês, o conjunto ordenado dos clientes (hash inteiro)
+    com venda: essa parte cresce com os pares distintos (mês, cliente) - no máximo meses × clientes,
+    8 bytes por par - e não com a quantidade de vendas.
+    """
+
+    COLUMNS = ['novos_clientes', 'active_delta', 'mrr_delta', 'churn_clientes', 'churn_mrr',
+               'recurring_value', 'sales_value']
+
+    def __init__(self, min_churn_tenure=2):
+        self.min_churn_tenure = min_churn_tenure
+        self.table = pd.DataFrame(columns=self.COLUMNS, dtype=np.float64)
+        self.customer_rows = 0
+        self.sales_rows = 0
+        self.bounds = {}
+        # Número do mês -> array ordenado e sem repetição dos clientes com venda no mês
+        self._month_customers = {}
+
+    def _update_bound(self, name, months, reducer):
+        if len(months) == 0:
+            return
+        value = int(reducer(months))
+        current = self.bounds.get(name)
+        self.bounds[name] = value if current is None else int(reducer([current, value]))
+
+    def _accumulate(self, column, months, weights=None):
+        if len(months) == 0:
+            return
+        grouped = pd.Series(np.ones(len(months)) if weights is None else weights).groupby(months).sum()
+        self.table = self.table.reindex(self.table.index.union(grouped.index), fill_value=0.0)
+        self.table.loc[grouped.index, column] += grouped.to_numpy()
+
+    def add_customers(self, chunk):
+        """Incorpora um bloco de clientes"""
+        return self.add_customer_arrays(
+            to_month_number(chunk['signup_date']),
+            to_month_number(chunk['cancel_date']),
+            pd.to_numeric(chunk['plan_value'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+        )
+
+    def add_customer_arrays(self, signup, cancel, values):
+        """Incorpora clientes já convertidos em arrays (números de mês, -1 = sem data)"""
+        rows = len(signup)
+        valid = signup >= 0
+        signup, cancel, values = signup[valid], cancel[valid], values[valid]
+        has_cancel = cancel >= 0
+        exit_month = np.maximum(cancel, signup)[has_cancel]
+
+        churned = has_cancel.copy()
+        if self.min_churn_tenure is not None:
+            churned &= (cancel - signup >= self.min_churn_tenure)
+
+        self._accumulate('novos_clientes', signup)
+        self._accumulate('active_delta', np.concatenate([signup, exit_month]),
+                         np.concatenate([np.ones(len(signup)), -np.ones(len(exit_month))]))
+        self._accumulate('mrr_delta', np.concatenate([signup, exit_month]),
+                         np.concatenate([values, -values[has_cancel]]))
+        self._accumulate('churn_clientes', cancel[churned])
+        self._accumulate('churn_mrr', cancel[churned], values[churned])
+
+        self._update_bound('min_signup', signup, np.min)
+        self._update_bound('max_signup', signup, np.max)
+        self._update_bound('min_cancel', cancel[has_cancel], np.min)
+        self._update_bound('max_cancel', cancel[has_cancel], np.max)
+        self.customer_rows += rows
+        return self
+
+    def add_sales(self, chunk):
+        """Incorpora um bloco de vendas"""
+        return self.add_sales_arrays(
+            to_month_number(chunk['date']),
+            pd.to_numeric(chunk['value'], errors='coerce').to_numpy(dtype=np.float64),
+            customer_hashes(chunk['customer_id']),
+            (chunk['type'] == RECURRING_SALE_TYPE).to_numpy(),
+            chunk['customer_id'].notna().to_numpy()
+        )
+
+    def add_sales_arrays(self, months, values, customers, recurring, with_customer=None):
+        """Incorpora vendas já convertidas em arrays
+
+        customers identifica o cliente (ex.: customer_hashes); with_customer marca as vendas com cliente
+        (sem ele, cliente nulo = venda sem cliente).
+        """
+        rows = len(months)
+        if with_customer is None:
+            with_customer = pd.notna(customers)
+        valid = months >= 0
+        months, values, customers, recurring = months[valid], values[valid], customers[valid], recurring[valid]
+        with_customer = np.asarray(with_customer, dtype=bool)[valid]
+
+        self._accumulate('recurring_value', months[recurring], np.nan_to_num(values[recurring]))
+        self._accumulate('sales_value', months[with_customer], np.nan_to_num(values[with_customer]))
+
+        pairs = pd.DataFrame({'month': months[with_customer], 'customer_id': customers[with_customer]})
+        for month, month_customers in pairs.groupby('month')['customer_id']:
+            self._add_month_customers(int(month), month_customers.to_numpy())
+
+        self._update_bound('min_sale', months, np.min)
+        self.sales_rows += rows
+        return self
+
+    def _add_month_customers(self, month, customers):
+        # A união custa o tamanho do conjunto do mês, limitado pela quantidade de clientes
+        current = self._month_customers.get(month)
+        merged = customers.copy() if current is None else np.concatenate([current, customers])
+        merged.sort()
+        self._month_customers[month] = merged[np.concatenate([[True], merged[1:] != merged[:-1]])]
+
+    def distinct_customers_by_month(self):
+        """Quantidade de clientes distintos com venda em cada mês (indexada pelo número do mês)"""
+        return pd.Series({month: len(customers) for month, customers in self._month_customers.items()},
+                         dtype=np.int64)
+
+    def merge(self, other):
+        """Combina dois parciais (resultado equivalente a processar os dois blocos juntos)"""
+        self.table = self.table.add(other.table, fill_value=0.0)
+        for name, value in other.bounds.items():
+            reducer = min if name.startswith('min') else max
+            self.bounds[name] = value if name not in self.bounds else reducer(self.bounds[name], value)
+        for month, customers in other._month_customers.items():
+            self._add_month_customers(month, customers)
+        self.customer_rows += other.customer_rows
+        self.sales_rows += other.sales_rows
+        return self
+
+    def to_frame(self, mode='dashboard', as_of=None):
+        """Monta a tabela mensal final
+
+        mode='dashboard': regras do MetricsCalculator do app (primeiro cadastro até max(última data, hoje))
+        mode='sales': regras do MetricsCalculator com vendas (data mais antiga até o mês atual,
+                      receita recorrente no MRR e ticket médio por cliente das vendas)
+        mode='simple': regras do SimpleMetricsCalculator (mesmo período, ticket médio dos planos ativos)
+        """
+        as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+        current_month = month_number(as_of)
+
+        if mode == 'dashboard':
+            if 'min_signup' not in self.bounds:
+                return pd.DataFrame()
+            start_month = self.bounds['min_signup']
+            end_month = max(self.bounds['max_signup'], self.bounds.get('max_cancel', -1), current_month)
+        else:
+            if self.customer_rows == 0 and (mode == 'simple' or self.sales_rows == 0):
+                return pd.DataFrame()
+            starts = [self.bounds[name] for name in ('min_signup', 'min_cancel', 'min_sale') if name in self.bounds]
+            start_month = min(starts) if starts else current_month
+            end_month = current_month
+
+        grid = np.arange(start_month, end_month + 1)
+        table = self.table.reindex(self.table.index.union(grid), fill_value=0.0).sort_index()
+        # Deltas anteriores ao início da grade entram no acumulado do primeiro mês
+        active_count = np.rint(table['active_delta'].cumsum()).astype(np.int64).reindex(grid).to_numpy()
+        mrr = table['mrr_delta'].cumsum().reindex(grid).to_numpy()
+        mrr = np.where(active_count > 0, mrr, 0.0)
+        table = table.reindex(grid)
+
+        if mode == 'sales':
+            # Sem clientes o calculador de vendas mantém MRR zerado
+            if self.customer_rows > 0:
+                mrr = mrr + table['recurring_value'].to_numpy()
+            distinct = self.distinct_customers_by_month().reindex(grid, fill_value=0).to_numpy()
+            avg_ticket = np.divide(table['sales_value'].to_numpy(), distinct, out=np.zeros(len(grid)), where=distinct > 0)
+        else:
+            avg_ticket = np.divide(mrr, active_count, out=np.zeros(len(grid)), where=active_count > 0)
+
+        return pd.DataFrame({
+            'mes_ano': month_labels(start_month, end_month),
+            'novos_clientes': np.rint(table['novos_clientes'].to_numpy()).astype(np.int64),
+            'mrr': mrr,
+            'ticket_medio': avg_ticket,
+            'churn_clientes': np.rint(table['churn_clientes'].to_numpy()).astype(np.int64),
+            'churn_mrr': table['churn_mrr'].to_numpy()
+        }, columns=MONTHLY_COLUMNS)
+
+
+def stream_monthly_metrics(customer_chunks, sales_chunks=None, mode='dashboard', min_churn_tenure=2, as_of=None):
+    """Calcula a tabela mensal consumindo blocos (ex.: pd.read_csv(..., chunksize=N)) um de cada vez"""
+    partials = MonthlyPartials(min_churn_tenure=min_churn_tenure)
+    for chunk in customer_chunks:
+        partials.add_customers(chunk)
+    for chunk in (sales_chunks or []):
+        partials.add_sales(chunk)
+    return partials.to_frame(mode=mode, as_of=as_of)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Agregados mensais persistidos e mantidos de forma incremental
+Cada escrita de cliente aplica apenas o delta da linha alterada; o dashboard lê em O(meses)
+A validade na leitura é conferida pela versão do primário (assinatura dos arquivos) registrada junto
+com os agregados; o resumo do conteúdo (content_digest) fica para a verificação explícita.
+"""
+
+import json
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from atomic_io import atomic_write_bytes, read_verified
+from metrics_engine import MONTHLY_COLUMNS, month_number, month_labels, to_month_number
+from storage_manifest import content_digest
+
+# Posições de cada agregado no vetor mensal
+NEW_CUSTOMERS, ACTIVE_DELTA, MRR_DELTA, CHURN_COUNT, CHURN_MRR = range(5)
+MIN_CHURN_TENURE = 2
+DIGEST_MODULUS = 2 ** 64
+
+
+class MonthlyMetricsStore:
+    def __init__(self, store_file="monthly_metrics.json"):
+        self.store_file = store_file
+        self.months = {}
+        self.row_count = 0
+        # Resumo do conteúdo dos clientes agregados (content_digest), mantido a cada escrita
+        self.content_digest = None
+        # Versão do primário que os agregados descrevem (None = desconhecida, reconstruir na leitura)
+        self.source_version = None
+        self._load()
+
+    def _load(self):
+        """Carrega agregados persistidos (estrutura vazia se não existir)"""
+        try:
+            if os.path.exists(self.store_file):
+                payload = json.loads(read_verified(self.store_file, allow_missing_footer=True))
+                self.months = {month_number(label + '-01'): values for label, values in payload['months'].items()}
+                self.row_count = payload['row_count']
+                # Arquivos sem o resumo (versão 1) são reconstruídos na primeira leitura
+                self.content_digest = payload.get('content_digest')
+                self.source_version = payload.get('source_version')
+        except Exception as e:
+            print(f"⚠️ Erro ao carregar agregados mensais: {e}")
+            self.months = {}
+            self.row_count = 0
+            self.content_digest = None
+            self.source_version = None
+
+    def save(self):
+        """Persiste os agregados em disco"""
+        payload = {
+            'version': 2,
+            'updated_at': datetime.now().isoformat(),
+            'row_count': self.row_count,
+            'content_digest': self.content_digest,
+            'source_version': self.source_version,
+            'months': {
+                str(np.datetime64(month, 'M')): values
+                for month, values in sorted(self.months.items())
+            }
+        }
+        atomic_write_bytes(self.store_file, json.dumps(payload).encode('utf-8'), checksum_footer=True)
+
+    def _bucket(self, month):
+        if month not in self.months:
+            self.months[month] = [0, 0, 0.0, 0, 0.0]
+        return self.months[month]
+
+    def _apply_row(self, row, sign):
+        """Aplica (+1) ou remove (-1) a contribuição de um cliente nos agregados"""
+        if self.content_digest is not None:
+            self.content_digest = (self.content_digest + sign * content_digest(pd.DataFrame([row]))) % DIGEST_MODULUS
+        signup_date = pd.to_datetime(row.get('signup_date'), errors='coerce')
+        if pd.isna(signup_date):
+            return
+        cancel_date = pd.to_datetime(row.get('cancel_date'), errors='coerce')
+        plan_value = pd.to_numeric(row.get('plan_value'), errors='coerce')
+        plan_value = 0.0 if pd.isna(plan_value) else float(plan_value)
+
+        signup = month_number(signup_date)
+        bucket = self._bucket(signup)
+        bucket[NEW_CUSTOMERS] += sign
+        bucket[ACTIVE_DELTA] += sign
+        bucket[MRR_DELTA] += sign * plan_value
+
+        if pd.notna(cancel_date):
+            cancel = month_number(cancel_date)
+            # Cancelamento anterior ao cadastro nunca fica ativo
+            bucket = self._bucket(max(cancel, signup))
+            bucket[ACTIVE_DELTA] -= sign
+            bucket[MRR_DELTA] -= sign * plan_value
+
+            if cancel - signup >= MIN_CHURN_TENURE:
+                bucket = self._bucket(cancel)
+                bucket[CHURN_COUNT] += sign
+                bucket[CHURN_MRR] += sign * plan_value
+
+        self.row_count += sign
+        self._prune()
+
+    def _prune(self):
+        """Remove meses que ficaram zerados após remoções"""
+        empty = [
+            month for month, values in self.months.items()
+            if values[NEW_CUSTOMERS] == 0 and values[ACTIVE_DELTA] == 0 and values[CHURN_COUNT] == 0
+        ]
+        for month in empty:
+            del self.months[month]
+
+    def add(self, row, source_version=None):
+        """Registra um cliente novo (source_version: versão do primário depois da escrita)"""
+        self._apply_row(row, +1)
+        self.source_version = source_version
+        self.save()
+
+    def remove(self, row, source_version=None):
+        """Registra a remoção de um cliente"""
+        self._apply_row(row, -1)
+        self.source_version = source_version
+        self.save()
+
+    def update(self, old_row, new_row, source_version=None):
+        """Registra a alteração de um cliente (remove o antigo e aplica o novo)"""
+        self._apply_row(old_row, -1)
+        self._apply_row(new_row, +1)
+        self.source_version = source_version
+        self.save()
+
+    def set_source_version(self, source_version):
+        """Registra que o primário mudou de versão sem mudar de conteúdo (ex.: compactação do journal)"""
+        if self.source_version == source_version:
+            return
+        self.source_version = source_version
+        self.save()
+
+    def is_current(self, source_version):
+        """Os agregados descrevem esta versão do primário (comparação O(1), sem ler os clientes)"""
+        return self.source_version is not None and self.source_version == source_version
+
+    def rebuild(self, customers_df, source_version=None):
+        """Reconstrói todos os agregados a partir do DataFrame completo"""
+        self.source_version = source_version
+        self.months = {}
+        self.row_count = 0
+        self.content_digest = content_digest(customers_df)
+
+        if not customers_df.empty:
+            signup_dates = pd.to_datetime(customers_df['signup_date'], errors='coerce')
+            valid = signup_dates.notna().to_numpy()
+            signup = to_month_number(signup_dates)[valid]
+            cancel = to_month_number(customers_df['cancel_date'])[valid]
+            values = pd.to_numeric(customers_df['plan_value'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)[valid]
+            has_cancel = cancel >= 0
+            exit_month = np.maximum(cancel, signup)[has_cancel]
+            churned = has_cancel & (cancel - signup >= MIN_CHURN_TENURE)
+
+            events = pd.concat([
+                pd.DataFrame({'month': signup, 'new': 1, 'active': 1, 'mrr': values, 'churn': 0, 'churn_mrr': 0.0}),
+                pd.DataFrame({'month': exit_month, 'new': 0, 'active': -1, 'mrr': -values[has_cancel], 'churn': 0, 'churn_mrr': 0.0}),
+                pd.DataFrame({'month': cancel[churned], 'new': 0, 'active': 0, 'mrr': 0.0, 'churn': 1, 'churn_mrr': values[churned]})
+            ])
+            grouped = events.groupby('month').sum()
+            for month, row in grouped.iterrows():
+                self.months[int(month)] = [
+                    int(row['new']), int(row['active']), float(row['mrr']),
+                    int(row['churn']), float(row['churn_mrr'])
+                ]
+
+            self.row_count = int(valid.sum())
+            self._prune()
+
+        self.save()
+        print(f"✅ Agregados mensais reconstruídos: {self.row_count} clientes, {len(self.months)} meses")
+
+    def is_consistent_with(self, customers_df):
+        """Verificação completa (O(N)): os agregados correspondem ao DataFrame pelo resumo do conteúdo
+
+        Qualquer alteração de nome, datas, valor ou status fora do app muda o resumo,
+        mesmo que a contagem e a soma dos planos continuem iguais.
+        """
+        return self.content_digest is not None and self.content_digest == content_digest(customers_df)
+
+    def summary(self, as_of=None):
+        """Totais atuais para os cards: clientes agregados, ativos e MRR no mês de as_of, em O(meses)"""
+        as_of = datetime.now() if as_of is None else as_of
+        current = month_number(as_of)
+        active, mrr = 0, 0.0
+        for month, values in self.months.items():
+            if month <= current:
+                active += values[ACTIVE_DELTA]
+                mrr += values[MRR_DELTA]
+        return {
+            'total': self.row_count,
+            'active': int(round(active)),
+            'mrr': mrr if active > 0 else 0.0
+        }
+
+    def to_frame(self, as_of=None):
+        """Monta a tabela mensal (mesmas colunas de calculate_monthly_metrics) em O(meses)"""
+        return monthly_frame_from_deltas(self.months, as_of)
+
+
+def monthly_frame_from_deltas(months, as_of=None):
+    """Tabela mensal a partir dos deltas por mês ({número do mês: [novos, delta ativos, delta MRR, churn, churn MRR]})"""
+    signup_months = [month for month, values in months.items() if values[NEW_CUSTOMERS] > 0]
+    if not signup_months:
+        return pd.DataFrame()
+
+    as_of = datetime.now() if as_of is None else as_of
+    start_month = min(signup_months)
+    end_month = max(max(months), month_number(as_of))
+    n_months = end_month - start_month + 1
+
+    table = np.zeros((n_months, 5))
+    for month, values in months.items():
+        if start_month <= month <= end_month:
+            table[month - start_month] = values
+
+    active_count = np.rint(np.cumsum(table[:, ACTIVE_DELTA])).astype(np.int64)
+    mrr = np.where(active_count > 0, np.cumsum(table[:, MRR_DELTA]), 0.0)
+    avg_ticket = np.divide(mrr, active_count, out=np.zeros(n_months), where=active_count > 0)
+
+    return pd.DataFrame({
+        'mes_ano': month_labels(start_month, end_month),
+        'novos_clientes': np.rint(table[:, NEW_CUSTOMERS]).astype(np.int64),
+        'mrr': mrr,
+        'ticket_medio': avg_ticket,
+        'churn_clientes': np.rint(table[:, CHURN_COUNT]).astype(np.int64),
+        'churn_mrr': table[:, CHURN_MRR]
+    }, columns=MONTHLY_COLUMNS)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Migração do snapshot de clientes entre CSV e Arrow IPC (colunar)
+Uso: python migrate_to_columnar.py            (CSV + journal → customers.arrow)
+     python migrate_to_columnar.py --export   (customers.arrow → CSV)
+"""
+
+import argparse
+import os
+from columnar_storage import ARROW_AVAILABLE, DEFAULT_COLUMNAR_FILE, export_csv, import_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra o snapshot de clientes para o formato colunar")
+    parser.add_argument('--csv', default='customers_simple.csv', help="arquivo CSV de clientes")
+    parser.add_argument('--output', default=DEFAULT_COLUMNAR_FILE, help="arquivo Arrow IPC")
+    parser.add_argument('--export', action='store_true', help="exporta o snapshot colunar para CSV")
+    parser.add_argument('--force', action='store_true', help="sobrescreve um snapshot colunar existente")
+    args = parser.parse_args()
+
+    if not ARROW_AVAILABLE:
+        print("❌ pyarrow não está instalado (pip install pyarrow)")
+        return
+
+    if args.export:
+        export_csv(args.output, args.csv)
+    elif os.path.exists(args.output) and not args.force:
+        # O journal pendente pertence ao snapshot colunar; reimportar o CSV o descartaria
+        print(f"⚠️ {args.output} já existe - exporte antes ou use --force para reimportar o CSV")
+    else:
+        import_csv(args.csv, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Map-reduce paralelo das métricas mensais
+As colunas brutas viram arquivos .npy (sem conversão de datas nem codificação de clientes); cada worker
+recebe só os caminhos e o intervalo (início, fim) da sua fatia, abre os arrays com mmap - os dados não
+passam por pickle - e faz ali a conversão das datas e a identificação dos clientes (hash de customer_id,
+igual em qualquer processo). O processo principal só combina os MonthlyPartials pequenos devolvidos.
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from metrics_engine import MonthlyPartials
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+CUSTOMER_COLUMNS = ['signup_date', 'cancel_date', 'plan_value']
+SALES_COLUMNS = ['date', 'value', 'customer_id', 'type']
+
+
+def _partial(kind, chunk, min_churn_tenure):
+    """Converte a fatia bruta e calcula o parcial"""
+    partials = MonthlyPartials(min_churn_tenure)
+    return partials.add_customers(chunk) if kind == 'customers' else partials.add_sales(chunk)
+
+
+def _raw_column(series):
+    """Coluna como array mapeável em disco, sem interpretar os valores
+
+    Datas, números e ids numéricos já são arrays NumPy; textos e objetos viram unicode de largura fixa
+    (nulo = texto vazio) para dispensar pickle.
+    """
+    values = series.to_numpy()
+    if values.dtype != object:
+        return values
+    return series.astype(object).where(series.notna(), '').astype(str).to_numpy().astype(str)
+
+
+def _save_columns(directory, kind, df, columns):
+    """Grava cada coluna em um .npy (uma coluna por vez na memória)"""
+    paths = {}
+    for column in columns:
+        paths[column] = os.path.join(directory, f"{kind}_{column}.npy")
+        np.save(paths[column], _raw_column(df[column]))
+    return paths
+
+
+def _run_file_task(kind, paths, start, end, min_churn_tenure):
+    """Executado no worker: abre as colunas com mmap e processa apenas as linhas [start, end)"""
+    chunk = {}
+    for column, path in paths.items():
+        values = np.load(path, mmap_mode='r')[start:end]
+        if values.dtype.kind == 'U':
+            # Texto vazio marca o valor nulo gravado por _raw_column
+            values = np.where(values == '', None, values.astype(object))
+        chunk[column] = values
+    return _partial(kind, pd.DataFrame(chunk), min_churn_tenure)
+
+
+def _slices(n_rows, chunk_size):
+    return [(start, min(start + chunk_size, n_rows)) for start in range(0, n_rows, chunk_size)]
+
+
+def calculate_partials_parallel(customers_df, sales_df, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                                min_churn_tenure=None):
+    """Calcula os agregados mensais particionando clientes e vendas em fatias de chunk_size linhas
+
+    workers=None usa todos os núcleos; workers=1 (ou uma única fatia) roda no próprio processo.
+    Se o pool não puder ser criado, cai para o modo de processo único.
+    """
+    workers = workers or os.cpu_count() or 1
+    datasets = {'customers': (customers_df, CUSTOMER_COLUMNS), 'sales': (sales_df, SALES_COLUMNS)}
+    tasks = [
+        (kind, start, end)
+        for kind, (df, _) in datasets.items()
+        for start, end in _slices(len(df), chunk_size)
+    ]
+
+    result = MonthlyPartials(min_churn_tenure)
+    if workers > 1 and len(tasks) > 1:
+        directory = tempfile.mkdtemp(prefix='metrics_parallel_')
+        try:
+            paths = {
+                kind: _save_columns(directory, kind, df, columns)
+                for kind, (df, columns) in datasets.items() if len(df)
+            }
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                futures = [
+                    pool.submit(_run_file_task, kind, paths[kind], start, end, min_churn_tenure)
+                    for kind, start, end in tasks
+                ]
+                for future in futures:
+                    result.merge(future.result())
+            return result
+        except (OSError, BrokenProcessPool) as e:
+            print(f"⚠️ Pool de processos indisponível ({e}); calculando em processo único")
+            result = MonthlyPartials(min_churn_tenure)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    for kind, start, end in tasks:
+        df, columns = datasets[kind]
+        result.merge(_partial(kind, df.iloc[start:end][columns], min_churn_tenure))
+    return result
@@ -5,14 +5,91 @@ Implementa múltiplas estratégias de armazenamento permanente
 """
 
 import pandas as pd
-import json
-import os
+import numpy as np
+import ast
 import base64
+import hashlib
+import io
+import os
+import struct
 from datetime import datetime
 import streamlit as st
+from atomic_io import fsync_directory
+from storage_manifest import StorageManifest
+
+SNAPSHOT_DIR = ".persistent_storage"
+SNAPSHOT_FILE = "customers.snapshot"
+# Snapshot atual + SNAPSHOT_KEEP_PREVIOUS anteriores (customers.snapshot.1, .2, ...)
+SNAPSHOT_KEEP_PREVIOUS = 3
+SNAPSHOT_MAGIC = b"CUSTSNAP"
+SNAPSHOT_VERSION = 1
+# Cabeçalho: magic, versão, linhas, tamanho do payload, SHA-256 do payload
+SNAPSHOT_HEADER = struct.Struct("<8sHQQ32s")
+
+
+def encode_customers_snapshot(df):
+    """Cabeçalho + payload colunar tipado (npz: textos, datas datetime64[D], valores float64, status codificado)"""
+    signup = pd.to_datetime(df['signup_date'], errors='coerce')
+    cancel = pd.to_datetime(df['cancel_date'], errors='coerce')
+    status_values, status_codes = np.unique(df['status'].astype(str).to_numpy(dtype=str), return_inverse=True)
+
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        name=df['name'].astype(str).to_numpy(dtype=str),
+        signup_date=signup.to_numpy(dtype='datetime64[D]'),
+        plan_value=pd.to_numeric(df['plan_value'], errors='coerce').fillna(0).to_numpy(dtype=np.float64),
+        status_values=status_values,
+        status_codes=status_codes.astype(np.int32),
+        cancel_date=cancel.to_numpy(dtype='datetime64[D]')
+    )
+    payload = buffer.getvalue()
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(df), len(payload), hashlib.sha256(payload).digest())
+    return header + payload
+
+
+def read_snapshot_header(path):
+    """(linhas, tamanho do payload, checksum) lendo só o cabeçalho; None se inválido"""
+    with open(path, 'rb') as f:
+        raw = f.read(SNAPSHOT_HEADER.size)
+    if len(raw) < SNAPSHOT_HEADER.size:
+        return None
+    magic, version, rows, payload_size, checksum = SNAPSHOT_HEADER.unpack(raw)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    return rows, payload_size, checksum
+
+
+def decode_customers_snapshot(data):
+    """DataFrame de um snapshot binário; ValueError se o cabeçalho ou o checksum não conferirem"""
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise ValueError("snapshot truncado")
+    magic, version, rows, payload_size, checksum = SNAPSHOT_HEADER.unpack_from(data)
+    payload = data[SNAPSHOT_HEADER.size:]
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("formato de snapshot desconhecido")
+    if len(payload) != payload_size or hashlib.sha256(payload).digest() != checksum:
+        raise ValueError("checksum do snapshot não confere")
+
+    with np.load(io.BytesIO(payload), allow_pickle=False) as arrays:
+        df = pd.DataFrame({
+            'name': arrays['name'].astype(object),
+            'signup_date': pd.to_datetime(arrays['signup_date']),
+            'plan_value': arrays['plan_value'],
+            'status': arrays['status_values'][arrays['status_codes']].astype(object),
+            'cancel_date': pd.to_datetime(arrays['cancel_date'])
+        })
+    if len(df) != rows:
+        raise ValueError("quantidade de linhas do snapshot não confere")
+    return df
+
 
 class PersistentStorageManager:
-    def __init__(self):
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR, keep_previous=SNAPSHOT_KEEP_PREVIOUS, manifest=None):
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_path = os.path.join(snapshot_dir, SNAPSHOT_FILE)
+        self.keep_previous = keep_previous
+        self.manifest = manifest if manifest is not None else StorageManifest()
         self.storage_methods = []
         self.last_successful_method = "Nenhum método disponível"
         self._setup_storage_methods()
@@ -26,32 +103,27 @@ class PersistentStorageManager:
             'description': 'Streamlit Session State',
             'save_func': self._save_to_session_state,
             'load_func': self._load_from_session_state,
+            'count_func': self._count_session_state,
             'permanent': False
         })
         
-        # Método 2: Base64 encoding em arquivo de configuração
-        self.storage_methods.append({
-            'name': 'encoded_config',
-            'description': 'Arquivo de configuração codificado',
-            'save_func': self._save_to_encoded_config,
-            'load_func': self._load_from_encoded_config,
-            'permanent': True
-        })
-        
-        # Método 3: JSON embeddado no código (fallback)
+        # Método 2: Snapshot binário colunar (atual + anteriores, com checksum)
         self.storage_methods.append({
-            'name': 'embedded_json',
-            'description': 'JSON embeddado no código',
-            'save_func': self._save_to_embedded_json,
-            'load_func': self._load_from_embedded_json,
+            'name': 'binary_snapshot',
+            'description': 'Snapshot binário',
+            'save_func': self._save_to_binary_snapshot,
+            'load_func': self._load_from_binary_snapshot,
+            'count_func': self._count_binary_snapshot,
             'permanent': True
         })
     
-    def save_data(self, df):
-        """Salva dados usando todos os métodos disponíveis"""
+    def save_data(self, df, permanent_only=False):
+        """Salva dados usando todos os métodos disponíveis (permanent_only: fora da sessão do Streamlit)"""
         success_count = 0
         
         for method in self.storage_methods:
+            if permanent_only and not method['permanent']:
+                continue
             try:
                 method['save_func'](df)
                 success_count += 1
@@ -67,6 +139,7 @@ class PersistentStorageManager:
             try:
                 df = method['load_func']()
                 if df is not None and not df.empty:
+                    self.last_successful_method = method['description']
                     print(f"✅ Dados carregados de: {method['description']}")
                     return df
             except Exception as e:
@@ -93,76 +166,90 @@ class PersistentStorageManager:
             return pd.DataFrame(data)
         return None
     
-    def _save_to_encoded_config(self, df):
-        """Salva em arquivo de configuração codificado"""
-        config_data = {
-            'app_config': {
-                'version': '1.0',
-                'theme': 'default'
-            },
-            'data_backup': base64.b64encode(df.to_json().encode()).decode(),
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        with open('.streamlit/config.toml', 'a') as f:
-            f.write(f"\n# Data backup: {config_data['timestamp']}\n")
-            f.write(f"# backup_data = \"{config_data['data_backup']}\"\n")
+    def _count_session_state(self):
+        """Registros no Session State sem montar o DataFrame"""
+        if 'customer_data' in st.session_state and st.session_state.customer_data:
+            return len(st.session_state.customer_data['data'])
+        return 0
     
-    def _load_from_encoded_config(self):
-        """Carrega de arquivo de configuração codificado"""
-        try:
-            if os.path.exists('.streamlit/config.toml'):
-                with open('.streamlit/config.toml', 'r') as f:
-                    content = f.read()
-                    # Procurar linha de backup mais recente
-                    lines = content.split('\n')
-                    for line in reversed(lines):
-                        if line.startswith('# backup_data = '):
-                            encoded_data = line.split('"')[1]
-                            json_data = base64.b64decode(encoded_data).decode()
-                            return pd.read_json(json_data)
-        except:
-            pass
-        return None
+    def _snapshot_generation(self, generation):
+        """Caminho do snapshot atual (0) ou do n-ésimo anterior"""
+        return self.snapshot_path if generation == 0 else f"{self.snapshot_path}.{generation}"
     
-    def _save_to_embedded_json(self, df):
-        """Salva criando arquivo Python com dados embeddidos"""
-        data_dict = df.to_dict('records')
+    def _save_to_binary_snapshot(self, df):
+        """Grava o snapshot atual (rotacionando os anteriores); não regrava conteúdo idêntico"""
+        data = encode_customers_snapshot(df)
+        if os.path.exists(self.snapshot_path):
+            current = read_snapshot_header(self.snapshot_path)
+            if current is not None and current[2] == SNAPSHOT_HEADER.unpack_from(data)[4]:
+                if self.manifest.get('binary_snapshot') is None:
+                    self.manifest.record('binary_snapshot', df, self.snapshot_path, SNAPSHOT_VERSION)
+                return
         
-        python_code = f'''#!/usr/bin/env python3
-"""
-Dados persistentes do dashboard - Gerado automaticamente
-Timestamp: {datetime.now().isoformat()}
-"""
-
-CUSTOMER_DATA = {data_dict}
-
-def get_embedded_data():
-    """Retorna dados embeddidos"""
-    import pandas as pd
-    return pd.DataFrame(CUSTOMER_DATA)
-'''
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        temp_file = f"{self.snapshot_path}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        for generation in range(self.keep_previous, 0, -1):
+            previous = self._snapshot_generation(generation - 1)
+            if os.path.exists(previous):
+                os.replace(previous, self._snapshot_generation(generation))
+        os.replace(temp_file, self.snapshot_path)
+        fsync_directory(self.snapshot_dir)
+        self.manifest.record('binary_snapshot', df, self.snapshot_path, SNAPSHOT_VERSION)
+    
+    def _load_from_binary_snapshot(self):
+        """Carrega o snapshot mais novo íntegro; sem snapshot, importa uma única vez os backups antigos"""
+        generations = [self._snapshot_generation(g) for g in range(self.keep_previous + 1)]
+        existing = [path for path in generations if os.path.exists(path)]
+        if not existing:
+            return self._load_legacy_backup()
         
-        with open('embedded_data.py', 'w') as f:
-            f.write(python_code)
+        for path in existing:
+            try:
+                with open(path, 'rb') as f:
+                    return decode_customers_snapshot(f.read())
+            except Exception as e:
+                print(f"⚠️ Snapshot {path} inválido ({e}) - tentando o anterior")
+        return None
+    
+    def _count_binary_snapshot(self):
+        """Registros pelo manifesto; o snapshot só é lido se o arquivo mudou fora do manifesto"""
+        rows = self.manifest.rows('binary_snapshot', self._load_from_binary_snapshot, self.snapshot_path, SNAPSHOT_VERSION)
+        return rows or 0
     
-    def _load_from_embedded_json(self):
-        """Carrega de arquivo Python com dados embeddidos"""
+    def _load_legacy_backup(self):
+        """Último backup das estratégias antigas (linha base64 no config.toml ou embedded_data.py)"""
         try:
+            if os.path.exists('.streamlit/config.toml'):
+                with open('.streamlit/config.toml', 'r') as f:
+                    backup_lines = [line for line in f if line.startswith('# backup_data = ')]
+                if backup_lines:
+                    encoded_data = backup_lines[-1].split('"')[1]
+                    df = pd.read_json(io.StringIO(base64.b64decode(encoded_data).decode()))
+                    if not df.empty:
+                        return df
+            
             if os.path.exists('embedded_data.py'):
-                import embedded_data
-                return embedded_data.get_embedded_data()
-        except:
-            pass
+                # Lido como texto: o import devolveria a versão em cache do módulo
+                with open('embedded_data.py', 'r') as f:
+                    tree = ast.parse(f.read())
+                for node in tree.body:
+                    if isinstance(node, ast.Assign) and getattr(node.targets[0], 'id', None) == 'CUSTOMER_DATA':
+                        return pd.DataFrame(ast.literal_eval(node.value))
+        except Exception as e:
+            print(f"⚠️ Erro ao ler backups antigos: {e}")
         return None
     
     def get_storage_status(self):
-        """Retorna status dos métodos de armazenamento"""
+        """Retorna status dos métodos de armazenamento (contagens do manifesto, sem carregar os dados)"""
         status = []
         for method in self.storage_methods:
             try:
-                df = method['load_func']()
-                record_count = len(df) if df is not None and not df.empty else 0
+                record_count = method['count_func']()
                 status.append({
                     'method': method['description'],
                     'permanent': method['permanent'],
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Script para reconstruir os agregados mensais persistidos (monthly_metrics.json)
+Usa o journal local se houver operações pendentes; senão o banco de dados e, por fim, o CSV local
+"""
+
+import os
+import pandas as pd
+from database_manager import create_database_manager
+from customer_journal import CustomerJournal
+from metrics_store import MonthlyMetricsStore
+
+def rebuild_monthly_metrics():
+    """Reconstrói os agregados mensais a partir da fonte de dados principal"""
+    print("🔄 Reconstruindo agregados mensais...")
+    
+    customers_df = pd.DataFrame()
+    journal = CustomerJournal('customers_simple.csv')
+    if journal.pending_count() > 0:
+        customers_df = journal.load()
+    else:
+        db_manager = create_database_manager()
+        if db_manager.is_connected():
+            customers_df = db_manager.load_customers()
+    
+    if customers_df.empty and os.path.exists('customers_simple.csv'):
+        customers_df = journal.load()
+    
+    store = MonthlyMetricsStore()
+    store.rebuild(customers_df)
+    return store
+
+if __name__ == "__main__":
+    rebuild_monthly_metrics()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Replicação write-behind para os destinos secundários
+A escrita é confirmada no armazenamento primário (journal ou banco local); os demais destinos
+(PostgreSQL, snapshot binário, snapshots comprimidos) recebem o estado atual de uma thread de fundo.
+Escritas próximas são agrupadas em uma única passada, falhas são repetidas com espera crescente
+e o atraso é limitado sem travar a interface: acima do limite, a escrita seguinte espera no máximo
+max_submit_wait segundos (as escritas continuam agrupadas na próxima passada) e o atraso aparece no status.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+# Espera antes de cada nova tentativa de um destino que falhou (segundos)
+DEFAULT_RETRY_DELAYS = (1, 2, 5, 10, 30)
+
+
+class ReplicationQueue:
+    def __init__(self, load_state, targets, batch_window=0.5, max_pending=500, max_lag_seconds=60,
+                 retry_delays=DEFAULT_RETRY_DELAYS, max_submit_wait=2):
+        # load_state: função que devolve o estado atual do primário; targets: {nome: função(df) -> bool}
+        self.load_state = load_state
+        self.targets = dict(targets)
+        self.batch_window = batch_window
+        self.max_pending = max_pending
+        self.max_lag_seconds = max_lag_seconds
+        self.retry_delays = tuple(retry_delays)
+        self.max_submit_wait = max_submit_wait
+        self._condition = threading.Condition()
+        self._worker = None
+        self._pending_ops = 0
+        self._oldest_pending = None
+        self._in_flight_ops = 0
+        self._in_flight_since = None
+        self._replicated_ops = 0
+        self._target_status = {
+            name: {'ok': None, 'last_success': None, 'last_error': None, 'failures': 0}
+            for name in self.targets
+        }
+
+    def submit(self, ops=1):
+        """Registra escritas confirmadas no primário e agenda a replicação
+
+        Retorna False se a fila continuar acima do limite de atraso depois da espera curta.
+        """
+        if not self.targets:
+            return True
+        with self._condition:
+            self._pending_ops += ops
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            self._condition.notify_all()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_worker, name="replication-queue", daemon=True)
+                self._worker.start()
+            over_limit = self._over_limit()
+            failing = any(status['ok'] is False for status in self._target_status.values())
+
+        if not over_limit:
+            return True
+        if not failing:
+            # Destinos saudáveis: espera curta para a fila drenar; a escrita já está no primário
+            # e, se a fila não esvaziar, entra agrupada na próxima passada
+            self.flush(timeout=self.max_submit_wait)
+        with self._condition:
+            lagging = self._over_limit()
+            pending_ops = self._pending_ops + self._in_flight_ops
+            lag_seconds = self._lag_seconds()
+        if lagging:
+            print(f"⏳ Replicação atrasada ({pending_ops} operações, {lag_seconds:.0f}s) - destinos secundários atrás do primário")
+        return not lagging
+
+    def _lag_seconds(self):
+        """Idade da escrita mais antiga ainda não replicada"""
+        started = [since for since in (self._oldest_pending, self._in_flight_since) if since is not None]
+        return time.monotonic() - min(started) if started else 0.0
+
+    def _over_limit(self):
+        if self._pending_ops + self._in_flight_ops >= self.max_pending:
+            return True
+        return self._lag_seconds() >= self.max_lag_seconds
+
+    def is_pending(self):
+        """Há escritas ainda não replicadas em todos os destinos"""
+        with self._condition:
+            return self._pending_ops > 0 or self._in_flight_ops > 0
+
+    def _run_worker(self):
+        while True:
+            with self._condition:
+                if self._pending_ops == 0:
+                    self._condition.wait(timeout=5)
+                    if self._pending_ops == 0:
+                        # Sem trabalho: a thread termina e é recriada no próximo submit
+                        self._worker = None
+                        return
+
+            # Janela curta para agrupar escritas seguidas na mesma passada
+            time.sleep(self.batch_window)
+            with self._condition:
+                batch_ops, self._pending_ops = self._pending_ops, 0
+                self._in_flight_since, self._oldest_pending = self._oldest_pending, None
+                self._in_flight_ops = batch_ops
+
+            replicated = self._replicate_batch()
+
+            with self._condition:
+                batch_started, self._in_flight_since = self._in_flight_since, None
+                self._in_flight_ops = 0
+                if replicated:
+                    self._replicated_ops += batch_ops
+                else:
+                    # Tentativas esgotadas: as operações voltam para a fila e entram na próxima passada
+                    self._pending_ops += batch_ops
+                    if self._oldest_pending is None or batch_started < self._oldest_pending:
+                        self._oldest_pending = batch_started
+                self._condition.notify_all()
+
+    def _replicate_batch(self):
+        """Envia o estado atual a cada destino; repete só os que falharam, sempre com o estado mais novo"""
+        remaining = list(self.targets)
+        for attempt in range(len(self.retry_delays) + 1):
+            if attempt:
+                time.sleep(self.retry_delays[attempt - 1])
+            try:
+                df = self.load_state()
+            except Exception as e:
+                print(f"⚠️ Replicação: erro ao ler o estado do primário: {e}")
+                continue
+            remaining = [name for name in remaining if not self._replicate_to(name, df)]
+            if not remaining:
+                return True
+        print(f"❌ Replicação: tentativas esgotadas para {', '.join(remaining)} - nova passada em seguida")
+        return False
+
+    def _replicate_to(self, name, df):
+        status = self._target_status[name]
+        try:
+            success = bool(self.targets[name](df))
+            error = None if success else "destino recusou a gravação"
+        except Exception as e:
+            success, error = False, str(e)
+
+        with self._condition:
+            status['ok'] = success
+            if success:
+                status['last_success'] = datetime.now().isoformat(timespec='seconds')
+                status['last_error'] = None
+            else:
+                status['failures'] += 1
+                status['last_error'] = error
+        if not success:
+            print(f"⚠️ Replicação para {name} falhou: {error}")
+        return success
+
+    def flush(self, timeout=30):
+        """Espera a fila esvaziar (antes de restaurar, encerrar ou ler um destino secundário)"""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._pending_ops == 0 and self._in_flight_ops == 0, timeout=timeout
+            )
+
+    def status(self):
+        """Situação da replicação para exibição: operações pendentes, atraso e estado de cada destino"""
+        with self._condition:
+            return {
+                'pending_ops': self._pending_ops,
+                'in_flight_ops': self._in_flight_ops,
+                'replicated_ops': self._replicated_ops,
+                'lag_seconds': round(self._lag_seconds(), 1),
+                'max_lag_seconds': self.max_lag_seconds,
+                'over_limit': self._over_limit(),
+                'worker_alive': self._worker is not None and self._worker.is_alive(),
+                'targets': {name: dict(status) for name, status in self._target_status.items()}
+            }
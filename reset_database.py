@@ -5,7 +5,7 @@ Script para resetar completamente o banco de dados
 
 import os
 import pandas as pd
-from database_manager import DatabaseManager
+from database_manager import create_database_manager
 from persistent_storage import PersistentStorageManager
 
 def reset_all_data():
@@ -16,7 +16,7 @@ def reset_all_data():
     empty_df = pd.DataFrame(columns=['name', 'signup_date', 'plan_value', 'status', 'cancel_date'])
     
     # Reset banco de dados
-    db_manager = DatabaseManager()
+    db_manager = create_database_manager()
     if db_manager.is_connected():
         print("🗑️ Limpando banco de dados...")
         db_manager.reset_database()
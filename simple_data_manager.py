@@ -2,6 +2,7 @@ import pandas as pd
 import os
 from datetime import datetime
 import streamlit as st
+from metrics_engine import stream_monthly_metrics
 
 class SimpleDataManager:
     def __init__(self):
@@ -28,6 +29,17 @@ class SimpleDataManager:
         except Exception as e:
             return pd.DataFrame(columns=['name', 'signup_date', 'plan_value', 'status', 'cancel_date'])
     
+    def iter_customer_chunks(self, chunksize=100_000):
+        """Lê o CSV de clientes em blocos de até chunksize linhas"""
+        return pd.read_csv(self.customers_file, chunksize=chunksize)
+    
+    def calculate_monthly_metrics_streaming(self, chunksize=100_000):
+        """Métricas mensais (mesmo resultado do SimpleMetricsCalculator) lendo o CSV em blocos"""
+        try:
+            return stream_monthly_metrics(self.iter_customer_chunks(chunksize), mode='simple', min_churn_tenure=None)
+        except Exception as e:
+            return pd.DataFrame()
+    
     def add_customer(self, name, signup_date, plan_value, status, cancel_date=None):
         """Adiciona um novo cliente"""
         try:
@@ -58,12 +58,11 @@ class SimpleMetricsCalculator:
         min_date = min(dates)
         max_date = max(dates)
         
-        # Começar do primeiro dia do mês mais antigo
-        start_date = min_date.replace(day=1)
+        # Começar do primeiro dia do mês mais antigo, à meia-noite (o horário não pode cortar o último mês)
+        start_date = pd.Timestamp(min_date).to_period('M').to_timestamp()
         
         # Ir até o mês atual
-        now = datetime.now()
-        end_date = now.replace(day=1)
+        end_date = pd.Timestamp.now().to_period('M').to_timestamp()
         
         return start_date, end_date
     
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Snapshots de clientes endereçados por conteúdo
+Cada snapshot é o CSV comprimido (zstd quando disponível, senão gzip) guardado pelo SHA-256 do conteúdo;
+conteúdo repetido não é regravado, a retenção segue uma escada (recentes/horários/diários/mensais)
+e as gravações rodam no destino 'Snapshots' da fila de replicação, fora do caminho de escrita dos clientes.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+from datetime import datetime
+import pandas as pd
+from atomic_io import atomic_write_bytes, read_verified
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+DEFAULT_SNAPSHOT_DIR = "snapshots"
+# Quantos snapshots manter: os mais recentes + o último de cada hora/dia/mês
+DEFAULT_RETENTION = {'recent': 10, 'hourly': 24, 'daily': 30, 'monthly': 12}
+RETENTION_BUCKETS = [('hourly', '%Y%m%d%H'), ('daily', '%Y%m%d'), ('monthly', '%Y%m')]
+
+
+def _compress(data):
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor(level=10).compress(data), '.csv.zst'
+    return gzip.compress(data, compresslevel=6), '.csv.gz'
+
+
+def _decompress(data, path):
+    if path.endswith('.zst'):
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard não está instalado - snapshot .zst ilegível")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def retained_indexes(timestamps, retention):
+    """Posições (em timestamps ordenados) que a escada de retenção mantém"""
+    keep = set(range(max(0, len(timestamps) - retention.get('recent', 0)), len(timestamps)))
+    for period, bucket_format in RETENTION_BUCKETS:
+        count = retention.get(period, 0)
+        if not count:
+            continue
+        # Último snapshot de cada período; ficam os count períodos mais novos
+        newest_in_bucket = {}
+        for position, timestamp in enumerate(timestamps):
+            newest_in_bucket[timestamp.strftime(bucket_format)] = position
+        for bucket in sorted(newest_in_bucket)[-count:]:
+            keep.add(newest_in_bucket[bucket])
+    return keep
+
+
+class SnapshotStore:
+    def __init__(self, directory=DEFAULT_SNAPSHOT_DIR, retention=None):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.index_file = os.path.join(directory, "index.json")
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.entries = self._load_index()
+
+    def _load_index(self):
+        """Lista de snapshots {timestamp, hash, object, rows, bytes} em ordem cronológica"""
+        try:
+            if os.path.exists(self.index_file):
+                return json.loads(read_verified(self.index_file, allow_missing_footer=True))['snapshots']
+        except Exception as e:
+            print(f"⚠️ Índice de snapshots ilegível ({e}) - reconstruindo a partir dos objetos")
+        return self._entries_from_objects()
+
+    def _entries_from_objects(self):
+        """Índice refeito a partir dos arquivos de objetos (horário = data de modificação)"""
+        entries = []
+        for name in os.listdir(self.objects_dir):
+            if name.endswith('.tmp'):
+                continue
+            object_path = os.path.join(self.objects_dir, name)
+            with open(object_path, 'rb') as f:
+                rows = len(pd.read_csv(io.BytesIO(_decompress(f.read(), object_path))))
+            entries.append({
+                'timestamp': datetime.fromtimestamp(os.path.getmtime(object_path)).isoformat(),
+                'hash': name.split('.')[0],
+                'object': name,
+                'rows': rows,
+                'bytes': os.path.getsize(object_path)
+            })
+        return sorted(entries, key=lambda entry: entry['timestamp'])
+
+    def _save_index(self):
+        data = json.dumps({'version': 1, 'snapshots': self.entries}).encode('utf-8')
+        atomic_write_bytes(self.index_file, data, checksum_footer=True)
+
+    def save(self, df, timestamp=None):
+        """Registra um snapshot de df; não grava nada se o conteúdo for igual ao último"""
+        data = df.to_csv(index=False).encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        timestamp = timestamp or datetime.now()
+
+        with self._lock:
+            if self.entries and self.entries[-1]['hash'] == content_hash:
+                return {'saved': False, 'hash': content_hash}
+
+            existing = next((entry['object'] for entry in self.entries if entry['hash'] == content_hash), None)
+            if existing is None:
+                compressed, extension = _compress(data)
+                existing = f"{content_hash}{extension}"
+                # O nome do objeto já é o SHA-256 do conteúdo, verificado na restauração
+                atomic_write_bytes(os.path.join(self.objects_dir, existing), compressed)
+
+            self.entries.append({
+                'timestamp': timestamp.isoformat(),
+                'hash': content_hash,
+                'object': existing,
+                'rows': len(df),
+                'bytes': os.path.getsize(os.path.join(self.objects_dir, existing))
+            })
+            self._apply_retention()
+            self._save_index()
+
+        print(f"💾 Snapshot {content_hash[:12]} gravado ({len(df)} clientes, {len(self.entries)} snapshots retidos)")
+        return {'saved': True, 'hash': content_hash}
+
+    def _apply_retention(self):
+        """Descarta snapshots fora da escada de retenção; objetos só são coletados quando algum sai"""
+        timestamps = [datetime.fromisoformat(entry['timestamp']) for entry in self.entries]
+        keep = retained_indexes(timestamps, self.retention)
+        if len(keep) == len(self.entries):
+            return
+        self.entries = [entry for position, entry in enumerate(self.entries) if position in keep]
+
+        # Também remove objetos órfãos de gravações interrompidas antes de atualizar o índice
+        referenced = {entry['object'] for entry in self.entries}
+        for name in os.listdir(self.objects_dir):
+            if name not in referenced and not name.endswith('.tmp'):
+                os.remove(os.path.join(self.objects_dir, name))
+
+    def latest(self):
+        """Entrada do snapshot mais recente (linhas, hash) sem ler o objeto; None se não houver"""
+        with self._lock:
+            return self.entries[-1] if self.entries else None
+
+    def list_snapshots(self):
+        """Snapshots retidos, do mais novo para o mais antigo"""
+        with self._lock:
+            return list(reversed(self.entries))
+
+    def restore(self, timestamp=None):
+        """DataFrame do snapshot mais recente até timestamp (padrão: o último); None se não houver"""
+        with self._lock:
+            entries = self.entries
+            if timestamp is not None:
+                limit = pd.Timestamp(timestamp).to_pydatetime()
+                entries = [entry for entry in entries if datetime.fromisoformat(entry['timestamp']) <= limit]
+            if not entries:
+                return None
+            entry = entries[-1]
+            object_path = os.path.join(self.objects_dir, entry['object'])
+            with open(object_path, 'rb') as f:
+                data = _decompress(f.read(), object_path)
+
+        if hashlib.sha256(data).hexdigest() != entry['hash']:
+            raise ValueError(f"Snapshot {entry['timestamp']} corrompido (hash não confere)")
+        return pd.read_csv(io.BytesIO(data))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Métricas mensais calculadas no PostgreSQL
+A grade de meses (generate_series) é cruzada com os clientes por intervalo de datas e agregada com FILTER;
+só uma linha por mês trafega pela rede, com as mesmas colunas de calculate_monthly_metrics.
+"""
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from metrics_engine import MONTHLY_COLUMNS
+
+# Mesmas regras do motor vetorizado: ativo no fim do mês m quando signup <= m < max(cancel, signup);
+# churn no mês do cancelamento apenas para clientes com min_tenure+ meses de casa
+MONTHLY_METRICS_SQL = """
+    WITH customer_months AS (
+        SELECT
+            CAST(date_trunc('month', signup_date) AS date) AS signup_month,
+            CAST(date_trunc('month', cancel_date) AS date) AS cancel_month,
+            (EXTRACT(YEAR FROM cancel_date) - EXTRACT(YEAR FROM signup_date)) * 12
+                + EXTRACT(MONTH FROM cancel_date) - EXTRACT(MONTH FROM signup_date) AS tenure_months,
+            COALESCE(plan_value, 0) AS plan_value
+        FROM customers
+        WHERE signup_date IS NOT NULL
+    ),
+    bounds AS (
+        SELECT
+            MIN(signup_month) AS first_month,
+            GREATEST(
+                MAX(signup_month),
+                COALESCE(MAX(cancel_month), MAX(signup_month)),
+                CAST(date_trunc('month', CAST(:as_of AS date)) AS date)
+            ) AS last_month
+        FROM customer_months
+    ),
+    month_grid AS (
+        SELECT CAST(generate_series(
+            CAST(first_month AS timestamp), CAST(last_month AS timestamp), interval '1 month'
+        ) AS date) AS month
+        FROM bounds
+        WHERE first_month IS NOT NULL
+    ),
+    monthly AS (
+        SELECT
+            g.month,
+            COUNT(c.signup_month) FILTER (WHERE c.signup_month = g.month) AS novos_clientes,
+            COUNT(c.signup_month) FILTER (WHERE c.cancel_month IS NULL OR c.cancel_month > g.month) AS ativos,
+            COALESCE(SUM(c.plan_value) FILTER (WHERE c.cancel_month IS NULL OR c.cancel_month > g.month), 0) AS mrr,
+            COUNT(c.signup_month) FILTER (
+                WHERE c.cancel_month = g.month AND c.tenure_months >= :min_tenure
+            ) AS churn_clientes,
+            COALESCE(SUM(c.plan_value) FILTER (
+                WHERE c.cancel_month = g.month AND c.tenure_months >= :min_tenure
+            ), 0) AS churn_mrr
+        FROM month_grid g
+        LEFT JOIN customer_months c
+            ON c.signup_month <= g.month
+           AND (c.cancel_month IS NULL OR c.cancel_month >= g.month OR c.signup_month = g.month)
+        GROUP BY g.month
+    )
+    SELECT
+        to_char(month, 'YYYY-MM') AS mes_ano,
+        novos_clientes,
+        CAST(mrr AS double precision) AS mrr,
+        CASE WHEN ativos > 0 THEN CAST(mrr AS double precision) / ativos ELSE 0 END AS ticket_medio,
+        churn_clientes,
+        CAST(churn_mrr AS double precision) AS churn_mrr
+    FROM monthly
+    ORDER BY month
+"""
+
+
+class SqlMetricsProvider:
+    def __init__(self, connectable, min_churn_tenure=2):
+        # connectable: engine ou conexão SQLAlchemy (a conexão permite usar uma tabela temporária customers)
+        self.connectable = connectable
+        self.min_churn_tenure = min_churn_tenure
+
+    def calculate_monthly_metrics(self, as_of=None):
+        """Tabela mensal até o mês de as_of (padrão: hoje), no mesmo formato do MetricsCalculator"""
+        as_of = pd.Timestamp(as_of if as_of is not None else datetime.now()).date()
+        df = pd.read_sql(
+            text(MONTHLY_METRICS_SQL),
+            self.connectable,
+            params={'as_of': as_of, 'min_tenure': self.min_churn_tenure}
+        )
+        if df.empty:
+            return pd.DataFrame()
+
+        return df.astype({
+            'novos_clientes': np.int64,
+            'mrr': np.float64,
+            'ticket_medio': np.float64,
+            'churn_clientes': np.int64,
+            'churn_mrr': np.float64
+        })[MONTHLY_COLUMNS]
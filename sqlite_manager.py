@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Banco SQLite embarcado para o modo local (sem DATABASE_URL)
+Mesma interface do DatabaseManager, com WAL, índices e escritas pontuais transacionais
+"""
+
+import os
+import sqlite3
+import threading
+import traceback
+import pandas as pd
+from database_manager import CUSTOMER_FIELDS, normalize_customer_rows, plan_customer_sync
+
+DEFAULT_SQLITE_FILE = "customers.db"
+
+
+def _sqlite_rows(normalized):
+    """Linhas normalizadas como tuplas prontas para o sqlite3 (datas em texto ISO)"""
+    return [
+        (
+            row.name,
+            row.signup_date.isoformat() if row.signup_date is not None else None,
+            float(row.plan_value),
+            row.status,
+            row.cancel_date.isoformat() if row.cancel_date is not None else None
+        )
+        for row in normalized.itertuples(index=False)
+    ]
+
+
+class SQLiteManager:
+    # Escritas de um cliente por vez vão direto ao banco (sem regravar arquivos inteiros)
+    supports_point_writes = True
+
+    def __init__(self, db_file=DEFAULT_SQLITE_FILE):
+        self.db_file = db_file
+        self.conn = None
+        self.last_sync_stats = None
+        self._lock = threading.RLock()
+        self._setup_connection()
+        self._setup_tables()
+
+    def _setup_connection(self):
+        """Abre o arquivo do banco em modo WAL"""
+        try:
+            self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            print(f"✅ Banco SQLite local aberto: {self.db_file}")
+        except Exception as e:
+            print(f"❌ Erro ao abrir banco SQLite: {e}")
+            self.conn = None
+
+    def _setup_tables(self):
+        """Cria tabela e índices se não existirem"""
+        if not self.conn:
+            return
+
+        try:
+            with self._lock, self.conn:
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS customers (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        name TEXT NOT NULL,
+                        signup_date TEXT NOT NULL,
+                        plan_value REAL NOT NULL,
+                        status TEXT NOT NULL,
+                        cancel_date TEXT
+                    )
+                """)
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_signup_date ON customers (signup_date)")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_cancel_date ON customers (cancel_date)")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_status ON customers (status)")
+        except Exception as e:
+            print(f"❌ Erro ao criar tabelas SQLite: {e}")
+
+    def is_connected(self):
+        """Verifica se o banco local está aberto"""
+        return self.conn is not None
+
+    def count_customers(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+
+    def customer_exists(self, customer, exclude_id=None):
+        """Já existe cliente (além de exclude_id) com a mesma chave natural (consulta pelo índice de signup_date)"""
+        row = _sqlite_rows(normalize_customer_rows(pd.DataFrame([customer])))[0]
+        with self._lock:
+            found = self.conn.execute(
+                "SELECT 1 FROM customers WHERE signup_date = ? AND name = ? AND plan_value = ? AND id IS NOT ? LIMIT 1",
+                (row[1], row[0], row[2], exclude_id)
+            ).fetchone()
+        return found is not None
+
+    def find_customer(self, customer):
+        """(id, linha gravada) do cliente com a mesma chave natural de customer; None se não existir
+
+        Consulta pelo índice de signup_date: localiza o alvo de uma alteração sem varrer nem contar posições.
+        """
+        row = _sqlite_rows(normalize_customer_rows(pd.DataFrame([customer])))[0]
+        with self._lock:
+            found = self.conn.execute(
+                "SELECT id, name, signup_date, plan_value, status, cancel_date FROM customers "
+                "WHERE signup_date = ? AND name = ? AND plan_value = ? ORDER BY id LIMIT 1",
+                (row[1], row[0], row[2])
+            ).fetchone()
+        if found is None:
+            return None
+        return found[0], dict(zip(CUSTOMER_FIELDS, found[1:]))
+
+    def insert_customer(self, customer):
+        """Insere um cliente; retorna o id gerado"""
+        row = _sqlite_rows(normalize_customer_rows(pd.DataFrame([customer])))[0]
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO customers (name, signup_date, plan_value, status, cancel_date) VALUES (?, ?, ?, ?, ?)",
+                row
+            )
+        return cursor.lastrowid
+
+    def update_customer(self, customer_id, customer):
+        """Atualiza o cliente pelo id (chave primária)"""
+        row = _sqlite_rows(normalize_customer_rows(pd.DataFrame([customer])))[0]
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE customers SET name = ?, signup_date = ?, plan_value = ?, status = ?, cancel_date = ? WHERE id = ?",
+                row + (int(customer_id),)
+            )
+        return cursor.rowcount == 1
+
+    def delete_customer(self, customer_id):
+        """Remove o cliente pelo id (chave primária)"""
+        with self._lock, self.conn:
+            cursor = self.conn.execute("DELETE FROM customers WHERE id = ?", (int(customer_id),))
+        return cursor.rowcount == 1
+
+    def save_customers(self, df, mode='sync'):
+        """Salva o DataFrame completo: mode='sync' aplica só o diff; 'bulk'/'replace' regrava a tabela"""
+        if not self.is_connected():
+            return False
+        if mode == 'sync':
+            return self.sync_customers(df) is not None
+        return self.bulk_load_customers(df)
+
+    def sync_customers(self, df):
+        """Sincroniza a tabela com df aplicando só o diff; retorna as contagens de linhas tocadas"""
+        if not self.is_connected():
+            return None
+
+        try:
+            target_rows = normalize_customer_rows(df) if not df.empty else pd.DataFrame(columns=CUSTOMER_FIELDS)
+            with self._lock, self.conn:
+                db_df = pd.read_sql_query(
+                    "SELECT id, name, signup_date, plan_value, status, cancel_date FROM customers ORDER BY id",
+                    self.conn
+                )
+                db_rows = normalize_customer_rows(db_df) if not db_df.empty else pd.DataFrame(columns=CUSTOMER_FIELDS)
+                plan = plan_customer_sync(db_df['id'].to_numpy(), db_rows, target_rows)
+
+                if plan is None:
+                    # Reordenação que um diff não representa: regrava tudo na mesma transação
+                    self.conn.execute("DELETE FROM customers")
+                    plan = {
+                        'updates': [],
+                        'inserts': list(range(len(target_rows))),
+                        'deletes': db_df['id'].astype(int).tolist(),
+                        'unchanged': 0
+                    }
+                else:
+                    self.conn.executemany("DELETE FROM customers WHERE id = ?", [(row_id,) for row_id in plan['deletes']])
+
+                update_rows = _sqlite_rows(target_rows.iloc[[pos for _, pos in plan['updates']]])
+                self.conn.executemany(
+                    "UPDATE customers SET name = ?, signup_date = ?, plan_value = ?, status = ?, cancel_date = ? WHERE id = ?",
+                    [row + (row_id,) for row, (row_id, _) in zip(update_rows, plan['updates'])]
+                )
+                self.conn.executemany(
+                    "INSERT INTO customers (name, signup_date, plan_value, status, cancel_date) VALUES (?, ?, ?, ?, ?)",
+                    _sqlite_rows(target_rows.iloc[plan['inserts']])
+                )
+
+            stats = {
+                'inserted': len(plan['inserts']),
+                'updated': len(plan['updates']),
+                'deleted': len(plan['deletes']),
+                'unchanged': plan['unchanged']
+            }
+            stats['touched'] = stats['inserted'] + stats['updated'] + stats['deleted']
+            self.last_sync_stats = stats
+            print(f"✅ SQLite sincronizado: {stats['inserted']} inseridos, {stats['updated']} atualizados, "
+                  f"{stats['deleted']} removidos, {stats['unchanged']} inalterados")
+            return stats
+
+        except Exception as e:
+            print(f"❌ Erro ao sincronizar SQLite: {e}")
+            traceback.print_exc()
+            return None
+
+    def bulk_load_customers(self, df):
+        """Substitui todos os clientes em uma única transação"""
+        if not self.is_connected():
+            return False
+
+        try:
+            rows = _sqlite_rows(normalize_customer_rows(df)) if not df.empty else []
+            with self._lock, self.conn:
+                self.conn.execute("DELETE FROM customers")
+                self.conn.execute("DELETE FROM sqlite_sequence WHERE name = 'customers'")
+                self.conn.executemany(
+                    "INSERT INTO customers (name, signup_date, plan_value, status, cancel_date) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+            print(f"✅ {len(rows)} clientes carregados no SQLite")
+            return True
+        except Exception as e:
+            print(f"❌ Erro na carga do SQLite: {e}")
+            return False
+
+    def load_customers(self):
+        """Carrega dados de clientes do banco local"""
+        if not self.is_connected():
+            return pd.DataFrame()
+
+        try:
+            with self._lock:
+                df = pd.read_sql_query(
+                    "SELECT name, signup_date, plan_value, status, cancel_date FROM customers ORDER BY id",
+                    self.conn
+                )
+            if not df.empty:
+                df['signup_date'] = pd.to_datetime(df['signup_date'], errors='coerce')
+                df['cancel_date'] = pd.to_datetime(df['cancel_date'], errors='coerce')
+            print(f"✅ {len(df)} clientes carregados do SQLite")
+            return df
+        except Exception as e:
+            print(f"❌ Erro ao carregar do SQLite: {e}")
+            return pd.DataFrame()
+
+    def clean_duplicate_data(self):
+        """Remove dados duplicados mantendo o primeiro registro de cada cliente"""
+        if not self.is_connected():
+            return False
+
+        try:
+            with self._lock, self.conn:
+                self.conn.execute("""
+                    DELETE FROM customers
+                    WHERE id NOT IN (
+                        SELECT MIN(id)
+                        FROM customers
+                        GROUP BY name, signup_date, plan_value
+                    )
+                """)
+                count = self.conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+            print(f"✅ Limpeza de duplicatas concluída. Registros restantes: {count}")
+            return True
+        except Exception as e:
+            print(f"❌ Erro ao limpar duplicatas: {e}")
+            return False
+
+    def reset_database(self):
+        """Limpa completamente o banco local"""
+        if not self.is_connected():
+            return False
+
+        try:
+            with self._lock, self.conn:
+                self.conn.execute("DELETE FROM customers")
+            print("✅ Banco SQLite limpo completamente")
+            return True
+        except Exception as e:
+            print(f"❌ Erro ao limpar SQLite: {e}")
+            return False
+
+    def get_database_stats(self):
+        """Retorna estatísticas do banco em uma única consulta"""
+        if not self.is_connected():
+            return None
+
+        try:
+            with self._lock:
+                total, active, duplicates = self.conn.execute("""
+                    SELECT
+                        COUNT(*),
+                        COALESCE(SUM(status = 'Ativo'), 0),
+                        (SELECT COUNT(*) FROM (
+                            SELECT 1 FROM customers
+                            GROUP BY name, signup_date, plan_value
+                            HAVING COUNT(*) > 1
+                        ))
+                    FROM customers
+                """).fetchone()
+            return {
+                'total': total,
+                'active': active,
+                'duplicates': duplicates
+            }
+        except Exception as e:
+            print(f"❌ Erro ao obter estatísticas: {e}")
+            return None
+
+    def test_connection(self):
+        """Testa o banco local e retorna status detalhado"""
+        if not self.conn:
+            return {
+                'connected': False,
+                'error': f'Não foi possível abrir {self.db_file}'
+            }
+
+        try:
+            with self._lock:
+                record_count = self.conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+                journal_mode = self.conn.execute("PRAGMA journal_mode").fetchone()[0]
+            return {
+                'connected': True,
+                'version': f"SQLite {sqlite3.sqlite_version} ({journal_mode})",
+                'table_exists': True,
+                'record_count': record_count,
+                'url_host': os.path.abspath(self.db_file)
+            }
+        except Exception as e:
+            return {
+                'connected': False,
+                'error': str(e)
+            }
+
+    def get_connection_status(self):
+        """Retorna status de conexão formatado para exibição"""
+        status = self.test_connection()
+
+        if status['connected']:
+            return f"""
+            ✅ **Banco SQLite local**
+            - Arquivo: {status['url_host']}
+            - Versão: {status['version']}
+            - Registros salvos: {status['record_count']}
+            """
+        else:
+            return f"""
+            ❌ **Banco SQLite indisponível**
+            - Erro: {status['error']}
+            - Usando armazenamento local CSV
+            """
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Manifesto dos destinos de armazenamento
+Para cada destino guarda linhas, hash do conteúdo, horário da última gravação, versão do esquema
+e a assinatura do arquivo (tamanho + mtime); status e recuperação na inicialização leem só o manifesto
+e carregam o conteúdo completo apenas quando a assinatura do arquivo não confere.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from atomic_io import atomic_write_bytes, read_verified
+from customer_journal import comparable_customers
+
+DEFAULT_MANIFEST_FILE = "storage_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def row_hashes(df):
+    """Hash (uint64) de cada cliente na forma canônica"""
+    return pd.util.hash_pandas_object(comparable_customers(df), index=False).to_numpy()
+
+
+def content_hash(df):
+    """SHA-256 da forma canônica dos clientes (igual para CSV, Arrow, snapshot binário ou banco)"""
+    return hashlib.sha256(row_hashes(df).tobytes()).hexdigest()
+
+
+def content_digest(df):
+    """Soma (módulo 2^64) dos hashes das linhas: não depende da ordem e é atualizável linha a linha"""
+    return int(row_hashes(df).sum(dtype=np.uint64))
+
+
+def file_signature(path):
+    """(tamanho, mtime em ns) do arquivo; None se não existir"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class StorageManifest:
+    def __init__(self, path=DEFAULT_MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.targets = self._load()
+
+    def _load(self):
+        """Destinos registrados {nome: {rows, hash, updated_at, schema_version, file, signature}}"""
+        try:
+            if os.path.exists(self.path):
+                return json.loads(read_verified(self.path, allow_missing_footer=True))['targets']
+        except Exception as e:
+            print(f"⚠️ Manifesto de armazenamento ilegível ({e}) - será recriado")
+        return {}
+
+    def _save(self):
+        data = json.dumps({'version': MANIFEST_VERSION, 'targets': self.targets}, indent=2).encode('utf-8')
+        atomic_write_bytes(self.path, data, checksum_footer=True)
+
+    def record(self, target, df, file=None, schema_version=1):
+        """Registra o conteúdo gravado em target (chamado logo após cada gravação)"""
+        entry = {
+            'rows': len(df),
+            'hash': content_hash(df),
+            'updated_at': datetime.now().isoformat(),
+            'schema_version': schema_version,
+            'file': file,
+            'signature': file_signature(file) if file else None
+        }
+        with self._lock:
+            self.targets[target] = entry
+            self._save()
+        return entry
+
+    def get(self, target):
+        """Entrada do destino se ainda descreve o arquivo atual; None se ausente ou divergente"""
+        with self._lock:
+            entry = self.targets.get(target)
+        if entry is None:
+            return None
+        if entry['file'] and file_signature(entry['file']) != entry['signature']:
+            # Arquivo alterado fora do manifesto (versão antiga do app, edição manual, cópia)
+            return None
+        return entry
+
+    def rows(self, target, load_func, file=None, schema_version=1):
+        """Linhas do destino pelo manifesto; só carrega o conteúdo (e atualiza o manifesto) em divergência"""
+        entry = self.get(target)
+        if entry is not None:
+            return entry['rows']
+        df = load_func()
+        if df is None:
+            return None
+        return self.record(target, df, file, schema_version)['rows']
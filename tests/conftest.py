@@ -0,0 +1,19 @@
+"""
+Fixtures compartilhadas dos testes
+Os testes de PostgreSQL rodam apenas com TEST_DATABASE_URL (ou BENCHMARK_DATABASE_URL) apontando para um banco descartável
+"""
+
+import os
+import pytest
+
+
+@pytest.fixture(scope='session')
+def pg_engine():
+    """Engine SQLAlchemy do PostgreSQL de testes (o teste é pulado sem a variável de ambiente)"""
+    database_url = os.getenv('TEST_DATABASE_URL') or os.getenv('BENCHMARK_DATABASE_URL')
+    if not database_url:
+        pytest.skip("TEST_DATABASE_URL não definida - testes de PostgreSQL ignorados")
+    from sqlalchemy import create_engine
+    engine = create_engine(database_url)
+    yield engine
+    engine.dispose()
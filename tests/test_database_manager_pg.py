@@ -0,0 +1,177 @@
+"""
+DatabaseManager contra um PostgreSQL real: migrações, triggers dos agregados, carga via COPY e sincronização
+Cada teste usa um schema próprio (search_path na URL), removido ao final.
+"""
+
+import uuid
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+AS_OF = pd.Timestamp('2024-06-15')
+
+
+@pytest.fixture
+def pg_schema(pg_engine, monkeypatch):
+    """Engine apontando para um schema vazio do banco de testes (DATABASE_URL também aponta para ele)"""
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with pg_engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    url = make_url(pg_engine.url).update_query_dict({'options': f"-csearch_path={schema}"})
+    # Definida antes do import: o load_dotenv do módulo não sobrescreve variáveis existentes
+    monkeypatch.setenv('DATABASE_URL', url.render_as_string(hide_password=False))
+    engine = create_engine(url)
+    yield engine
+    engine.dispose()
+    with pg_engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+
+
+@pytest.fixture
+def pg_manager(pg_schema):
+    """DatabaseManager com todas as migrações aplicadas ao schema de teste"""
+    from database_manager import DatabaseManager
+    manager = DatabaseManager()
+    assert manager.is_connected()
+    yield manager
+    manager.engine.dispose()
+
+
+def make_customers(n, seed=0):
+    rng = np.random.default_rng(seed)
+    signup = pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 800, n), unit='D')
+    cancelled = rng.random(n) < 0.4
+    cancel = (signup + pd.to_timedelta(rng.integers(0, 300, n), unit='D')).where(cancelled, pd.NaT)
+    return pd.DataFrame({
+        'name': [f"Cliente {i}" for i in range(n)],
+        'signup_date': signup,
+        'plan_value': rng.choice([49.9, 99.0, 199.0], n),
+        'status': np.where(cancelled, 'Cancelado', 'Ativo'),
+        'cancel_date': cancel
+    })
+
+
+def assert_aggregates_match_table(manager, expected_df):
+    """Contadores e métricas mensais mantidos por triggers batem com um recálculo sobre customers"""
+    manager._status_cache.clear()
+    stats = manager.get_database_stats()
+    assert stats['total'] == len(expected_df)
+    assert stats['active'] == int((expected_df['status'] == 'Ativo').sum())
+
+    by_triggers = manager.load_monthly_metrics(AS_OF)
+    recalculated = manager.calculate_monthly_metrics(AS_OF)
+    pd.testing.assert_frame_equal(by_triggers, recalculated, check_dtype=False, rtol=1e-9)
+
+
+def assert_table_equals(manager, expected_df):
+    from database_manager import normalize_customer_rows
+    pd.testing.assert_frame_equal(
+        normalize_customer_rows(manager.load_customers()),
+        normalize_customer_rows(expected_df.reset_index(drop=True))
+    )
+
+
+def test_migrations_reach_latest_version(pg_manager):
+    from database_manager import SCHEMA_MIGRATIONS
+    assert pg_manager.schema_version == SCHEMA_MIGRATIONS[-1][0]
+    assert pg_manager.natural_key_conflicts == []
+
+
+def test_triggers_follow_sync_inserts_updates_and_deletes(pg_manager):
+    customers = make_customers(300)
+    assert pg_manager.sync_customers(customers)['inserted'] == 300
+    assert_aggregates_match_table(pg_manager, customers)
+
+    changed = customers.drop(index=[3, 50, 299]).reset_index(drop=True)
+    changed.loc[10, ['status', 'cancel_date']] = ['Cancelado', pd.Timestamp('2024-02-01')]
+    changed.loc[20, 'plan_value'] = 299.0
+    changed = pd.concat([changed, make_customers(5, seed=9).assign(name=lambda df: 'Novo ' + df['name'])],
+                        ignore_index=True)
+    stats = pg_manager.sync_customers(changed)
+    # Só as linhas alteradas são tocadas (sobras no mesmo ponto viram UPDATE em vez de DELETE + INSERT)
+    assert stats['unchanged'] == 295
+    assert stats['inserted'] + stats['updated'] == 7 and stats['updated'] + stats['deleted'] == 5
+    assert_table_equals(pg_manager, changed)
+    assert_aggregates_match_table(pg_manager, changed)
+
+
+def test_bulk_load_streams_chunks_through_copy(pg_manager):
+    pg_manager.sync_customers(make_customers(50, seed=1))
+    customers = make_customers(1200, seed=2)
+    assert pg_manager.bulk_load_customers(customers, chunk_rows=257)
+    assert_table_equals(pg_manager, customers)
+    # TRUNCATE zera os agregados e o INSERT ... SELECT da staging os recompõe
+    assert_aggregates_match_table(pg_manager, customers)
+
+
+def test_sync_falls_back_to_copy_in_the_same_transaction(pg_manager):
+    customers = make_customers(200, seed=3)
+    pg_manager.sync_customers(customers)
+
+    # Ordem invertida não é representável por um diff: a sincronização troca tudo via COPY
+    reordered = customers.iloc[::-1].reset_index(drop=True)
+    stats = pg_manager.sync_customers(reordered)
+    assert (stats['inserted'], stats['deleted']) == (200, 200)
+    assert_table_equals(pg_manager, reordered)
+    assert_aggregates_match_table(pg_manager, reordered)
+
+
+def test_sync_fallback_failure_keeps_previous_rows(pg_manager, monkeypatch):
+    customers = make_customers(100, seed=4)
+    pg_manager.sync_customers(customers)
+
+    def failing_copy(cursor, rows, chunk_rows=50_000):
+        cursor.execute("TRUNCATE customers RESTART IDENTITY")
+        raise RuntimeError("falha simulada no COPY")
+
+    monkeypatch.setattr(pg_manager, '_copy_replace_customers', failing_copy)
+    assert pg_manager.sync_customers(customers.iloc[::-1].reset_index(drop=True)) is None
+    assert_table_equals(pg_manager, customers)
+    assert_aggregates_match_table(pg_manager, customers)
+
+
+def test_natural_key_migration_waits_for_explicit_cleanup(pg_schema):
+    from database_manager import NATURAL_KEY_VERSION, SCHEMA_MIGRATIONS, DatabaseManager
+    # Banco em uma versão anterior à chave natural, com duplicatas de dados antigos
+    with pg_schema.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """))
+        for version, description, statements in SCHEMA_MIGRATIONS[:NATURAL_KEY_VERSION - 1]:
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(text("INSERT INTO schema_migrations (version, description) VALUES (:v, :d)"),
+                         {'v': version, 'd': description})
+        conn.execute(text("""
+            INSERT INTO customers (name, signup_date, plan_value, status, cancel_date) VALUES
+            ('Ana', '2023-01-10', 100, 'Ativo', NULL),
+            ('Ana', '2023-01-10', 100, 'Ativo', NULL),
+            ('Bruno', '2023-02-01', 50, 'Cancelado', '2023-06-01')
+        """))
+
+    manager = DatabaseManager()
+    try:
+        assert manager.schema_version == NATURAL_KEY_VERSION - 1
+        assert [conflict['ids'] for conflict in manager.natural_key_conflicts] == [[1, 2]]
+        assert len(manager.load_customers()) == 3
+
+        assert manager.clean_duplicate_data()
+        assert manager.schema_version == SCHEMA_MIGRATIONS[-1][0]
+        assert manager.natural_key_conflicts == []
+        assert_aggregates_match_table(manager, manager.load_customers())
+    finally:
+        manager.engine.dispose()
+
+
+def test_replace_mode_normalizes_status(pg_manager):
+    customers = make_customers(20, seed=5)
+    customers['status'] = customers['status'].str.lower()
+    assert pg_manager.save_customers(customers, mode='replace')
+    assert_table_equals(pg_manager, customers)
+    assert set(pg_manager.load_customers()['status']) <= {'Ativo', 'Cancelado'}
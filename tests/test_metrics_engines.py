@@ -0,0 +1,103 @@
+"""
+Paridade entre os motores da tabela mensal: vetorizado, loop (referência), streaming em blocos e paralelo
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from customer_metrics import MetricsCalculator
+from metrics_calculator import MetricsCalculator as SalesMetricsCalculator
+from simple_metrics_calculator import SimpleMetricsCalculator
+from metrics_engine import stream_monthly_metrics
+from parallel_metrics import calculate_partials_parallel
+
+
+def make_customers():
+    """Clientes com horário no cadastro e casos de borda de cancelamento"""
+    return pd.DataFrame([
+        # Primeiro cadastro no fim do dia 1: o início do período não pode herdar o horário
+        {'customer_id': 1, 'name': 'Ana', 'signup_date': '2023-01-01 23:59:59', 'plan_value': 100.0, 'status': 'Ativo', 'cancel_date': None},
+        {'customer_id': 2, 'name': 'Bruno', 'signup_date': '2023-02-01 00:30:00', 'plan_value': 50.0, 'status': 'Cancelado', 'cancel_date': '2023-02-20 00:00:00'},
+        {'customer_id': 3, 'name': 'Carla', 'signup_date': '2023-02-15 14:10:00', 'plan_value': 80.0, 'status': 'Cancelado', 'cancel_date': '2023-03-10 09:00:00'},
+        {'customer_id': 4, 'name': 'Davi', 'signup_date': '2023-03-31 18:45:00', 'plan_value': 120.0, 'status': 'Cancelado', 'cancel_date': '2023-09-01 00:00:00'},
+        {'customer_id': 5, 'name': 'Eva', 'signup_date': '2023-05-10 00:00:00', 'plan_value': 60.0, 'status': 'Cancelado', 'cancel_date': '2023-04-01 00:00:00'},
+        {'customer_id': 6, 'name': 'Fábio', 'signup_date': '2023-06-01 12:00:00', 'plan_value': 75.5, 'status': 'Ativo', 'cancel_date': None},
+        {'customer_id': 7, 'name': 'Gil', 'signup_date': '2023-08-31 23:00:00', 'plan_value': 40.0, 'status': 'Cancelado', 'cancel_date': '2024-01-01 08:00:00'},
+    ]).assign(
+        signup_date=lambda df: pd.to_datetime(df['signup_date']),
+        cancel_date=lambda df: pd.to_datetime(df['cancel_date'])
+    )
+
+
+def make_sales():
+    """Vendas com horário, tipos misturados e uma venda sem cliente"""
+    rng = np.random.default_rng(7)
+    n = 53
+    return pd.DataFrame({
+        'customer_id': rng.choice([1, 2, 3, 4, 6, 7], n).astype(object),
+        'date': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 500 * 24 * 3600, n), unit='s'),
+        'value': rng.integers(10, 500, n).astype(float),
+        'type': rng.choice(['Recorrente', 'Avulsa'], n),
+    }).assign(customer_id=lambda df: df['customer_id'].where(np.arange(n) != 5, None))
+
+
+def chunks(df, size):
+    return [df.iloc[start:start + size] for start in range(0, len(df), size)]
+
+
+def test_dashboard_engines_match_with_time_of_day_signups():
+    customers = make_customers()
+    vectorized = MetricsCalculator(customers).calculate_monthly_metrics()
+    loop = MetricsCalculator(customers, engine='loop').calculate_monthly_metrics()
+    pd.testing.assert_frame_equal(vectorized, loop, check_dtype=False)
+    assert vectorized['mes_ano'].iloc[-1] == pd.Timestamp.now().strftime('%Y-%m')
+
+
+def test_dashboard_streaming_with_odd_chunks_matches_vectorized():
+    customers = make_customers()
+    vectorized = MetricsCalculator(customers).calculate_monthly_metrics()
+    for size in (1, 3, 5):
+        streamed = stream_monthly_metrics(chunks(customers, size), mode='dashboard')
+        pd.testing.assert_frame_equal(vectorized, streamed, check_dtype=False)
+
+
+def test_simple_streaming_with_odd_chunks_matches_loop():
+    customers = make_customers()
+    loop = SimpleMetricsCalculator(customers).calculate_monthly_metrics()
+    streamed = stream_monthly_metrics(chunks(customers, 3), mode='simple', min_churn_tenure=None)
+    pd.testing.assert_frame_equal(loop, streamed, check_dtype=False)
+    assert loop['mes_ano'].iloc[-1] == pd.Timestamp.now().strftime('%Y-%m')
+
+
+def test_sales_engines_match_with_time_of_day_signups():
+    customers, sales = make_customers(), make_sales()
+    vectorized = SalesMetricsCalculator(customers, sales).calculate_monthly_metrics()
+    loop = SalesMetricsCalculator(customers, sales, engine='loop').calculate_monthly_metrics()
+    pd.testing.assert_frame_equal(vectorized, loop, check_dtype=False)
+    assert vectorized['mes_ano'].iloc[-1] == pd.Timestamp.now().strftime('%Y-%m')
+
+
+def test_sales_streaming_with_odd_chunks_matches_vectorized():
+    customers, sales = make_customers(), make_sales()
+    vectorized = SalesMetricsCalculator(customers, sales).calculate_monthly_metrics()
+    streamed = stream_monthly_metrics(chunks(customers, 3), chunks(sales, 7), mode='sales', min_churn_tenure=None)
+    pd.testing.assert_frame_equal(vectorized, streamed, check_dtype=False)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sales_parallel_matches_vectorized(workers):
+    customers, sales = make_customers(), make_sales()
+    vectorized = SalesMetricsCalculator(customers, sales).calculate_monthly_metrics()
+    parallel = SalesMetricsCalculator(customers, sales, engine='parallel', workers=workers,
+                                      chunk_size=11).calculate_monthly_metrics()
+    pd.testing.assert_frame_equal(vectorized, parallel, check_dtype=False)
+
+
+def test_sales_parallel_with_text_ids_and_dates():
+    customers, sales = make_customers(), make_sales()
+    vectorized = SalesMetricsCalculator(customers, sales).calculate_monthly_metrics()
+    text_sales = sales.assign(date=sales['date'].astype(str), customer_id=sales['customer_id'].map(
+        lambda value: None if value is None else f"c{value}"
+    ))
+    partials = calculate_partials_parallel(customers, text_sales, workers=2, chunk_size=13)
+    pd.testing.assert_frame_equal(vectorized, partials.to_frame(mode='sales'), check_dtype=False)
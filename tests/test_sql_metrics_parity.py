@@ -0,0 +1,78 @@
+"""
+Paridade da tabela mensal calculada no PostgreSQL (SqlMetricsProvider) com o MetricsCalculator do app
+Os clientes vão para uma tabela temporária customers da sessão; a tabela real não é alterada.
+"""
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from customer_metrics import MetricsCalculator
+from sql_metrics import SqlMetricsProvider
+
+CUSTOMERS = [
+    # Ativo sem data de cancelamento (NULL)
+    {'name': 'Ana', 'signup_date': '2023-01-10', 'plan_value': 100.0, 'status': 'Ativo', 'cancel_date': None},
+    # Cancelamento no próprio mês do cadastro
+    {'name': 'Bruno', 'signup_date': '2023-02-03', 'plan_value': 50.0, 'status': 'Cancelado', 'cancel_date': '2023-02-25'},
+    # Churn com menos de 2 meses de casa (não entra no churn)
+    {'name': 'Carla', 'signup_date': '2023-02-15', 'plan_value': 80.0, 'status': 'Cancelado', 'cancel_date': '2023-03-10'},
+    # Churn com exatamente 2 meses de casa
+    {'name': 'Davi', 'signup_date': '2023-03-31', 'plan_value': 120.0, 'status': 'Cancelado', 'cancel_date': '2023-05-01'},
+    # Cancelamento anterior ao cadastro
+    {'name': 'Eva', 'signup_date': '2023-05-10', 'plan_value': 60.0, 'status': 'Cancelado', 'cancel_date': '2023-04-01'},
+    {'name': 'Fábio', 'signup_date': '2023-06-01', 'plan_value': 75.5, 'status': 'Ativo', 'cancel_date': None},
+    {'name': 'Gil', 'signup_date': '2023-08-31', 'plan_value': 40.0, 'status': 'Cancelado', 'cancel_date': '2024-01-01'},
+]
+
+
+@pytest.fixture
+def pg_customers(pg_engine):
+    """Conexão com uma tabela temporária customers vazia (tem precedência sobre a tabela real na sessão)"""
+    with pg_engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TEMP TABLE customers (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                signup_date DATE NOT NULL,
+                plan_value DOUBLE PRECISION NOT NULL,
+                status VARCHAR(50) NOT NULL,
+                cancel_date DATE
+            )
+        """))
+        yield conn
+        conn.rollback()
+
+
+def insert_customers(conn, customers_df):
+    conn.execute(
+        text("""
+            INSERT INTO pg_temp.customers (name, signup_date, plan_value, status, cancel_date)
+            VALUES (:name, :signup_date, :plan_value, :status, :cancel_date)
+        """),
+        [
+            {**row, 'cancel_date': row['cancel_date'] if pd.notna(row['cancel_date']) else None}
+            for row in customers_df.to_dict('records')
+        ]
+    )
+
+
+def test_empty_table(pg_customers):
+    empty = pd.DataFrame(columns=['name', 'signup_date', 'plan_value', 'status', 'cancel_date'])
+    assert MetricsCalculator(empty).calculate_monthly_metrics().empty
+    assert SqlMetricsProvider(pg_customers).calculate_monthly_metrics().empty
+
+
+def test_edge_cases_match_pandas(pg_customers):
+    customers_df = pd.DataFrame(CUSTOMERS).assign(
+        signup_date=lambda df: pd.to_datetime(df['signup_date']).dt.date,
+        cancel_date=lambda df: pd.to_datetime(df['cancel_date']).dt.date
+    )
+    insert_customers(pg_customers, customers_df)
+
+    reference = MetricsCalculator(customers_df).calculate_monthly_metrics()
+    pushed_down = SqlMetricsProvider(pg_customers).calculate_monthly_metrics()
+
+    pd.testing.assert_frame_equal(reference, pushed_down, check_dtype=False, rtol=1e-9)
+    churn = reference.set_index('mes_ano')['churn_clientes']
+    assert churn['2023-02'] == 0 and churn['2023-03'] == 0
+    assert churn['2023-05'] == 1
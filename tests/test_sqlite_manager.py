@@ -0,0 +1,45 @@
+"""
+Escritas pontuais do SQLiteManager: alvo localizado pela chave natural e alterado pelo id
+"""
+
+import pandas as pd
+import pytest
+from sqlite_manager import SQLiteManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = SQLiteManager(str(tmp_path / "customers.db"))
+    for i in range(5):
+        manager.insert_customer({'name': f"c{i}", 'signup_date': f"2024-01-0{i + 1}", 'plan_value': 10.0 + i,
+                                 'status': 'Ativo', 'cancel_date': None})
+    yield manager
+    manager.conn.close()
+
+
+def test_find_customer_returns_id_and_stored_row(manager):
+    customer_id, row = manager.find_customer({'name': 'c3', 'signup_date': pd.Timestamp('2024-01-04'),
+                                              'plan_value': 13.0, 'status': 'Cancelado', 'cancel_date': None})
+    assert customer_id == 4
+    assert row == {'name': 'c3', 'signup_date': '2024-01-04', 'plan_value': 13.0, 'status': 'Ativo', 'cancel_date': None}
+    assert manager.find_customer({'name': 'c9', 'signup_date': '2024-01-04', 'plan_value': 13.0,
+                                  'status': 'Ativo', 'cancel_date': None}) is None
+
+
+def test_update_and_delete_by_id(manager):
+    assert manager.update_customer(2, {'name': 'c1', 'signup_date': '2024-01-02', 'plan_value': 11.0,
+                                       'status': 'Cancelado', 'cancel_date': '2024-05-01'})
+    assert manager.delete_customer(1)
+    assert not manager.delete_customer(1)
+
+    df = manager.load_customers()
+    assert list(df['name']) == ['c1', 'c2', 'c3', 'c4']
+    assert df.loc[0, 'status'] == 'Cancelado'
+    assert df.loc[0, 'cancel_date'] == pd.Timestamp('2024-05-01')
+
+
+def test_customer_exists_ignores_the_row_being_updated(manager):
+    customer = {'name': 'c2', 'signup_date': '2024-01-03', 'plan_value': 12.0, 'status': 'Ativo', 'cancel_date': None}
+    assert manager.customer_exists(customer)
+    assert not manager.customer_exists(customer, exclude_id=3)
+    assert manager.customer_exists(customer, exclude_id=1)